@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from solar_database_current import LOCATIONS_COLUMNS, hash_locations
+
+# Check that a LOCATIONS row hashes the same whatever chunk it is in.
+# pandas picks the dtype of a numeric column per chunk, e.g. int64 class codes in a chunk without
+# missing codes and float64 in one with any, and a refresh rewrites every row whose hash differs.
+# The same row is hashed inside an all-present chunk and a chunk with a missing code, both as read
+# from the CSV and as read back from SQLite by backfill_locations_hashes:
+#
+#   python benchmarks/check_locations_hash.py
+#
+# run_benchmarks.py runs the same check in its refresh scenario.
+
+ROW = {
+    "latitude": 41.4731234, "longitude": -87.0611234, "dlgf_prop_class_code": 640,
+    "geofulladdress": "100 MAIN ST", "geocity": "VALPARAISO", "geostate": "IN", "geozip": "46383",
+    "geocounty": "PORTER", "geobg10": "181270501001",
+}
+OTHER_ROW = dict(ROW, geofulladdress="102 MAIN ST", dlgf_prop_class_code=None)
+
+
+def csv_chunk(rows):
+    # the way process_locations_data hands chunks over: object columns with "" for missing values
+    df = pd.DataFrame(rows).reindex(columns=LOCATIONS_COLUMNS)
+    df["dlgf_prop_class_code"] = pd.to_numeric(df["dlgf_prop_class_code"])
+    return df.astype(object).fillna("")
+
+
+def sqlite_chunk(rows):
+    # the way backfill_locations_hashes reads rows back from an INTEGER class code column
+    conn = sqlite3.connect(":memory:")
+    try:
+        types = {"latitude": "REAL", "longitude": "REAL", "dlgf_prop_class_code": "INTEGER"}
+        conn.execute(
+            "CREATE TABLE LOCATIONS ("
+            + ", ".join(f'"{col}" {types.get(col, "TEXT")}' for col in LOCATIONS_COLUMNS) + ")"
+        )
+        conn.executemany(
+            f"INSERT INTO LOCATIONS VALUES ({', '.join('?' for _ in LOCATIONS_COLUMNS)})",
+            [tuple(row.get(col) for col in LOCATIONS_COLUMNS) for row in rows],
+        )
+        quoted_columns = ", ".join('"' + col + '"' for col in LOCATIONS_COLUMNS)
+        return pd.read_sql_query(f"SELECT {quoted_columns} FROM LOCATIONS", conn)
+    finally:
+        conn.close()
+
+
+def find_hash_mismatches():
+    # (chunk, source_key, row_hash) of ROW for every chunk whose hashes differ from the first one
+    chunks = {
+        "csv, all codes present": csv_chunk([ROW]),
+        "csv, with a missing code": csv_chunk([ROW, OTHER_ROW]),
+        "sqlite, all codes present": sqlite_chunk([ROW]),
+        "sqlite, with a missing code": sqlite_chunk([ROW, OTHER_ROW]),
+    }
+    hashes = {}
+    for name, df in chunks.items():
+        source_key, row_hash = hash_locations(df)
+        hashes[name] = (int(source_key[0]), int(row_hash[0]))
+    expected = next(iter(hashes.values()))
+    return [(name, *row) for name, row in hashes.items() if row != expected]
+
+
+if __name__ == "__main__":
+    mismatches = find_hash_mismatches()
+    for name, source_key, row_hash in mismatches:
+        print(f"{name}: source_key {source_key}, row_hash {row_hash} differ from the first chunk")
+    print(f"{len(mismatches)} chunks hash the row differently")
+    sys.exit(1 if mismatches else 0)
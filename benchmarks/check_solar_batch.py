@@ -0,0 +1,139 @@
+import argparse
+import math
+import os
+import random
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from solar_database_current import (
+    CO2_TONS_PER_KWH, FALLBACK_DERATE, GOOGLE_SOLAR_FIELDS, KWH_PER_HOUSE, community_solarDatabase,
+)
+
+# Parity check of process_solar_data_batch against the scalar process_solar_data.
+# Both run on the same randomized findClosest responses, mixed with the edge cases the batch
+# version has to reproduce: no panel configs (the sunshine fallback), configs without energy,
+# a missing or partial imageryDate, an empty solarPotential and values that land on a .5 tie
+# when rounded to 2 digits. Every field of every response has to match exactly:
+#
+#   python benchmarks/check_solar_batch.py --count 20000 --seed 1
+#
+# run_benchmarks.py runs the same check in its solar_batch scenario.
+
+
+def random_imagery_date(rng):
+    date = {"year": rng.randint(2010, 2024), "month": rng.randint(1, 12), "day": rng.randint(1, 28)}
+    choice = rng.random()
+    if choice < 0.1:
+        return None
+    if choice < 0.15:
+        return {}
+    if choice < 0.25:
+        # a part is missing or null
+        part = rng.choice(["year", "month", "day"])
+        if rng.random() < 0.5:
+            del date[part]
+        else:
+            date[part] = None
+    return date
+
+
+def random_response(rng):
+    response = {}
+    if rng.random() < 0.9:
+        response["imageryQuality"] = rng.choice(["HIGH", "MEDIUM", "LOW"])
+    date = random_imagery_date(rng)
+    if date is not None:
+        response["imageryDate"] = date
+    choice = rng.random()
+    if choice < 0.05:
+        # no solarPotential at all, or an empty one
+        if rng.random() < 0.5:
+            response["solarPotential"] = {}
+        return response
+    potential = {}
+    if rng.random() < 0.95:
+        potential["maxArrayPanelsCount"] = rng.randint(0, 2000)
+    if rng.random() < 0.8:
+        potential["panelCapacityWatts"] = rng.choice([250, 300, 400, 400.5])
+    if rng.random() < 0.8:
+        potential["maxSunshineHoursPerYear"] = round(rng.uniform(900, 1700), rng.choice([0, 1, 4]))
+    if rng.random() < 0.9:
+        potential["carbonOffsetFactorKgPerMwh"] = round(rng.uniform(400, 900), 4)
+    if choice < 0.2:
+        # the sunshine fallback, without configs or with configs that report no energy
+        configs = rng.choice([None, [], [{"panelsCount": 4}], [{"panelsCount": 4, "yearlyEnergyDcKwh": 0}]])
+    else:
+        configs = [
+            {"panelsCount": panels, "yearlyEnergyDcKwh": round(panels * rng.uniform(300, 480), rng.choice([0, 2, 4]))}
+            for panels in range(4, rng.randint(5, 400), rng.randint(1, 40))
+        ]
+    if configs is not None:
+        potential["solarPanelConfigs"] = configs
+    response["solarPotential"] = potential
+    return response
+
+
+def tie_responses(rng, count):
+    # energies that put the CO2 tons, the houses powered or the fallback estimate on a .5 tie
+    responses = []
+    for _ in range(count):
+        tie = rng.randint(0, 100000) + rng.choice([0.005, 0.015, 0.125, 0.375, 0.625, 0.875, 0.245, 0.995])
+        kind = rng.choice(["co2", "houses", "fallback"])
+        potential = {"maxArrayPanelsCount": rng.randint(1, 500), "panelCapacityWatts": 400}
+        if kind == "co2":
+            potential["solarPanelConfigs"] = [{"panelsCount": 4, "yearlyEnergyDcKwh": tie / CO2_TONS_PER_KWH}]
+        elif kind == "houses":
+            potential["solarPanelConfigs"] = [{"panelsCount": 4, "yearlyEnergyDcKwh": tie * KWH_PER_HOUSE}]
+        else:
+            nominal_kw = potential["maxArrayPanelsCount"] * potential["panelCapacityWatts"] / 1000
+            potential["maxSunshineHoursPerYear"] = tie / (nominal_kw * FALLBACK_DERATE)
+        responses.append({"imageryQuality": "HIGH", "solarPotential": potential})
+    return responses
+
+
+def make_responses(count, seed=0):
+    rng = random.Random(seed)
+    responses = [random_response(rng) for _ in range(count)]
+    responses += tie_responses(rng, max(count // 10, 100))
+    rng.shuffle(responses)
+    return responses
+
+
+def same_value(scalar, batch):
+    if scalar is None or batch is None or (isinstance(batch, float) and math.isnan(batch)):
+        return (scalar is None or (isinstance(scalar, float) and math.isnan(scalar))) and (
+            batch is None or (isinstance(batch, float) and math.isnan(batch))
+        )
+    return scalar == batch
+
+
+def find_mismatches(db, responses):
+    # (response index, field, scalar value, batch value) for every field that differs
+    batch = db.process_solar_data_batch(responses)
+    if len(batch) != len(responses):
+        return [(None, "rows", len(responses), len(batch))]
+    rows = batch.astype(object).to_dict("records")
+    mismatches = []
+    for index, (response, row) in enumerate(zip(responses, rows)):
+        expected = db.process_solar_data(response)
+        for field, column in GOOGLE_SOLAR_FIELDS.items():
+            if not same_value(expected[field], row[column]):
+                mismatches.append((index, field, expected[field], row[column]))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check process_solar_data_batch against process_solar_data.")
+    parser.add_argument("--count", type=int, default=20000, help="random responses, plus a tenth as many rounding ties")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    # the processors need no database or API key, nothing is opened
+    db = community_solarDatabase(api_key="", solar_cache_path=None)
+    responses = make_responses(args.count, args.seed)
+    mismatches = find_mismatches(db, responses)
+    for index, field, expected, actual in mismatches[:20]:
+        print(f"response {index} {field}: scalar {expected!r}, batch {actual!r}")
+    print(f"{len(responses)} responses, {len(mismatches)} mismatched fields")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,136 @@
+import argparse
+import csv
+import email.parser
+import email.policy
+import hashlib
+import io
+import math
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geocoding import address_key
+
+# Local stand-in for the Census addressbatch endpoint.
+# It knows the coordinates of the addresses it is given (e.g. the generated LOCATIONS), answers
+# most of them a few meters off, moves a share of them far away and does not match others,
+# deterministically per address:
+#
+#   python benchmarks/fake_census_geocoder.py --port 8766 --locations locations_data.csv
+#   CENSUS_GEOCODER_URL=http://127.0.0.1:8766/geocoder/locations/addressbatch python ...
+
+
+class FakeCensusGeocoder:
+    def __init__(self, coordinates, port=0, latency_ms=200, no_match_ratio=0.05, far_ratio=0.03, far_m=2000):
+        # coordinates: {address_key: (latitude, longitude)}
+        self.coordinates = coordinates
+        self.latency = latency_ms / 1000
+        self.no_match_ratio = no_match_ratio
+        self.far_ratio = far_ratio
+        self.far_m = far_m
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "addresses": 0}
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.endswith("addressbatch"):
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                data = api.answer(self.headers.get("Content-Type", ""), body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/geocoder/locations/addressbatch"
+
+    def answer(self, content_type, body):
+        # the multipart form is parsed with the email package, cgi is gone from the standard library
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+        )
+        address_file = next(
+            part.get_content() for part in message.iter_parts()
+            if part.get_param("name", header="content-disposition") == "addressFile"
+        )
+        if isinstance(address_file, bytes):
+            address_file = address_file.decode("utf-8")
+        rows = list(csv.reader(io.StringIO(address_file)))
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts["addresses"] += len(rows)
+        if self.latency:
+            time.sleep(self.latency)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        # the real endpoint does not answer in input order either
+        for record_id, street, city, state, zip_code in reversed(rows):
+            writer.writerow(self.geocode(record_id, street, city, state, zip_code))
+        return buffer.getvalue()
+
+    def geocode(self, record_id, street, city, state, zip_code):
+        key = address_key(street, city, state, zip_code)
+        input_address = f"{street}, {city}, {state}, {zip_code}"
+        draw = int(hashlib.sha256(key.encode()).hexdigest()[:12], 16) / 16 ** 12
+        if key not in self.coordinates or draw < self.no_match_ratio:
+            return [record_id, input_address, "No_Match"]
+        latitude, longitude = self.coordinates[key]
+        # address ranges put the point a little off the address point, a few get the wrong block
+        offset_m = self.far_m if draw > 1 - self.far_ratio else 5 + 40 * draw
+        bearing = draw * 2 * math.pi * 97
+        latitude += offset_m * math.cos(bearing) / 111320
+        longitude += offset_m * math.sin(bearing) / (111320 * math.cos(math.radians(latitude)))
+        return [record_id, input_address, "Match", "Exact", input_address.upper(), f"{longitude:.6f},{latitude:.6f}", "0", "L"]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def coordinates_from_locations_csv(path):
+    import pandas as pd
+    coordinates = {}
+    columns = ["geofulladdress", "geocity", "geostate", "geozip", "latitude", "longitude"]
+    for df in pd.read_csv(path, usecols=columns, dtype={"geozip": str}, chunksize=250000):
+        for street, city, state, zip_code, latitude, longitude in df[columns].itertuples(index=False, name=None):
+            coordinates[address_key(street, city, state, zip_code if isinstance(zip_code, str) else "")] = (latitude, longitude)
+    return coordinates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Census batch geocoder.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--locations", required=True, help="address point CSV whose addresses the server knows")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--no-match-ratio", type=float, default=0.05)
+    parser.add_argument("--far-ratio", type=float, default=0.03)
+    args = parser.parse_args()
+    geocoder = FakeCensusGeocoder(
+        coordinates_from_locations_csv(args.locations), args.port, args.latency_ms, args.no_match_ratio, args.far_ratio
+    )
+    print(f"Fake Census geocoder listening on {geocoder.url}")
+    try:
+        geocoder.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
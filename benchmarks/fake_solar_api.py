@@ -0,0 +1,119 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for buildingInsights:findClosest.
+# Answers are derived from the requested coordinates, so repeated runs see the same buildings.
+# Latency, 429s and no-data (404) answers are configurable:
+#
+#   python benchmarks/fake_solar_api.py --port 8765 --latency-ms 80 --rate-limit-ratio 0.01
+#   SOLAR_API_URL=http://127.0.0.1:8765/v1/buildingInsights:findClosest python solar_database_current.py
+
+
+class FakeSolarAPI:
+    def __init__(self, port=0, latency_ms=50, no_data_ratio=0.3, rate_limit_ratio=0.0, denied_keys=(), seed=0):
+        self.latency = latency_ms / 1000
+        self.no_data_ratio = no_data_ratio
+        self.rate_limit_ratio = rate_limit_ratio
+        self.denied_keys = set(denied_keys)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, 200: 0, 403: 0, 404: 0, 429: 0}
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status_code, body = api.answer(urlparse(self.path))
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1/buildingInsights:findClosest"
+
+    def answer(self, url):
+        if not url.path.endswith("buildingInsights:findClosest"):
+            return 404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}}
+        query = parse_qs(url.query)
+        latitude = float(query["location.latitude"][0])
+        longitude = float(query["location.longitude"][0])
+        key = query.get("key", [""])[0]
+        with self.lock:
+            self.counts["requests"] += 1
+            rate_limited = self.rate_limit_ratio and self.random.random() < self.rate_limit_ratio
+        if self.latency:
+            time.sleep(self.latency)
+        if key in self.denied_keys:
+            status_code, body = 403, {"error": {"code": 403, "message": "The caller does not have permission", "status": "PERMISSION_DENIED"}}
+        elif rate_limited:
+            status_code, body = 429, {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}}
+        else:
+            status_code, body = self.building(latitude, longitude)
+        with self.lock:
+            self.counts[status_code] += 1
+        return status_code, body
+
+    def building(self, latitude, longitude):
+        # a deterministic building per point, with a few panel configs like the real API returns
+        seed = int(hashlib.sha256(f"{latitude:.7f}|{longitude:.7f}".encode()).hexdigest()[:12], 16)
+        rng = random.Random(seed)
+        if rng.random() < self.no_data_ratio:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found.", "status": "NOT_FOUND"}}
+        max_panels = rng.randint(8, 400)
+        configs = []
+        for panels in range(4, max_panels + 1, max(1, max_panels // 10)):
+            configs.append({"panelsCount": panels, "yearlyEnergyDcKwh": round(panels * rng.uniform(380, 460), 4)})
+        return 200, {
+            "name": f"buildings/{seed:x}",
+            "center": {"latitude": latitude, "longitude": longitude},
+            "imageryDate": {"year": rng.randint(2015, 2023), "month": rng.randint(1, 12), "day": rng.randint(1, 28)},
+            "imageryQuality": rng.choice(["HIGH", "HIGH", "MEDIUM"]),
+            "solarPotential": {
+                "maxArrayPanelsCount": max_panels,
+                "panelCapacityWatts": 400,
+                "maxSunshineHoursPerYear": round(rng.uniform(1300, 1600), 1),
+                "carbonOffsetFactorKgPerMwh": round(rng.uniform(700, 900), 4),
+                "solarPanelConfigs": configs,
+            },
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Google Solar findClosest server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--no-data-ratio", type=float, default=0.3)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--denied-key", action="append", default=[])
+    args = parser.parse_args()
+    api = FakeSolarAPI(args.port, args.latency_ms, args.no_data_ratio, args.rate_limit_ratio, args.denied_key)
+    print(f"Fake Solar API listening on {api.url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,198 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Synthetic stand-ins for the ArcGIS address point export, the CEJST download and the
+# per-county nonprofit exports.
+# The columns, codes and identifiers have the shapes of the real files, so the loaders
+# see the same parsing work, but nothing here is real address data.
+#
+#   python benchmarks/generate_locations.py --rows 1000000 --out locations_data.csv --cejst cejst_data.csv
+
+# rows written per to_csv call, so 5M rows do not have to be built in memory at once
+GENERATE_CHUNK_SIZE = 250000
+# Indiana bounding box
+MIN_LATITUDE, MAX_LATITUDE = 37.77, 41.76
+MIN_LONGITUDE, MAX_LONGITUDE = -88.10, -84.78
+# (county, county FIPS, cities) for the most populous counties, weighted roughly by address count
+COUNTIES = [
+    ("Marion", "097", ["INDIANAPOLIS", "BEECH GROVE", "LAWRENCE", "SPEEDWAY"], 0.17),
+    ("Lake", "089", ["GARY", "HAMMOND", "CROWN POINT", "MERRILLVILLE"], 0.09),
+    ("Allen", "003", ["FORT WAYNE", "NEW HAVEN"], 0.07),
+    ("Hamilton", "057", ["CARMEL", "FISHERS", "NOBLESVILLE", "WESTFIELD"], 0.06),
+    ("St. Joseph", "141", ["SOUTH BEND", "MISHAWAKA"], 0.05),
+    ("Elkhart", "039", ["ELKHART", "GOSHEN"], 0.04),
+    ("Tippecanoe", "157", ["LAFAYETTE", "WEST LAFAYETTE"], 0.035),
+    ("Vanderburgh", "163", ["EVANSVILLE"], 0.035),
+    ("Porter", "127", ["VALPARAISO", "PORTAGE", "CHESTERTON"], 0.035),
+    ("Hendricks", "063", ["AVON", "PLAINFIELD", "BROWNSBURG"], 0.03),
+    ("Johnson", "081", ["GREENWOOD", "FRANKLIN"], 0.03),
+    ("Monroe", "105", ["BLOOMINGTON", "ELLETTSVILLE"], 0.03),
+    ("Madison", "095", ["ANDERSON", "ELWOOD"], 0.03),
+    ("Delaware", "035", ["MUNCIE"], 0.025),
+    ("LaPorte", "091", ["LA PORTE", "MICHIGAN CITY"], 0.025),
+    ("Vigo", "167", ["TERRE HAUTE"], 0.025),
+    ("Clark", "019", ["JEFFERSONVILLE", "CLARKSVILLE"], 0.025),
+    ("Boone", "011", ["LEBANON", "ZIONSVILLE"], 0.02),
+    ("Bartholomew", "005", ["COLUMBUS"], 0.02),
+    ("Howard", "067", ["KOKOMO"], 0.02),
+    ("Wayne", "177", ["RICHMOND"], 0.02),
+    ("Kosciusko", "085", ["WARSAW"], 0.02),
+    ("Grant", "053", ["MARION"], 0.02),
+    ("Floyd", "043", ["NEW ALBANY"], 0.02),
+    ("Dearborn", "029", ["LAWRENCEBURG"], 0.02),
+]
+# DLGF property class codes with rough shares, 6xx (exempt) is what the solar work queue selects
+PROPERTY_CLASS_CODES = [
+    (510, 0.55), (511, 0.08), (100, 0.06), (101, 0.04), (400, 0.04), (429, 0.03),
+    (300, 0.02), (520, 0.03), (550, 0.02), (640, 0.02), (620, 0.015), (680, 0.015),
+    (685, 0.01), (600, 0.005), (610, 0.005), (660, 0.005), (690, 0.005),
+]
+STREET_NAMES = ["MAIN", "OAK", "MAPLE", "WASHINGTON", "JEFFERSON", "LINCOLN", "MERIDIAN", "CENTER", "WALNUT", "CHURCH"]
+STREET_TYPES = ["ST", "AVE", "RD", "DR", "LN", "CT", "BLVD", "WAY"]
+# number of census tracts generated per county
+TRACTS_PER_COUNTY = 60
+NONPROFIT_SUFFIXES = ["Inc.", "Inc", "Foundation, Inc.", "Booster Club, Inc.", "Ministries, Inc.", "Association"]
+
+
+def tract_ids():
+    # every synthetic 2010 census tract id: state 18 + county FIPS + 6 digit tract
+    return [
+        f"18{fips}{tract:04d}00"
+        for county, fips, cities, weight in COUNTIES
+        for tract in range(1, TRACTS_PER_COUNTY + 1)
+    ]
+
+
+def generate_locations_frame(rows, rng, first_id=1):
+    weights = np.array([county[3] for county in COUNTIES])
+    county_index = rng.choice(len(COUNTIES), size=rows, p=weights / weights.sum())
+    codes = np.array([code for code, share in PROPERTY_CLASS_CODES])
+    shares = np.array([share for code, share in PROPERTY_CLASS_CODES])
+    city_index = rng.integers(0, 4, size=rows)
+    cities = np.array([COUNTIES[i][2][j % len(COUNTIES[i][2])] for i, j in zip(county_index, city_index)], dtype=object)
+    # addresses cluster by county, so nearby points (and coalescing) happen like in the real data
+    county_latitude = MIN_LATITUDE + (MAX_LATITUDE - MIN_LATITUDE) * (county_index + 0.5) / len(COUNTIES)
+    county_longitude = MIN_LONGITUDE + (MAX_LONGITUDE - MIN_LONGITUDE) * ((county_index * 7) % len(COUNTIES) + 0.5) / len(COUNTIES)
+    latitude = np.round(county_latitude + rng.normal(0, 0.05, size=rows), 7)
+    longitude = np.round(county_longitude + rng.normal(0, 0.05, size=rows), 7)
+    house_numbers = rng.integers(1, 20000, size=rows)
+    street_names = np.array(STREET_NAMES, dtype=object)[rng.integers(0, len(STREET_NAMES), size=rows)]
+    street_types = np.array(STREET_TYPES, dtype=object)[rng.integers(0, len(STREET_TYPES), size=rows)]
+    fips = np.array([county[1] for county in COUNTIES], dtype=object)[county_index]
+    tract = rng.integers(1, TRACTS_PER_COUNTY + 1, size=rows)
+    block_group = rng.integers(1, 5, size=rows)
+    geobg10 = [f"18{f}{t:04d}00{b}" for f, t, b in zip(fips, tract, block_group)]
+    zips = 46000 + county_index * 37 + rng.integers(0, 30, size=rows)
+    df = pd.DataFrame({
+        "OBJECTID": np.arange(first_id, first_id + rows),
+        "latitude": latitude,
+        "longitude": longitude,
+        "geostnum": house_numbers,
+        "geostname": street_names,
+        "geosttype": street_types,
+        "geofulladdress": [f"{n} {s} {t}" for n, s, t in zip(house_numbers, street_names, street_types)],
+        "geocity": cities,
+        "geostate": "IN",
+        "geozip": zips.astype(str).astype(object),
+        "geocounty": np.array([county[0] for county in COUNTIES], dtype=object)[county_index],
+        "geobg10": geobg10,
+        "geobg20": geobg10,
+        "dlgf_prop_class_code": pd.array(rng.choice(codes, size=rows, p=shares / shares.sum()), dtype="Int64"),
+        "source": "SYNTHETIC",
+        "last_update": "2024/01/01 00:00:00+00",
+    })
+    # the export has gaps: some points have no class code or zip,
+    # the codes stay integers like in the real export ("640", not "640.0")
+    df.loc[rng.random(rows) < 0.02, "dlgf_prop_class_code"] = pd.NA
+    df.loc[rng.random(rows) < 0.01, "geozip"] = None
+    return df
+
+
+def generate_locations_csv(path, rows, seed=0, chunk_size=GENERATE_CHUNK_SIZE):
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < rows:
+        size = min(chunk_size, rows - written)
+        df = generate_locations_frame(size, rng, written + 1)
+        df.to_csv(path, mode="w" if written == 0 else "a", header=written == 0, index=False)
+        written += size
+    return path
+
+
+def generate_cejst_csv(path, seed=0, disadvantaged_share=0.3):
+    rng = np.random.default_rng(seed)
+    tracts = tract_ids()
+    df = pd.DataFrame({
+        "Census tract 2010 ID": tracts,
+        "County Name": "",
+        "State/Territory": "Indiana",
+        "Identified as disadvantaged": rng.random(len(tracts)) < disadvantaged_share,
+        "Total population": rng.integers(500, 8000, size=len(tracts)),
+    })
+    df.to_csv(path, index=False)
+    return path
+
+
+def generate_nonprofit_files(directory, rows, seed=0):
+    # one export per county like downloads/named/, three title lines above the header, with the
+    # header spellings, " ()" name suffixes, ZIP+4 codes, dashed EINs, IRS ruling months,
+    # US dates and "$1,234" amounts the parser has to normalize
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    weights = np.array([county[3] for county in COUNTIES])
+    counts = rng.multinomial(rows, weights / weights.sum())
+    for index, ((county, fips, cities, weight), count) in enumerate(zip(COUNTIES, counts)):
+        zips = 46000 + index * 37 + rng.integers(0, 30, size=count)
+        df = pd.DataFrame({
+            "comp_name": [
+                f"{rng.choice(STREET_NAMES).title()} {rng.choice(NONPROFIT_SUFFIXES)}" + (" ()" if rng.random() < 0.8 else "")
+                for _ in range(count)
+            ],
+            "address1": [f"{n} {s.title()} {t.title()}" for n, s, t in zip(
+                rng.integers(1, 20000, size=count), rng.choice(STREET_NAMES, size=count), rng.choice(STREET_TYPES, size=count)
+            )],
+            "CITY": rng.choice(cities, size=count),
+            "ZIP": [f"{z}-{rng.integers(0, 9999):04d}" if rng.random() < 0.1 else str(z) for z in zips],
+            "contact_name": np.where(rng.random(count) < 0.3, "Jane Doe", ""),
+            "source_agency": rng.choice(["SOS", "IRS"], size=count, p=[0.7, 0.3]),
+            "EIN": [f"{e // 10000000:02d}-{e % 10000000:07d}" if rng.random() < 0.6 else "" for e in rng.integers(1, 10 ** 9, size=count)],
+            "RULING": [f"{y}{m:02d}" if rng.random() < 0.5 else "000000" for y, m in zip(
+                rng.integers(1950, 2024, size=count), rng.integers(1, 13, size=count)
+            )],
+            "Date of Incorporation": [f"{m}/{d}/{y}" for y, m, d in zip(
+                rng.integers(1950, 2024, size=count), rng.integers(1, 13, size=count), rng.integers(1, 29, size=count)
+            )],
+            "ASSET_AMT": [f"${a:,}" if rng.random() < 0.5 else str(a) for a in rng.integers(0, 5000000, size=count)],
+            "INCOME_AMT": rng.integers(0, 2000000, size=count),
+            "REVENUE_AMT": np.where(rng.random(count) < 0.2, "", rng.integers(0, 2000000, size=count).astype(str)),
+        })
+        # older exports spell a few headers differently and have no IRS or incorporation columns
+        if index % 3 == 0:
+            df = df.rename(columns={"address1": "Address", "ZIP": "Zip Code"})
+            df = df.drop(columns=["EIN", "RULING", "Date of Incorporation", "ASSET_AMT", "INCOME_AMT", "REVENUE_AMT"])
+        path = os.path.join(directory, f"{county}.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            file.write(f"Indiana Nonprofits\n{county} County\nSource: synthetic\n")
+            df.to_csv(file, index=False)
+    return directory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Indiana address points and CEJST tracts.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--out", default="locations_data.csv")
+    parser.add_argument("--cejst", default=None, help="also write a matching CEJST csv to this path")
+    parser.add_argument("--nonprofits", default=None, help="also write synthetic county nonprofit exports to this directory")
+    parser.add_argument("--nonprofit-rows", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_locations_csv(args.out, args.rows, args.seed)
+    print(f"Wrote {args.rows} synthetic address points to {args.out}")
+    if args.cejst:
+        generate_cejst_csv(args.cejst, args.seed)
+        print(f"Wrote synthetic CEJST tracts to {args.cejst}")
+    if args.nonprofits:
+        generate_nonprofit_files(args.nonprofits, args.nonprofit_rows, args.seed)
+        print(f"Wrote {args.nonprofit_rows} synthetic nonprofits to {args.nonprofits}")
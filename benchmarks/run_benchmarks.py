@@ -0,0 +1,463 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import pickle
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# Timed scenarios for the pipeline on synthetic data, without touching ArcGIS or Google:
+#
+#   ingest            load the address CSV, CEJST and property codes, build indexes and the R*Tree
+#   nonprofits        parse the county nonprofit exports in a process pool and load NONPROFITS
+#   geocode           check the 6xx address points against the fake Census batch geocoder, then again from the cache
+#   solar_batch       process_solar_data_batch against process_solar_data on random responses, fails on any mismatch
+#   solar_concurrent  get_and_insert_solar_data_concurrent against the fake findClosest server
+#   solar_sharded     get_and_insert_solar_data_sharded with two fake keys
+#   dashboard_build   build the DASHBOARD table and write its Arrow snapshot
+#   dashboard_query   count + first page + map points for every single-city selection
+#   load_data         the full selection as the app's frame, from SQL and from the snapshot, and its size per row
+#   export            the statewide selection as CSV, Parquet and GeoJSON, written in chunks, then from the export cache
+#   ranking           score every site into the leaderboards, then read the top 10 of every city
+#   rollup            build SOLAR_ROLLUP, then the per-county summary from it and from the location rows
+#   read_during_fetch dashboard queries through the app's reader pool while a solar fetch is writing
+#   refresh           delta refresh from an extract that only fills in the missing class codes, fails unless exactly those rows are updated
+#   cold_start        fresh interpreters running `cli.py --help`, `cli.py stats` and `import solar_database_current`
+#
+#   python benchmarks/run_benchmarks.py --rows 10000 100000 --solar-calls 2000
+#
+# Every result is appended to benchmarks/results.jsonl with the git commit it was measured on,
+# and compared with the last result of the same scenario and size from another commit.
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import geocoding
+import solar_workers
+import dashboard_queries
+import db_connection
+import exports
+import site_ranking
+import check_solar_batch
+import check_locations_hash
+from fake_solar_api import FakeSolarAPI
+from fake_census_geocoder import FakeCensusGeocoder, coordinates_from_locations_csv
+from generate_locations import generate_locations_csv, generate_cejst_csv, generate_nonprofit_files
+
+RESULTS_FILE = os.path.join(BENCHMARKS_DIR, "results.jsonl")
+# fresh interpreters started per cold_start command, the median is reported
+COLD_START_RUNS = 5
+SCENARIOS = ["ingest", "nonprofits", "geocode", "solar_batch", "solar_concurrent", "solar_sharded", "dashboard_build", "dashboard_query", "load_data", "export", "ranking", "rollup", "read_during_fetch", "refresh", "cold_start"]
+# a regression is flagged when a scenario is this much slower than on the previous commit
+REGRESSION_THRESHOLD = 0.10
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class BenchmarkRun:
+    def __init__(self, results_file=RESULTS_FILE, verbose=False):
+        self.results_file = results_file
+        self.verbose = verbose
+        self.commit = git_commit()
+        self.previous = load_results(results_file)
+
+    @contextlib.contextmanager
+    def quiet(self):
+        # the pipeline reports through prints, keep them out of the timings unless asked for
+        if self.verbose:
+            yield
+            return
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+    def record(self, scenario, rows, seconds, **metrics):
+        result = {
+            "commit": self.commit,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "scenario": scenario,
+            "rows": rows,
+            "seconds": round(seconds, 4),
+            "metrics": metrics,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+        }
+        with open(self.results_file, "a") as file:
+            file.write(json.dumps(result) + "\n")
+        line = f"{scenario:<18} rows={rows:<9} {seconds:9.3f}s " + " ".join(f"{k}={v}" for k, v in metrics.items())
+        baseline = next(
+            (
+                previous for previous in reversed(self.previous)
+                if previous["scenario"] == scenario and previous["rows"] == rows and previous["commit"] != self.commit
+            ),
+            None,
+        )
+        if baseline and baseline["seconds"]:
+            change = seconds / baseline["seconds"] - 1
+            line += f"  ({change:+.1%} vs {baseline['commit']})"
+            if change > REGRESSION_THRESHOLD:
+                line += "  REGRESSION"
+        print(line)
+        return result
+
+
+def run_size(run, rows, scenarios, solar_calls, latency_ms, workdir):
+    # everything for one size runs in its own directory, the loaders use relative file names
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    shutil.copy(os.path.join(REPO_DIR, "property_codes.csv"), "property_codes.csv")
+    generate_locations_csv("locations_data.csv", rows)
+    generate_cejst_csv("cejst_data.csv")
+
+    # imported here so SOLAR_API_URL below is the only thing pointing at the fake server
+    import solar_database_current
+    api = FakeSolarAPI(latency_ms=latency_ms).start()
+    solar_workers.SOLAR_API_URL = api.url
+    db = solar_database_current.community_solarDatabase(
+        db_path="community_solar.db", api_key="benchmark", solar_cache_path="solar_cache.db"
+    )
+    try:
+        with run.quiet():
+            start = time.perf_counter()
+            with db.load_pragmas():
+                db.check_locations_table_exists()
+                db.insert_locations_data()
+                db.check_google_solar_table_exists()
+                db.check_cejst_table_exists()
+                db.insert_cejst_data()
+                db.check_property_codes_table_exists()
+                db.insert_property_codes_data()
+                db.create_indexes()
+                db.update_locations_rtree()
+            seconds = time.perf_counter() - start
+        if "ingest" in scenarios:
+            run.record("ingest", rows, seconds, rows_per_second=round(rows / seconds))
+
+        if "nonprofits" in scenarios:
+            # about one nonprofit per 40 address points, like the real exports
+            generate_nonprofit_files("nonprofits", max(rows // 40, 100))
+            with run.quiet():
+                start = time.perf_counter()
+                loaded = db.insert_nonprofit_data("nonprofits")
+                seconds = time.perf_counter() - start
+            run.record("nonprofits", rows, seconds, nonprofits=loaded, rows_per_second=round(loaded / seconds))
+
+        if "geocode" in scenarios:
+            geocoder = FakeCensusGeocoder(coordinates_from_locations_csv("locations_data.csv"), latency_ms=latency_ms * 4).start()
+            geocoding.CENSUS_GEOCODER_URL = geocoder.url
+            try:
+                with run.quiet():
+                    start = time.perf_counter()
+                    stats = db.geocode_locations(batch_size=1000)
+                    seconds = time.perf_counter() - start
+                    cached_start = time.perf_counter()
+                    db.geocode_locations(batch_size=1000, recheck=True)
+                    cached_seconds = time.perf_counter() - cached_start
+            finally:
+                geocoder.stop()
+            run.record(
+                "geocode", rows, seconds,
+                checked=stats["checked"], requests=geocoder.counts["requests"], mismatched=stats["mismatched"],
+                cached_seconds=round(cached_seconds, 4),
+            )
+
+        if "solar_batch" in scenarios:
+            # a tenth as many random responses as rows, with the rounding ties mixed in
+            responses = check_solar_batch.make_responses(max(rows // 10, 1000))
+            mismatches = check_solar_batch.find_mismatches(db, responses)
+            if mismatches:
+                raise AssertionError(f"process_solar_data_batch differs from process_solar_data: {mismatches[:5]}")
+            start = time.perf_counter()
+            db.process_solar_data_batch(responses)
+            seconds = time.perf_counter() - start
+            scalar_start = time.perf_counter()
+            for response in responses:
+                db.process_solar_data(response)
+            scalar_seconds = time.perf_counter() - scalar_start
+            run.record(
+                "solar_batch", rows, seconds,
+                responses=len(responses), mismatches=0, scalar_seconds=round(scalar_seconds, 4),
+            )
+
+        # the work queue picks locations flagged with has_solar_data = 1
+        db.conn.execute("UPDATE LOCATIONS SET has_solar_data = 1 WHERE dlgf_prop_class_code BETWEEN 600 AND 699;")
+        db.conn.commit()
+        for scenario, fetch in (
+            ("solar_concurrent", lambda: db.get_and_insert_solar_data_concurrent(
+                limit=solar_calls, workers=16, requests_per_minute=60000, commit_every=200)),
+            ("solar_sharded", lambda: db.get_and_insert_solar_data_sharded(
+                api_keys=["benchmark-1", "benchmark-2"], requests_per_minute=30000, commit_every=200, limit=solar_calls)),
+        ):
+            if scenario not in scenarios:
+                continue
+            requests_before = api.counts["requests"]
+            with run.quiet():
+                start = time.perf_counter()
+                fetch()
+                seconds = time.perf_counter() - start
+            requests_sent = api.counts["requests"] - requests_before
+            run.record(
+                scenario, rows, seconds,
+                api_calls=requests_sent, calls_per_second=round(requests_sent / seconds, 1), latency_ms=latency_ms,
+            )
+
+        if not {"solar_concurrent", "solar_sharded"} & set(scenarios):
+            # the dashboard scenarios need solar rows, fetch them without timing
+            with run.quiet():
+                db.get_and_insert_solar_data_concurrent(limit=solar_calls, workers=16, requests_per_minute=60000)
+
+        with run.quiet():
+            start = time.perf_counter()
+            db.build_dashboard_table()
+            built = time.perf_counter()
+            db.write_dashboard_snapshot()
+            seconds = time.perf_counter() - start
+        dashboard_rows = db.conn.execute("SELECT COUNT(*) FROM DASHBOARD;").fetchone()[0]
+        if "dashboard_build" in scenarios:
+            run.record(
+                "dashboard_build", rows, seconds,
+                dashboard_rows=dashboard_rows, snapshot_seconds=round(time.perf_counter() - built, 4),
+            )
+
+        cities, codes, flags = dashboard_queries.get_filter_options(db.conn)
+        codes = [code for code, description in codes]
+        if "dashboard_query" in scenarios and cities:
+            # one city at a time, like a user clicking through the dropdown
+            start = time.perf_counter()
+            for city in cities:
+                dashboard_queries.count_dashboard_rows(db.conn, [city], codes, flags)
+                dashboard_queries.fetch_dashboard_page(db.conn, [city], codes, flags, 0, 500)
+                dashboard_queries.fetch_map_points(db.conn, [city], codes, flags, 20000)
+            seconds = time.perf_counter() - start
+            run.record(
+                "dashboard_query", rows, seconds,
+                selections=len(cities), ms_per_selection=round(seconds / len(cities) * 1000, 2),
+            )
+
+        if "load_data" in scenarios and cities:
+            start = time.perf_counter()
+            frame = dashboard_queries.prepare_dashboard_frame(
+                dashboard_queries.fetch_dashboard_rows(db.conn, cities, codes, flags)
+            )
+            sql_seconds = time.perf_counter() - start
+            # what a st.cache_data hit costs on top of a cache_resource hit, a pickle round trip of the frame
+            start = time.perf_counter()
+            pickle.loads(pickle.dumps(frame))
+            pickle_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            snapshot = dashboard_queries.open_dashboard_snapshot(
+                solar_database_current.DASHBOARD_SNAPSHOT, dashboard_queries.get_dashboard_version(db.conn)
+            )
+            dashboard_queries.prepare_dashboard_frame(
+                dashboard_queries.fetch_snapshot_rows(snapshot, cities, codes, flags)
+            )
+            snapshot_seconds = time.perf_counter() - start
+            run.record(
+                "load_data", rows, sql_seconds + snapshot_seconds,
+                frame_rows=len(frame), sql_seconds=round(sql_seconds, 4), snapshot_seconds=round(snapshot_seconds, 4),
+                frame_mb=round(frame.memory_usage(deep=True).sum() / 1024 ** 2, 2),
+                bytes_per_row=round(dashboard_queries.frame_bytes_per_row(frame), 1),
+                pickle_ms=round(pickle_seconds * 1000, 3),
+            )
+        if "export" in scenarios and cities:
+            # peak Python memory of the chunked writers against building the whole CSV in memory
+            export_cache = exports.ExportCache("exports")
+            pool = db_connection.ConnectionPool("community_solar.db", role="reader")
+            selection = (dashboard_queries.get_dashboard_version(db.conn), tuple(cities), tuple(codes), tuple(flags))
+            details = {}
+            start = time.perf_counter()
+            for export_format in exports.EXPORT_FORMATS:
+                tracemalloc.start()
+                format_start = time.perf_counter()
+                path = export_cache.request(pool.connection, export_format, *selection).result()
+                details[f"{export_format}_seconds"] = round(time.perf_counter() - format_start, 4)
+                details[f"{export_format}_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+                details[f"{export_format}_mb"] = round(os.path.getsize(path) / 1024 ** 2, 2)
+                tracemalloc.stop()
+            seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            export_cache.request(pool.connection, "csv", *selection).result()
+            details["cached_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            tracemalloc.start()
+            with pool.connection() as conn:
+                dashboard_queries.add_maps_links(dashboard_queries.prepare_dashboard_frame(
+                    dashboard_queries.fetch_dashboard_rows(conn, cities, codes, flags)
+                )).to_csv(index=False).encode("utf-8")
+            details["in_memory_csv_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+            tracemalloc.stop()
+            pool.close()
+            run.record("export", rows, seconds, **details)
+
+        if "ranking" in scenarios:
+            with run.quiet():
+                start = time.perf_counter()
+                db.build_site_rankings()
+                seconds = time.perf_counter() - start
+            ranked_cities = site_ranking.fetch_leaderboard_regions(db.conn, "city")
+            query_start = time.perf_counter()
+            for city in ranked_cities:
+                site_ranking.fetch_top_sites(db.conn, "city", city, 10)
+            query_seconds = time.perf_counter() - query_start
+            run.record(
+                "ranking", rows, seconds,
+                scored=db.conn.execute("SELECT COUNT(*) FROM SITE_SCORES;").fetchone()[0],
+                leaderboards=db.conn.execute("SELECT COUNT(DISTINCT region_type || region) FROM LEADERBOARDS;").fetchone()[0],
+                ms_per_top_query=round(query_seconds / max(len(ranked_cities), 1) * 1000, 3),
+            )
+
+        if "rollup" in scenarios:
+            with run.quiet():
+                start = time.perf_counter()
+                db.build_solar_rollup()
+                seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            summary = dashboard_queries.fetch_solar_summary(db.conn, ("county", "disadvantaged"), code_range=(600, 699))
+            summary_seconds = time.perf_counter() - start
+            # the same totals the way a notebook gets them, from every location row
+            start = time.perf_counter()
+            db.conn.execute(
+                f"SELECT geocounty, identified_as_disadvantaged, COUNT(*), SUM(yearly_energy_dc_kwh), "
+                f"SUM(estimated_annual_co2_savings_tons) FROM ({solar_database_current.ROLLUP_SELECT}) "
+                f"WHERE dlgf_prop_class_code BETWEEN 600 AND 699 GROUP BY 1, 2;"
+            ).fetchall()
+            rows_seconds = time.perf_counter() - start
+            run.record(
+                "rollup", rows, seconds,
+                groups=db.conn.execute("SELECT COUNT(*) FROM SOLAR_ROLLUP;").fetchone()[0], summary_rows=len(summary),
+                summary_ms=round(summary_seconds * 1000, 3), from_rows_ms=round(rows_seconds * 1000, 3),
+            )
+
+        if "read_during_fetch" in scenarios and cities:
+            # the fetch runs with its own writer connection in a thread, like a backfill next to the app
+            def fetch():
+                writer = solar_database_current.community_solarDatabase(
+                    db_path="community_solar.db", api_key="benchmark", solar_cache_path="solar_cache.db"
+                )
+                try:
+                    writer.get_and_insert_solar_data_concurrent(
+                        limit=solar_calls, workers=16, requests_per_minute=60000, commit_every=50
+                    )
+                finally:
+                    writer.close()
+
+            pool = db_connection.ConnectionPool("community_solar.db", role="reader")
+            latencies = []
+            with run.quiet():
+                fetcher = threading.Thread(target=fetch)
+                start = time.perf_counter()
+                fetcher.start()
+                while fetcher.is_alive() or not latencies:
+                    city = cities[len(latencies) % len(cities)]
+                    query_start = time.perf_counter()
+                    with pool.connection() as conn:
+                        dashboard_queries.count_dashboard_rows(conn, [city], codes, flags)
+                        dashboard_queries.fetch_dashboard_page(conn, [city], codes, flags, 0, 500)
+                    latencies.append(time.perf_counter() - query_start)
+                fetcher.join()
+                seconds = time.perf_counter() - start
+            pool.close()
+            latencies.sort()
+            run.record(
+                "read_during_fetch", rows, seconds,
+                queries=len(latencies),
+                p50_ms=round(latencies[len(latencies) // 2] * 1000, 2),
+                p95_ms=round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+                max_ms=round(latencies[-1] * 1000, 2),
+            )
+
+        if "refresh" in scenarios:
+            # a row must hash the same in every chunk, or the refresh rewrites whole chunks
+            mismatches = check_locations_hash.find_hash_mismatches()
+            if mismatches:
+                raise AssertionError(f"hash_locations depends on the chunk: {mismatches}")
+            # the next extract only fills in the missing class codes, everything else is kept as written
+            extract = pd.read_csv("locations_data.csv", dtype=str, keep_default_na=False)
+            missing = extract["dlgf_prop_class_code"] == ""
+            extract.loc[missing, "dlgf_prop_class_code"] = "640"
+            extract.to_csv("locations_data.csv", index=False)
+            with run.quiet():
+                start = time.perf_counter()
+                counts = db.refresh_locations_data(download=False)
+                seconds = time.perf_counter() - start
+            changed = int(missing.sum())
+            if counts != {"inserted": 0, "updated": changed, "retired": 0}:
+                raise AssertionError(f"refresh changed {changed} rows but reported {counts}")
+            run.record("refresh", rows, seconds, changed=changed, **counts)
+
+        if "cold_start" in scenarios:
+            # what a user waits for before the first line of output, each in a new interpreter
+            cli_path = os.path.join(REPO_DIR, "cli.py")
+            db_path = os.path.abspath("community_solar.db")
+            commands = {
+                "help": [sys.executable, cli_path, "--help"],
+                "stats": [sys.executable, cli_path, "--db", db_path, "stats"],
+                "import_pipeline": [sys.executable, "-c", "import solar_database_current"],
+            }
+            env = dict(os.environ, PYTHONPATH=REPO_DIR)
+            medians = {}
+            for name, command in commands.items():
+                timings = []
+                for _ in range(COLD_START_RUNS):
+                    start = time.perf_counter()
+                    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+                    timings.append(time.perf_counter() - start)
+                medians[name] = sorted(timings)[len(timings) // 2]
+            run.record(
+                "cold_start", rows, medians["stats"],
+                **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in medians.items()},
+            )
+    finally:
+        db.close()
+        api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the synthetic pipeline benchmarks.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000], help="address points per run, e.g. 10000 1000000 5000000")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--solar-calls", type=int, default=1000, help="locations fetched by each solar scenario")
+    parser.add_argument("--latency-ms", type=float, default=50, help="latency of the fake findClosest server")
+    parser.add_argument("--workdir", default=None, help="keep the generated files here instead of a temp directory")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = parser.parse_args()
+
+    run = BenchmarkRun(args.results, args.verbose)
+    print(f"Benchmarking commit {run.commit}, results are appended to {args.results}")
+    root = args.workdir or tempfile.mkdtemp(prefix="community_solar_bench_")
+    try:
+        for rows in args.rows:
+            run_size(run, rows, args.scenarios, args.solar_calls, args.latency_ms, os.path.join(root, str(rows)))
+    finally:
+        os.chdir(REPO_DIR)
+        if args.workdir is None:
+            shutil.rmtree(root, ignore_errors=True)
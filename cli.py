@@ -0,0 +1,154 @@
+import argparse
+import os
+import sys
+from data_dictionary import DATA_DICTIONARY_XLSX
+
+# Command line for the community solar database.
+# Only argparse and the column definitions are loaded up front. The pipeline (pandas, pyarrow, requests, ...) is
+# imported by the subcommands that run it, and the database and the API key are only opened when
+# a step needs them, so `stats` and `export-dictionary` start in milliseconds and need no key:
+#
+#   python cli.py build --include-nonprofits
+#   python cli.py refresh
+#   python cli.py fetch-solar --mode backfill --max-api-calls 10000 --max-seconds 3600
+#   python cli.py export-dictionary
+#   python cli.py stats
+#
+# the rest of the pipeline is called from Python, e.g.
+#   db.geocode_locations(cities=["VALPARAISO"]); print(db.get_geocode_mismatches())
+#   db.build_site_rankings(weights={"yearly_energy_dc_kwh": 0.7, "identified_as_disadvantaged": 0.3})
+#   db.export_solar_summary("disadvantaged_6xx_by_county.csv", group_by=("county",), flags=("yes",), code_range=(600, 699))
+# and site_ranking.py has its own command line for the leaderboards.
+
+DB_PATH = "community_solar.db"
+FETCH_MODES = ["serial", "concurrent", "sharded", "backfill"]
+# tables counted by `stats`, the ones that do not exist yet are skipped
+STATS_TABLES = [
+    "LOCATIONS", "GOOGLE_SOLAR", "CEJST", "PROPERTY_CODES", "NONPROFITS", "DASHBOARD",
+    "SITE_SCORES", "LEADERBOARDS", "SOLAR_ROLLUP", "GEOCODE_CACHE", "LOCATION_GEOCODES", "LOAD_REJECTS",
+]
+
+
+def open_database(args):
+    # the pipeline is only imported by the subcommands that run it
+    from solar_database_current import community_solarDatabase
+    return community_solarDatabase(db_path=args.db)
+
+
+def run_build(args):
+    db = open_database(args)
+    # create_database_and_build closes the database when it is done
+    db.create_database_and_build(include_nonprofits=args.include_nonprofits)
+
+
+def run_refresh(args):
+    db = open_database(args)
+    try:
+        db.refresh_locations_data(download=not args.no_download)
+    finally:
+        db.close()
+
+
+def run_fetch_solar(args):
+    db = open_database(args)
+    try:
+        if args.mode == "serial":
+            db.get_and_insert_solar_data(limit=args.limit)
+        elif args.mode == "concurrent":
+            db.get_and_insert_solar_data_concurrent(
+                limit=args.limit, workers=args.workers, requests_per_minute=args.requests_per_minute
+            )
+        elif args.mode == "sharded":
+            db.get_and_insert_solar_data_sharded(requests_per_minute=args.requests_per_minute, limit=args.limit)
+        else:
+            db.run_solar_backfill(max_api_calls=args.max_api_calls, max_seconds=args.max_seconds)
+    finally:
+        db.close()
+
+
+def run_export_dictionary(args):
+    # only needs the database and pandas, not the pipeline
+    import db_connection
+    from data_dictionary import export_data_dictionary
+    conn = db_connection.connect(args.db, role="reader")
+    try:
+        tables = export_data_dictionary(conn, args.output)
+    finally:
+        conn.close()
+    print(f"Data dictionary of {len(tables)} tables written to {args.output}.")
+
+
+def run_stats(args):
+    import db_connection
+    conn = db_connection.connect(args.db, role="reader")
+    try:
+        size = os.path.getsize(args.db)
+        wal_size = os.path.getsize(f"{args.db}-wal") if os.path.exists(f"{args.db}-wal") else 0
+        print(f"{args.db}: {size / 1024 ** 2:,.1f} MB, WAL {wal_size / 1024 ** 2:,.1f} MB")
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+        for table in STATS_TABLES:
+            if table in existing:
+                count = conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+                print(f"  {table:<20} {count:>12,} rows")
+        if "LOCATIONS" in existing:
+            states = conn.execute(
+                "SELECT has_solar_data, COUNT(*) FROM LOCATIONS GROUP BY has_solar_data ORDER BY has_solar_data;"
+            ).fetchall()
+            print("  has_solar_data       " + ", ".join(f"{state}: {count:,}" for state, count in states))
+        if "DASHBOARD_VERSION" in existing:
+            version, updated = conn.execute("SELECT version, date_updated FROM DASHBOARD_VERSION;").fetchone()
+            print(f"  dashboard version    {version} ({updated})")
+        if "SOLAR_RUNS" in existing:
+            run = conn.execute(
+                "SELECT run_id, status, processed_locations, api_calls, date_started FROM SOLAR_RUNS "
+                "ORDER BY run_id DESC LIMIT 1;"
+            ).fetchone()
+            if run:
+                print(f"  last solar run       {run[0]} {run[1]}, {run[2]:,} locations, {run[3]:,} API calls, started {run[4]}")
+    finally:
+        conn.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Build, refresh and inspect the community solar database.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="download the sources and build every table from scratch")
+    build.add_argument("--include-nonprofits", action="store_true", help="also load the county nonprofit exports")
+    build.set_defaults(handler=run_build)
+
+    refresh = subparsers.add_parser("refresh", help="apply a new ArcGIS extract to LOCATIONS without a rebuild")
+    refresh.add_argument("--no-download", action="store_true", help="use the locations_data.csv already on disk")
+    refresh.set_defaults(handler=run_refresh)
+
+    fetch = subparsers.add_parser("fetch-solar", help="get Google Solar data for the pending locations")
+    fetch.add_argument("--mode", choices=FETCH_MODES, default="concurrent")
+    fetch.add_argument("--limit", type=int, default=20, help="locations to fetch (serial, concurrent and sharded)")
+    fetch.add_argument("--workers", type=int, default=8, help="request threads (concurrent)")
+    fetch.add_argument("--requests-per-minute", type=int, default=300, help="rate budget per API key")
+    fetch.add_argument("--max-api-calls", type=int, default=None, help="stop the backfill after this many requests")
+    fetch.add_argument("--max-seconds", type=float, default=None, help="stop the backfill after this long")
+    fetch.set_defaults(handler=run_fetch_solar)
+
+    dictionary = subparsers.add_parser("export-dictionary", help="write the data dictionary to an Excel file")
+    dictionary.add_argument("--output", default=DATA_DICTIONARY_XLSX)
+    dictionary.set_defaults(handler=run_export_dictionary)
+
+    stats = subparsers.add_parser("stats", help="print table sizes and the solar fetch progress")
+    stats.set_defaults(handler=run_stats)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command in ("export-dictionary", "stats") and not os.path.exists(args.db):
+        # a read-only connection can not create the file, say so instead of a sqlite3 error
+        print(f"{args.db} does not exist, run `python cli.py build` first.", file=sys.stderr)
+        return 1
+    args.handler(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
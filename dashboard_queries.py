@@ -0,0 +1,323 @@
+import os
+import sqlite3
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Query layer behind the Streamlit dashboard.
+# The multiselect filters are pushed down into parameterized SQL against the DASHBOARD table
+# (built by solar_database_current.py), so the app only ever holds the rows it shows.
+
+# columns read from DASHBOARD for the grid, in the order they are selected
+DASHBOARD_COLUMNS = [
+    "location_id",
+    "latitude",
+    "longitude",
+    "dlgf_prop_class_code",
+    "geofulladdress",
+    "geocity",
+    "geozip",
+    "imagery_year",
+    "max_array_panels_count",
+    "panel_capacity_watts",
+    "nominal_power_watts",
+    "yearly_energy_dc_kwh",
+    "carbon_offset_factor_kg_per_mwh",
+    "estimated_annual_co2_savings_tons",
+    "estimated_houses_powered",
+    "property_code_description",
+    "identified_as_disadvantaged",
+]
+
+# display names used by the app
+DISPLAY_NAMES = {
+    'geofulladdress': 'Full Address',
+    'geocity': 'City',
+    'geozip': 'Zip Code',
+    'dlgf_prop_class_code': 'Property Code',
+    'age_of_solar_imagery(years)': 'Age of Solar Imagery (years)',
+    'max_array_panels_count': 'Max Array Panels Count',
+    'panel_capacity_watts': 'Panel Capacity (Watts)',
+    'nominal_power_watts': 'Nominal Power (Watts)',
+    'yearly_energy_dc_kwh': 'Yearly Energy DC (kWh)',
+    'carbon_offset_factor_kg_per_mwh': 'Carbon Offset Factor (kg/MWh)',
+    'estimated_annual_co2_savings_tons': 'Estimated Annual CO2 Savings (tons)',
+    'estimated_houses_powered': 'Estimated Houses Powered',
+    'property_code_description': 'Property Code Description',
+    'identified_as_disadvantaged': 'Disadvantaged Flag',
+    'latitude': 'Latitude',
+    'longitude': 'Longitude'
+}
+
+# column order of the frames returned to the app
+DISPLAY_COLUMNS = [
+    'Full Address', 'City', 'Zip Code', 'Property Code', 'Disadvantaged Flag',
+    'Max Array Panels Count', 'Panel Capacity (Watts)', 'Nominal Power (Watts)',
+    'Yearly Energy DC (kWh)', 'Carbon Offset Factor (kg/MWh)',
+    'Estimated Annual CO2 Savings (tons)', 'Estimated Houses Powered',
+    'Age of Solar Imagery (years)', 'Property Code Description', 'Latitude', 'Longitude'
+]
+
+# a few hundred distinct values repeated over every row, stored once as categoricals
+CATEGORY_COLUMNS = ['City', 'Zip Code', 'Property Code Description', 'Disadvantaged Flag']
+# whole-number columns, downcast to the smallest integer type that holds them
+INTEGER_COLUMNS = [
+    'Property Code', 'Max Array Panels Count', 'Panel Capacity (Watts)', 'Nominal Power (Watts)',
+    'Age of Solar Imagery (years)'
+]
+# these stay float64, float32 would change the 4th decimal the grid and the export show
+FLOAT_COLUMNS = [
+    'Yearly Energy DC (kWh)', 'Carbon Offset Factor (kg/MWh)', 'Estimated Annual CO2 Savings (tons)',
+    'Estimated Houses Powered', 'Latitude', 'Longitude'
+]
+
+# the maps link is not stored per row, the grid derives it from the coordinates and the export adds it
+MAPS_LINK_COLUMN = 'Google Maps Link'
+MAPS_SEARCH_URL = 'https://www.google.com/maps/search/?api=1&query='
+
+
+def get_filter_options(conn):
+    # the dropdown values come from the small distinct-value tables kept next to DASHBOARD
+    cities = [row[0] for row in conn.execute("SELECT geocity FROM DASHBOARD_CITIES ORDER BY geocity;")]
+    codes = conn.execute(
+        "SELECT property_code, description FROM DASHBOARD_PROPERTY_CODES ORDER BY property_code;"
+    ).fetchall()
+    flags = [
+        row[0] for row in conn.execute(
+            "SELECT identified_as_disadvantaged FROM DASHBOARD_FLAGS ORDER BY identified_as_disadvantaged;"
+        )
+    ]
+    return cities, codes, flags
+
+
+def get_dashboard_version(conn):
+    # version of the DASHBOARD rows, None for databases built before the snapshot existed
+    try:
+        return conn.execute("SELECT version FROM DASHBOARD_VERSION;").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def build_filter_clause(cities, codes, flags):
+    # turn the multiselect values into a parameterized WHERE clause
+    clauses = []
+    params = []
+    for column, values in (
+        ("geocity", cities),
+        ("dlgf_prop_class_code", codes),
+        ("identified_as_disadvantaged", flags),
+    ):
+        values = list(values)
+        clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+    return " AND ".join(clauses), params
+
+
+def count_dashboard_rows(conn, cities, codes, flags):
+    where, params = build_filter_clause(cities, codes, flags)
+    return conn.execute(f"SELECT COUNT(*) FROM DASHBOARD WHERE {where};", params).fetchone()[0]
+
+
+def fetch_dashboard_page(conn, cities, codes, flags, after_location_id=0, page_size=100):
+    # keyset pagination on location_id: each page starts after the last location_id of the
+    # previous one, so a page costs the same no matter how deep the user pages
+    where, params = build_filter_clause(cities, codes, flags)
+    query = f"""
+        SELECT {', '.join(DASHBOARD_COLUMNS)}
+        FROM DASHBOARD
+        WHERE {where} AND location_id > ?
+        ORDER BY location_id
+        LIMIT ?;
+    """
+    return pd.read_sql_query(query, conn, params=params + [after_location_id, page_size])
+
+
+def fetch_dashboard_rows(conn, cities, codes, flags):
+    # every row of the selection, e.g. for the export
+    where, params = build_filter_clause(cities, codes, flags)
+    query = f"""
+        SELECT {', '.join(DASHBOARD_COLUMNS)}
+        FROM DASHBOARD
+        WHERE {where}
+        ORDER BY location_id;
+    """
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def fetch_map_points(conn, cities, codes, flags, limit):
+    # the points drawn on the map, highest yearly energy first when the selection is capped
+    where, params = build_filter_clause(cities, codes, flags)
+    query = f"""
+        SELECT {', '.join(DASHBOARD_COLUMNS)}
+        FROM DASHBOARD
+        WHERE {where} AND latitude IS NOT NULL AND longitude IS NOT NULL
+        ORDER BY yearly_energy_dc_kwh DESC
+        LIMIT ?;
+    """
+    return pd.read_sql_query(query, conn, params=params + [limit])
+
+
+def prepare_dashboard_frame(df):
+    # turn DASHBOARD rows into the compact frame shown by the app
+    df = df.copy()
+    # add a new column for the age of solar imagery in years
+    df['age_of_solar_imagery(years)'] = pd.to_datetime('now').year - df['imagery_year']
+
+    # rename columns for better readability
+    df.rename(columns=DISPLAY_NAMES, inplace=True)
+
+    # reorder columns for better readability, the location_id is kept as the index
+    df.index = df['location_id']
+    df = df[DISPLAY_COLUMNS]
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    for column in INTEGER_COLUMNS:
+        # columns with missing values are float and stay as they are
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def google_maps_link(latitude, longitude):
+    return f'{MAPS_SEARCH_URL}{latitude},{longitude}'
+
+
+def add_maps_links(df):
+    # the frame with its Google Maps links, built column-wise for the export
+    df = df.copy()
+    df[MAPS_LINK_COLUMN] = MAPS_SEARCH_URL + df['Latitude'].astype(str) + ',' + df['Longitude'].astype(str)
+    return df
+
+
+def frame_bytes_per_row(df):
+    # memory of the frame per row including the index and the string data, for sizing app replicas
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
+
+
+### Start of snapshot methods ###
+# The same queries against the Arrow snapshot written by write_dashboard_snapshot.
+# The file is memory-mapped, so replicas on one host share the page cache and only the
+# rows of the requested page are turned into pandas.
+
+def open_dashboard_snapshot(path, dashboard_version):
+    # return the memory-mapped snapshot table, or None if it is missing or older than the database
+    if dashboard_version is None or not os.path.exists(path):
+        return None
+    try:
+        reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = reader.schema.metadata or {}
+    if metadata.get(b"dashboard_version") != str(dashboard_version).encode():
+        return None
+    return reader.read_all()
+
+
+def filter_snapshot(table, cities, codes, flags):
+    mask = pc.and_(
+        pc.and_(
+            pc.is_in(table["geocity"], value_set=pa.array(list(cities), pa.string())),
+            pc.is_in(table["dlgf_prop_class_code"], value_set=pa.array(list(codes), pa.int64())),
+        ),
+        pc.is_in(table["identified_as_disadvantaged"], value_set=pa.array(list(flags), pa.string())),
+    )
+    return table.filter(mask)
+
+
+def count_snapshot_rows(table, cities, codes, flags):
+    return filter_snapshot(table, cities, codes, flags).num_rows
+
+
+def fetch_snapshot_page(table, cities, codes, flags, after_location_id=0, page_size=100):
+    # the snapshot is written in location_id order, so a keyset page is a filter and a slice
+    rows = filter_snapshot(table, cities, codes, flags)
+    rows = rows.filter(pc.greater(rows["location_id"], after_location_id)).slice(0, page_size)
+    return rows.select(DASHBOARD_COLUMNS).to_pandas()
+
+
+def fetch_snapshot_rows(table, cities, codes, flags):
+    return filter_snapshot(table, cities, codes, flags).select(DASHBOARD_COLUMNS).to_pandas()
+
+
+def fetch_snapshot_map_points(table, cities, codes, flags, limit):
+    rows = filter_snapshot(table, cities, codes, flags)
+    rows = rows.filter(pc.and_(pc.is_valid(rows["latitude"]), pc.is_valid(rows["longitude"])))
+    rows = rows.take(pc.select_k_unstable(rows, k=min(limit, rows.num_rows), sort_keys=[("yearly_energy_dc_kwh", "descending")]))
+    return rows.select(DASHBOARD_COLUMNS).to_pandas()
+
+### End of snapshot methods ###
+
+
+### Start of rollup methods ###
+# Summaries read from the SOLAR_ROLLUP table kept by solar_database_current.py, so a statewide
+# total reads one row per (county, city, property code, flag) group instead of every location.
+
+# summary dimension -> SOLAR_ROLLUP column
+ROLLUP_DIMENSIONS = {
+    "county": "geocounty",
+    "city": "geocity",
+    "property_class": "dlgf_prop_class_code",
+    "disadvantaged": "identified_as_disadvantaged",
+}
+# SOLAR_ROLLUP totals, every one also gets a per-location mean in the summary
+ROLLUP_TOTALS = ["total_yearly_energy_dc_kwh", "total_co2_savings_tons", "total_houses_powered", "total_panels"]
+
+SUMMARY_DISPLAY_NAMES = {
+    'county': 'County',
+    'city': 'City',
+    'property_class': 'Property Code',
+    'disadvantaged': 'Disadvantaged Flag',
+    'site_count': 'Locations',
+    'total_yearly_energy_dc_kwh': 'Total Yearly Energy DC (kWh)',
+    'mean_yearly_energy_dc_kwh': 'Mean Yearly Energy DC (kWh)',
+    'total_co2_savings_tons': 'Total Annual CO2 Savings (tons)',
+    'mean_co2_savings_tons': 'Mean Annual CO2 Savings (tons)',
+    'total_houses_powered': 'Total Houses Powered',
+    'mean_houses_powered': 'Mean Houses Powered',
+    'total_panels': 'Total Panels',
+    'mean_panels': 'Mean Panels',
+}
+
+
+def fetch_solar_summary(conn, group_by=("county",), counties=(), cities=(), codes=(), flags=(), code_range=None):
+    # counts, totals and means of the rollup groups merged by the given dimensions.
+    # empty filters keep everything, flags are 'yes'/'no' like in DASHBOARD, code_range is (low, high)
+    unknown = set(group_by) - set(ROLLUP_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"unknown summary dimensions {sorted(unknown)}, expected some of {sorted(ROLLUP_DIMENSIONS)}")
+    clauses = []
+    params = []
+    for column, values in (
+        ("geocounty", counties),
+        ("geocity", cities),
+        ("dlgf_prop_class_code", codes),
+        ("identified_as_disadvantaged", [1 if flag == "yes" else 0 for flag in flags]),
+    ):
+        values = list(values)
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    if code_range is not None:
+        clauses.append("dlgf_prop_class_code BETWEEN ? AND ?")
+        params.extend(code_range)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    dimensions = [f"{ROLLUP_DIMENSIONS[name]} AS {name}" for name in group_by]
+    totals = [f"SUM({total}) AS {total}" for total in ROLLUP_TOTALS]
+    means = [f"SUM({total}) * 1.0 / SUM(site_count) AS {total.replace('total_', 'mean_', 1)}" for total in ROLLUP_TOTALS]
+    group = f"GROUP BY {', '.join(group_by)}" if group_by else ""
+    df = pd.read_sql_query(
+        f"""
+        SELECT {', '.join(dimensions + ['SUM(site_count) AS site_count'] + totals + means)}
+        FROM SOLAR_ROLLUP
+        {where}
+        {group}
+        HAVING SUM(site_count) > 0
+        ORDER BY total_yearly_energy_dc_kwh DESC;
+        """,
+        conn,
+        params=params,
+    )
+    if "disadvantaged" in df:
+        df["disadvantaged"] = df["disadvantaged"].map({1: "yes", 0: "no"})
+    return df
+
+### End of rollup methods ###
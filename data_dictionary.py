@@ -0,0 +1,129 @@
+# Data dictionary of the database: every table as a sheet of its columns, their types and what
+# they hold. Kept apart from solar_database_current.py so exporting it only needs the database
+# and pandas, not the whole pipeline or an API key:
+#
+#   python cli.py export-dictionary
+
+DATA_DICTIONARY_XLSX = "community_solar_database_data_dictionary.xlsx"
+# column definitions for the tables, by column name
+COLUMN_DEFINITIONS = {
+    "location_id": "The unique identifier for the location.",
+    "has_solar_data": "Indicates if solar data has been fetched for the location. 0: No data, 1: No solar data, 2: Solar data available.",
+    "latitude": "The latitude of the location.",
+    "longitude": "The longitude of the location.",
+    "dlgf_prop_class_code": "The property class code from the Indiana Department of Local Government Finance.",
+    "geofulladdress": "The full address of the location.",
+    "geocity": "The city of the location.",
+    "geostate": "The state of the location.",
+    "geozip": "The ZIP code of the location.",
+    "geocounty": "The county of the location.",
+    "geobg10": "The 2010 census block group of the location.",
+    "geobg20": "The 2020 census block group of the location.",
+    "source_key": "Hash of the address and coordinates that identifies the address point between extracts.",
+    "row_hash": "Hash of the source row, used to detect changed address points on refresh.",
+    "retired": "1 if the address point is no longer in the latest ArcGIS extract, 0 otherwise.",
+    "imagery_year": "The year of the imagery used for the solar data.",
+    "property_code_description": "The description of the property code of the location.",
+    "solar_id": "The unique identifier for the solar data.",
+    "location_id": "The unique identifier for the location associated with the solar data.",
+    "latitude": "The latitude of the location.",
+    "longitude": "The longitude of the location.",
+    "imagery_quality": "The quality of the imagery used for the solar data.",
+    "imagery_date": "The date of the imagery used for the solar data.",
+    "max_array_panels_count": "The maximum number of solar panels in the array.",
+    "panel_capacity_watts": "The capacity of each solar panel in watts.",
+    "nominal_power_watts": "The nominal power of the solar array in watts.",
+    "yearly_energy_dc_kwh": "The estimated yearly energy output of the solar array in kilowatt-hours.",
+    "carbon_offset_factor_kg_per_mwh": "The carbon offset factor in kilograms per megawatt-hour.",
+    "estimated_annual_co2_savings_tons": "The estimated annual CO2 savings in tons.",
+    "estimated_houses_powered": "The estimated number of houses powered by the solar array.",
+    "source_location_id": "The location whose findClosest call was reused for this nearby location, empty if it was fetched directly.",
+    "date_added": "The date the solar data was added to the database.",
+    "cejst_id": "The unique identifier for the CEJST data.",
+    "census_tract_2010_ID": "The 2010 census tract ID as an integer, on LOCATIONS it is derived from geobg10 when the row is loaded.",
+    "identified_as_disadvantaged": "Indicates if the census tract is identified as disadvantaged, 1 or 0 in CEJST and yes or no in DASHBOARD.",
+    "date_added": "The date the CEJST data was added to the database.",
+    "property_code_id": "The unique identifier for the property code.",
+    "property_code": "The property code.",
+    "description": "The description of the property code.",
+    "name": "The name of the property code.",
+    "date_added": "The date the property code was added to the database.",
+    "nonprofit_id": "The unique identifier for the nonprofit.",
+    "comp_name": "The registered name of the nonprofit.",
+    "address1": "The street address of the nonprofit.",
+    "city": "The city of the nonprofit.",
+    "zip": "The 5 digit ZIP code of the nonprofit.",
+    "contact_name": "The contact person of the nonprofit, if listed.",
+    "source_agency": "The agency the nonprofit record comes from, e.g. SOS.",
+    "ein": "The 9 digit IRS employer identification number of the nonprofit, if listed.",
+    "ruling_date": "The date (YYYY-MM-DD) of the IRS exemption ruling, the first of the month when only the month is known.",
+    "incorporation_date": "The date (YYYY-MM-DD) the nonprofit was incorporated with the Secretary of State.",
+    "asset_amount": "The total assets of the nonprofit in whole dollars, as last reported.",
+    "income_amount": "The total income of the nonprofit in whole dollars, as last reported.",
+    "revenue_amount": "The total revenue of the nonprofit in whole dollars, as last reported.",
+    "county": "The county export the nonprofit was read from.",
+    "address_key": "The normalized street, city, state and ZIP sent to the Census geocoder.",
+    "match_status": "The Census geocoder answer for the address: Match, No_Match or Tie.",
+    "match_type": "Exact or Non_Exact for matched addresses.",
+    "matched_address": "The address the Census geocoder matched.",
+    "geocoded_latitude": "The latitude the Census geocoder gives for the address.",
+    "geocoded_longitude": "The longitude the Census geocoder gives for the address.",
+    "date_geocoded": "The date the address was geocoded.",
+    "distance_m": "Distance in meters between the address point coordinates and the geocoded address.",
+    "coordinates_mismatch": "1 if the address point is further than the mismatch threshold from its geocoded address, empty if unmatched.",
+    "date_checked": "The date the location was checked against the geocoder.",
+    "score": "Weighted site score from 0 to 100, see site_ranking.py.",
+    "date_scored": "The date the site was last scored.",
+    "region_type": "The kind of leaderboard: state, county, city or property_class.",
+    "region": "The county, city or property class code the leaderboard ranks, Indiana for the state.",
+    "weights": "The score weights as JSON.",
+    "leaderboard_size": "Number of locations kept per leaderboard.",
+    "reference_year": "The year imagery age is measured from.",
+    "date_built": "The date the site scores were last rebuilt.",
+    "site_count": "Number of locations with solar data in the rollup group.",
+    "total_yearly_energy_dc_kwh": "Sum of the yearly energy output of the locations in the rollup group in kilowatt-hours.",
+    "total_co2_savings_tons": "Sum of the estimated annual CO2 savings of the locations in the rollup group in tons.",
+    "total_houses_powered": "Sum of the estimated houses powered by the locations in the rollup group.",
+    "total_panels": "Sum of the maximum solar panel counts of the locations in the rollup group.",
+    "reject_id": "The unique identifier for the rejected row.",
+    "table_name": "The table the rejected row was being loaded into.",
+    "row_data": "The rejected row as JSON.",
+    "error": "The SQLite error raised when inserting the row.",
+    "version": "Counter bumped on every DASHBOARD change, stored in the snapshot file to detect a stale copy.",
+    "date_updated": "The date the DASHBOARD rows last changed.",
+    "run_id": "The unique identifier for the solar backfill run.",
+    "status": "State of the backfill run: running, stopped, denied, failed or completed.",
+    "after_location_id": "Checkpoint of the backfill run, the queue is resumed after this location.",
+    "processed_locations": "Number of locations the backfill run wrote a result for.",
+    "api_calls": "Number of findClosest requests sent by the backfill run, cache hits excluded.",
+    "avoided_calls": "Number of findClosest requests saved by coalescing nearby locations.",
+    "denied_calls": "Number of 403 answers the backfill run received.",
+    "elapsed_seconds": "Time the backfill run has spent working, summed over resumes.",
+    "date_started": "The date the backfill run was started.",
+    "date_finished": "The date the backfill run last stopped, empty while it is running.",
+}
+
+
+def export_data_dictionary(conn, path=DATA_DICTIONARY_XLSX):
+    # pandas and xlsxwriter are only needed here, imported on first use
+    import pandas as pd
+    cursor = conn.cursor()
+    # retrieve all table names, skipping the R*Tree spatial index and its shadow tables
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'LOCATIONS_RTREE%';")
+    tables = [table[0] for table in cursor.fetchall()]
+    # create an Excel writer object using pandas
+    writer = pd.ExcelWriter(path, engine='xlsxwriter')
+    for table_name in tables:
+        # get the structure of the table using PRAGMA table_info
+        cursor.execute(f"PRAGMA table_info({table_name});")
+        columns = cursor.fetchall()
+        # add the column descriptions to the columns list
+        columns = [(col[0], col[1], col[2], col[3], col[4], col[5], COLUMN_DEFINITIONS.get(col[1], "")) for col in columns]
+        # each entry in columns is a tuple:
+        # (cid, column_name, data_type, notnull, default_value, pk)
+        df = pd.DataFrame(columns, columns=['cid', 'column_name', 'data_type', 'notnull', 'default_value', 'pk', 'column_definition'])
+        # write the DataFrame to a separate sheet named after the table
+        df.to_excel(writer, sheet_name=table_name, index=False)
+    # save the Excel file and close the writer
+    writer.close()
+    return tables
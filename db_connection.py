@@ -0,0 +1,106 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Shared SQLite connection layer for the pipeline and the Streamlit app.
+# The database runs in WAL mode, so readers see the last committed state while a fetch or a
+# refresh is writing and never wait for it, and a writer only waits (busy_timeout) for another
+# writer instead of failing with "database is locked". Every connection is opened through
+# connect() with the PRAGMAs of its role:
+#
+#   writer   the builder and the fetch jobs, one per process
+#   reader   read-only connections for the app, handed out by a ConnectionPool
+
+DB_PATH = "community_solar.db"
+ROLE_PRAGMAS = {
+    "writer": {
+        # persistent in the database file, set again on every open in case a copy came without it
+        "journal_mode": "WAL",
+        # in WAL mode NORMAL only risks the last commits on power loss, never corruption
+        "synchronous": "NORMAL",
+        "busy_timeout": 30000,
+        "cache_size": -65536,  # negative values are in KiB, so 64 MiB
+        "temp_store": "MEMORY",
+        # checkpoint every ~4 MiB of WAL and truncate the file back to 64 MiB after a checkpoint,
+        # so an overnight fetch does not grow the WAL without bound
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+    "reader": {
+        "busy_timeout": 5000,
+        "cache_size": -32768,
+        "temp_store": "MEMORY",
+        # read the database file through a memory map instead of copying pages into the cache
+        "mmap_size": 256 * 1024 * 1024,
+        "query_only": 1,
+    },
+}
+# readers kept open by a ConnectionPool, Streamlit runs one script thread per session
+READER_POOL_SIZE = 4
+
+
+def apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value};")
+
+
+def connect(path=DB_PATH, role="writer", check_same_thread=True):
+    # open a connection with the PRAGMAs of the given role, readers open the file read-only
+    if role not in ROLE_PRAGMAS:
+        raise ValueError(f"unknown connection role {role!r}, expected one of {sorted(ROLE_PRAGMAS)}")
+    timeout = ROLE_PRAGMAS[role]["busy_timeout"] / 1000
+    if role == "reader":
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=timeout, check_same_thread=check_same_thread)
+    else:
+        conn = sqlite3.connect(path, timeout=timeout, check_same_thread=check_same_thread)
+    apply_pragmas(conn, ROLE_PRAGMAS[role])
+    return conn
+
+
+class ConnectionPool:
+    # a few connections of one role reused across calls (and Streamlit reruns), opened on first use.
+    # a connection is only used by one thread at a time, the caller waits when all of them are busy
+    def __init__(self, path=DB_PATH, role="reader", size=READER_POOL_SIZE):
+        self.path = path
+        self.role = role
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            # never hand a connection back in the middle of a transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return connect(self.path, self.role, check_same_thread=False)
+                except sqlite3.Error:
+                    self.opened -= 1
+                    raise
+        return self.idle.get()
+
+    def close(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self.lock:
+                self.opened -= 1
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+import dashboard_queries
+
+# Exports of the dashboard selection as CSV, Parquet or GeoJSON.
+# A file is only written when it is asked for, from DASHBOARD in keyset-paged chunks, so a
+# statewide export never holds more than EXPORT_CHUNK_SIZE rows in memory. Finished files are
+# kept in EXPORT_DIR under a key of the format, the filters and the data version, and the least
+# recently used ones are deleted once there are more than EXPORT_CACHE_MAX_FILES or
+# EXPORT_CACHE_MAX_BYTES of them. ExportCache writes them on a background thread, so the app
+# stays usable while a large export is prepared.
+
+EXPORT_DIR = "exports"
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_CACHE_MAX_FILES = 32
+EXPORT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# exports written at the same time, the others wait in line
+EXPORT_WORKERS = 2
+# format -> (mime type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "geojson": ("application/geo+json", "geojson"),
+}
+
+# columns of every export, the app's columns plus the maps link
+EXPORT_COLUMNS = dashboard_queries.DISPLAY_COLUMNS + [dashboard_queries.MAPS_LINK_COLUMN]
+# fixed Parquet schema, the chunks may come out of pandas with different integer sizes or
+# with a float column where one chunk had a missing value
+EXPORT_SCHEMA = pa.schema([
+    (
+        column,
+        pa.int64() if column in dashboard_queries.INTEGER_COLUMNS
+        else pa.float64() if column in dashboard_queries.FLOAT_COLUMNS
+        else pa.string()
+    )
+    for column in EXPORT_COLUMNS
+])
+
+
+def iter_export_frames(conn, cities, codes, flags, chunk_size=EXPORT_CHUNK_SIZE):
+    # the selection as app frames with their maps links, one keyset page at a time.
+    # the first page is always yielded, so an empty selection still gets a header
+    after_location_id = 0
+    while True:
+        df = dashboard_queries.fetch_dashboard_page(conn, cities, codes, flags, after_location_id, chunk_size)
+        yield dashboard_queries.add_maps_links(dashboard_queries.prepare_dashboard_frame(df))
+        if len(df) < chunk_size:
+            break
+        after_location_id = int(df["location_id"].iloc[-1])
+
+
+def write_csv(frames, path):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        for number, frame in enumerate(frames):
+            frame.to_csv(file, header=number == 0, index=False)
+
+
+def write_parquet(frames, path):
+    with pq.ParquetWriter(path, EXPORT_SCHEMA) as writer:
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame, schema=EXPORT_SCHEMA, preserve_index=False))
+
+
+def write_geojson(frames, path):
+    # one Point feature per location, the other columns are its properties
+    with open(path, "w", encoding="utf-8") as file:
+        file.write('{"type": "FeatureCollection", "features": [\n')
+        separator = ""
+        for frame in frames:
+            properties = frame.drop(columns=["Latitude", "Longitude"])
+            properties = properties.astype(object).where(properties.notna(), None)
+            coordinates = zip(frame["Longitude"].tolist(), frame["Latitude"].tolist())
+            for (longitude, latitude), values in zip(coordinates, properties.to_dict("records")):
+                geometry = None
+                if not (math.isnan(longitude) or math.isnan(latitude)):
+                    geometry = {"type": "Point", "coordinates": [longitude, latitude]}
+                file.write(separator + json.dumps({"type": "Feature", "geometry": geometry, "properties": values}))
+                separator = ",\n"
+        file.write("\n]}\n")
+
+
+EXPORT_WRITERS = {
+    "csv": write_csv,
+    "parquet": write_parquet,
+    "geojson": write_geojson,
+}
+
+
+def export_key(export_format, version, cities, codes, flags):
+    # the same selection picked in another order is the same export
+    parts = [export_format, version] + [sorted(map(str, values)) for values in (cities, codes, flags)]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:32]
+
+
+class ExportCache:
+    # finished exports on disk with LRU eviction, and the exports being written right now.
+    # one instance is shared by every session of the app, so two users asking for the same
+    # selection share one file and one write
+    def __init__(self, directory=EXPORT_DIR, max_files=EXPORT_CACHE_MAX_FILES, max_bytes=EXPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, export_format, version, cities, codes, flags):
+        extension = EXPORT_FORMATS[export_format][1]
+        return os.path.join(self.directory, f"{export_key(export_format, version, cities, codes, flags)}.{extension}")
+
+    def get(self, export_format, version, cities, codes, flags):
+        # path of the finished export or None, a hit counts as a use for the LRU order
+        path = self.path(export_format, version, cities, codes, flags)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def pending_export(self, export_format, version, cities, codes, flags):
+        # the future of an export being written (or that failed), None if it was never asked for
+        with self.lock:
+            return self.pending.get(self.path(export_format, version, cities, codes, flags))
+
+    def request(self, open_connection, export_format, version, cities, codes, flags):
+        # start writing the export unless it is already done or under way, returns its future.
+        # open_connection is a context manager factory like ConnectionPool.connection
+        path = self.path(export_format, version, cities, codes, flags)
+        with self.lock:
+            future = self.pending.get(path)
+            if future is not None and not (future.done() and future.exception() is not None):
+                return future
+            if self.get(export_format, version, cities, codes, flags):
+                future = Future()
+                future.set_result(path)
+                return future
+            future = self.executor.submit(self.write, open_connection, path, export_format, cities, codes, flags)
+            self.pending[path] = future
+        return future
+
+    def write(self, open_connection, path, export_format, cities, codes, flags):
+        # written under a temporary name and renamed, so a half written file is never served
+        temp_path = f"{path}.part"
+        try:
+            with open_connection() as conn:
+                EXPORT_WRITERS[export_format](iter_export_frames(conn, cities, codes, flags), temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self.lock:
+            self.pending.pop(path, None)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        # delete the least recently used exports until both limits hold
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith(".part") or path == keep:
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            entries.sort()
+            total_bytes = sum(size for _, size, _ in entries)
+            if keep is not None and os.path.exists(keep):
+                total_bytes += os.path.getsize(keep)
+            count = len(entries) + (keep is not None)
+            for _, size, path in entries:
+                if count <= self.max_files and total_bytes <= self.max_bytes:
+                    break
+                os.remove(path)
+                count -= 1
+                total_bytes -= size
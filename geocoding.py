@@ -0,0 +1,91 @@
+import csv
+import io
+import os
+import re
+import time
+import requests
+
+# Census batch geocoder helpers for checking LOCATIONS coordinates against their addresses.
+# One POST sends a CSV of up to MAX_BATCH_SIZE addresses and gets one CSV line back per address:
+#
+#   "id","input address","Match","Exact","matched address","-87.171,41.435","tiger line id","L"
+#   "id","input address","No_Match"
+#
+# set CENSUS_GEOCODER_URL to point at another server, e.g. benchmarks/fake_census_geocoder.py
+
+CENSUS_GEOCODER_URL = os.environ.get(
+    "CENSUS_GEOCODER_URL", "https://geocoding.geo.census.gov/geocoder/locations/addressbatch"
+)
+CENSUS_BENCHMARK = "Public_AR_Current"
+# the endpoint refuses files with more addresses than this
+MAX_BATCH_SIZE = 10000
+# addresses per request, large files take minutes to answer so a few thousand is a better unit of retry
+GEOCODE_BATCH_SIZE = 2500
+GEOCODE_TIMEOUT_SECONDS = 600
+GEOCODE_MAX_ATTEMPTS = 3
+# geocoded points further than this from the address point are flagged as a mismatch
+GEOCODE_MISMATCH_M = 250
+
+
+def address_key(street, city, state, zip_code):
+    # normalized "STREET|CITY|STATE|ZIP" used as the geocode cache key
+    parts = [re.sub(r"\s+", " ", str(value or "")).strip().upper() for value in (street, city, state)]
+    parts.append(str(zip_code or "").strip()[:5])
+    return "|".join(parts)
+
+
+def address_keys(streets, cities, states, zip_codes):
+    # address_key for pandas Series of address parts, used when keying whole LOCATIONS chunks
+    parts = [
+        values.fillna("").astype(str).str.replace(r"\s+", " ", regex=True).str.strip().str.upper()
+        for values in (streets, cities, states)
+    ]
+    parts.append(zip_codes.fillna("").astype(str).str.strip().str[:5])
+    return parts[0] + "|" + parts[1] + "|" + parts[2] + "|" + parts[3]
+
+
+def build_batch_file(addresses):
+    # addresses are (id, street, city, state, zip) tuples, the file has no header line
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(addresses)
+    return buffer.getvalue()
+
+
+def parse_batch_response(text):
+    # {id: (match_status, match_type, matched_address, latitude, longitude)}, coordinates are None
+    # unless the address matched. the endpoint answers in its own order, not the order sent
+    results = {}
+    for row in csv.reader(io.StringIO(text)):
+        if len(row) < 3:
+            continue
+        record_id, match_status = row[0], row[2]
+        match_type = matched_address = latitude = longitude = None
+        if match_status == "Match" and len(row) >= 6:
+            match_type, matched_address = row[3], row[4]
+            longitude, latitude = (float(value) for value in row[5].split(","))
+        results[record_id] = (match_status, match_type, matched_address, latitude, longitude)
+    return results
+
+
+def geocode_batch(addresses, session=None, url=None, timeout=GEOCODE_TIMEOUT_SECONDS):
+    # send one batch, retried with a growing pause on connection errors and 5xx answers
+    if len(addresses) > MAX_BATCH_SIZE:
+        raise ValueError(f"the Census batch geocoder takes at most {MAX_BATCH_SIZE} addresses per request")
+    files = {"addressFile": ("addresses.csv", build_batch_file(addresses), "text/csv")}
+    data = {"benchmark": CENSUS_BENCHMARK}
+    for attempt in range(1, GEOCODE_MAX_ATTEMPTS + 1):
+        try:
+            response = (session or requests).post(url or CENSUS_GEOCODER_URL, files=files, data=data, timeout=timeout)
+            if response.status_code < 500:
+                response.raise_for_status()
+                return parse_batch_response(response.text)
+            error = f"HTTP {response.status_code}"
+        except requests.ConnectionError as e:
+            error = repr(e)
+        except requests.Timeout as e:
+            error = repr(e)
+        if attempt < GEOCODE_MAX_ATTEMPTS:
+            print(f"Geocoding batch failed ({error}), retrying in {10 * attempt} seconds.")
+            time.sleep(10 * attempt)
+    raise RuntimeError(f"Geocoding batch failed after {GEOCODE_MAX_ATTEMPTS} attempts: {error}")
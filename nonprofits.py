@@ -0,0 +1,173 @@
+import os
+import re
+import requests
+import pandas as pd
+from html.parser import HTMLParser
+
+# Parsing helpers for the Indiana nonprofit data, kept out of solar_database_current.py
+# so the worker processes of the nonprofit load only import pandas, not the whole pipeline.
+#
+# Every county file in downloads/named/ (e.g. Adams.csv) is a CSV export with three title
+# lines above the header. The files do not all spell their headers the same way, so each
+# one is mapped onto NONPROFITS_COLUMNS and typed before it is handed back for insertion.
+
+NONPROFITS_URL = "https://www.stats.indiana.edu/nonprofit/inp.aspx"
+# the scraped table of the nonprofit page
+NONPROFITS_SCRAPE_CSV = "nonprofit_data.csv"
+# one CSV export per county, named after the county
+NONPROFITS_DIR = os.path.join("downloads", "named")
+# title lines above the header of every county export
+NONPROFITS_SKIP_ROWS = 3
+# the columns of NONPROFITS, in insert order, with their SQLite types.
+# the *_date columns hold ISO dates (YYYY-MM-DD) as TEXT, so they sort and compare as dates
+NONPROFITS_COLUMNS = {
+    "comp_name": "TEXT",
+    "address1": "TEXT",
+    "city": "TEXT",
+    "zip": "TEXT",
+    "contact_name": "TEXT",
+    "source_agency": "TEXT",
+    "ein": "TEXT",
+    "ruling_date": "TEXT",
+    "incorporation_date": "TEXT",
+    "asset_amount": "INTEGER",
+    "income_amount": "INTEGER",
+    "revenue_amount": "INTEGER",
+    "county": "TEXT",
+}
+# typed columns, the exports that do not have them load NULL
+NONPROFITS_DATE_COLUMNS = ["ruling_date", "incorporation_date"]
+NONPROFITS_AMOUNT_COLUMNS = ["asset_amount", "income_amount", "revenue_amount"]
+# other spellings seen in the county exports, after lowercasing and replacing spaces with _
+NONPROFITS_HEADER_ALIASES = {
+    "name": "comp_name",
+    "organization_name": "comp_name",
+    "address": "address1",
+    "address_1": "address1",
+    "zip_code": "zip",
+    "zipcode": "zip",
+    "contact": "contact_name",
+    "agency": "source_agency",
+    "source": "source_agency",
+    "fein": "ein",
+    "employer_identification_number": "ein",
+    "ruling": "ruling_date",
+    "irs_ruling_date": "ruling_date",
+    "date_of_incorporation": "incorporation_date",
+    "date_incorporated": "incorporation_date",
+    "incorporated": "incorporation_date",
+    "asset_amt": "asset_amount",
+    "assets": "asset_amount",
+    "total_assets": "asset_amount",
+    "income_amt": "income_amount",
+    "income": "income_amount",
+    "revenue_amt": "revenue_amount",
+    "revenue": "revenue_amount",
+    "total_revenue": "revenue_amount",
+}
+
+
+def normalize_header(header):
+    key = re.sub(r"\s+", "_", str(header).strip().lower())
+    return NONPROFITS_HEADER_ALIASES.get(key, key)
+
+
+def parse_dates(values):
+    # ISO dates from the mixed spellings of the exports: 2019-03-01, 3/1/2019, and the IRS ruling
+    # month 201903 (taken as the first of the month). blanks and zeros ("0", "000000") become None
+    values = values.where(~values.str.fullmatch(r"0*"), "")
+    values = values.str.replace(r"^(\d{4})(\d{2})$", r"\1-\2-01", regex=True)
+    dates = pd.to_datetime(values, format="mixed", errors="coerce")
+    return [None if pd.isna(date) else date.strftime("%Y-%m-%d") for date in dates]
+
+
+def parse_amounts(values):
+    # whole dollars from "$1,234", "1234.0" or "(1,234)" (negative), anything else becomes None
+    values = values.str.replace(r"^\((.*)\)$", r"-\1", regex=True).str.replace(r"[$,\s]", "", regex=True)
+    amounts = pd.to_numeric(values, errors="coerce")
+    return [None if pd.isna(amount) else int(round(amount)) for amount in amounts]
+
+
+def list_county_files(directory=NONPROFITS_DIR):
+    # county exports in name order, so the load order (and nonprofit_id) is stable between runs
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(".csv")
+    )
+
+
+def parse_county_file(path):
+    # runs in a worker process: read one county export and return (county, rows) where rows are
+    # tuples in NONPROFITS_COLUMNS order, ready for executemany
+    county = os.path.basename(path).split(".")[0]
+    df = pd.read_csv(path, skiprows=NONPROFITS_SKIP_ROWS, dtype=str, keep_default_na=False)
+    df.columns = [normalize_header(col) for col in df.columns]
+    # a header spelled two ways in one file keeps the first column
+    df = df.loc[:, ~df.columns.duplicated()]
+    df = df.reindex(columns=list(NONPROFITS_COLUMNS), fill_value="")
+    for col in NONPROFITS_COLUMNS:
+        df[col] = df[col].str.strip()
+    df["county"] = county
+    # the export appends " ()" to names without a secondary name
+    df["comp_name"] = df["comp_name"].str.replace(r"\s*\(\)$", "", regex=True)
+    # 5 digit zip codes, ZIP+4 and zips read as numbers ("46733.0") included
+    df["zip"] = df["zip"].str.extract(r"^(\d{5})", expand=False).fillna("")
+    df["source_agency"] = df["source_agency"].str.upper()
+    df = df[df["comp_name"] != ""]
+    # 9 digit EINs, with or without the dash, and with the leading zero an export read as a number dropped
+    ein = df["ein"].str.replace(r"[-\s]", "", regex=True).str.replace(r"\.0$", "", regex=True)
+    df["ein"] = ein.where(ein.str.fullmatch(r"\d{8,9}"), "").str.zfill(9).replace("000000000", "")
+    columns = {col: df[col].tolist() for col in NONPROFITS_COLUMNS}
+    for col in NONPROFITS_DATE_COLUMNS:
+        columns[col] = parse_dates(df[col])
+    for col in NONPROFITS_AMOUNT_COLUMNS:
+        columns[col] = parse_amounts(df[col])
+    return county, list(zip(*(columns[col] for col in NONPROFITS_COLUMNS)))
+
+
+class HTMLTableParser(HTMLParser):
+    # collects the cell text of every row of the first <table>, th and td alike
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.depth = 0
+        self.done = False
+        self.row = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "table":
+            self.depth += 1
+        elif self.depth == 1 and tag == "tr":
+            self.row = []
+        elif self.depth == 1 and tag in ("td", "th") and self.row is not None:
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag == "table":
+            self.depth -= 1
+            self.done = self.depth == 0
+        elif self.depth == 1 and tag in ("td", "th") and self.cell is not None:
+            self.row.append(" ".join("".join(self.cell).split()))
+            self.cell = None
+        elif self.depth == 1 and tag == "tr" and self.row is not None:
+            if self.row:
+                self.rows.append(self.row)
+            self.row = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+
+def scrape_nonprofit_table(url=NONPROFITS_URL, session=None, timeout=60):
+    # plain HTTP version of the browser scrape, the page renders its table on the server
+    response = (session or requests).get(url, timeout=timeout)
+    response.raise_for_status()
+    parser = HTMLTableParser()
+    parser.feed(response.text)
+    parser.close()
+    return parser.rows
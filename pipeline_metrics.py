@@ -0,0 +1,274 @@
+import cProfile
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Lightweight instrumentation for the build and fetch pipeline.
+# Stages are wrapped in spans, API calls and other hot spots in timers, and counters keep
+# rows, requests, retries, 429s and cache hits. Spans and events are appended as JSON lines
+# to pipeline_metrics.jsonl, and the totals are written as a Prometheus text file
+# (pipeline_metrics.prom) that a node_exporter textfile collector can pick up.
+#
+# Profiling is switched on per stage with environment variables, no code changes needed:
+#   PIPELINE_PROFILE=load_locations,solar_fetch   stages (span names) to profile
+#   PIPELINE_PROFILE_MODE=cprofile|sample         cProfile .prof files or sampled collapsed stacks
+
+METRICS_LOG = "pipeline_metrics.jsonl"
+METRICS_SNAPSHOT = "pipeline_metrics.prom"
+PROFILE_DIR = "profiles"
+# prefix of every Prometheus metric name
+METRIC_PREFIX = "community_solar"
+# upper bounds of the timer histogram buckets in seconds
+TIMER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+# how often the sampling profiler looks at the stack
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def escape_label_value(value):
+    # the exposition format escapes backslash, double quote and newline in label values, in that order
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{escape_label_value(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def stage(name):
+    # decorator for pipeline methods, runs the method inside self.metrics.span(name)
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StackSampler:
+    # minimal sampling profiler: a background thread records the stack of the profiled
+    # thread every SAMPLE_INTERVAL_SECONDS, the result is written as collapsed stacks
+    # (one "frame;frame;frame count" per line) that flamegraph tools read directly
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.running = False
+        self.thread = None
+
+    def sample(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def stop(self, path):
+        self.running = False
+        self.thread.join()
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class PipelineMetrics:
+    def __init__(self, log_path=METRICS_LOG, snapshot_path=METRICS_SNAPSHOT, profile_stages=None,
+                 profile_mode=None, profile_dir=PROFILE_DIR, trace_timers=False):
+        # log_path / snapshot_path can be None to keep the metrics in memory only
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path
+        if profile_stages is None:
+            profile_stages = [stage for stage in os.environ.get("PIPELINE_PROFILE", "").split(",") if stage]
+        self.profile_stages = set(profile_stages)
+        self.profile_mode = profile_mode or os.environ.get("PIPELINE_PROFILE_MODE", "cprofile")
+        self.profile_dir = profile_dir
+        # write a JSON line for every timer observation too, e.g. every API call
+        self.trace_timers = trace_timers
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counters = collections.defaultdict(float)
+        # (name, labels) -> [count, sum, max, bucket counts]
+        self.timers = {}
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.profiling = False
+
+    ### Start of recording methods ###
+
+    def count(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, label_key(labels))] += value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                timer = self.timers[key] = [0, 0.0, 0.0, [0] * len(TIMER_BUCKETS)]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+            for index, bound in enumerate(TIMER_BUCKETS):
+                if seconds <= bound:
+                    timer[3][index] += 1
+                    break
+        if self.trace_timers:
+            self.event("timer", name=name, seconds=round(seconds, 6), labels=labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        # time a hot spot (e.g. one API call) without writing a JSON line for it
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, kind, **fields):
+        if not self.log_path:
+            return
+        record = {"ts": round(time.time(), 3), "run_id": self.run_id, "event": kind}
+        record.update(fields)
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            with open(self.log_path, "a") as file:
+                file.write(line)
+
+    @contextmanager
+    def span(self, name, **labels):
+        # time a pipeline stage, spans nest and the JSON line names the parent stage.
+        # when the outermost span ends the Prometheus snapshot is rewritten
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        profiler = self.start_profile(name)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.stop_profile(name, profiler)
+            stack.pop()
+            self.observe("stage_duration", seconds, stage=name)
+            self.count("stage_runs", stage=name, status=status)
+            self.event("span", name=name, parent=parent, seconds=round(seconds, 6), status=status, labels=labels)
+            if not stack:
+                self.write_snapshot()
+
+    ### End of recording methods ###
+
+    ### Start of profiling methods ###
+
+    def start_profile(self, name):
+        # only one profiler at a time, a profiled stage inside another one is part of the outer profile
+        if name not in self.profile_stages or self.profiling:
+            return None
+        self.profiling = True
+        if self.profile_mode == "sample":
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def stop_profile(self, name, profiler):
+        if profiler is None:
+            return
+        self.profiling = False
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        if isinstance(profiler, StackSampler):
+            path = os.path.join(self.profile_dir, f"{name}-{stamp}.collapsed")
+            profiler.stop(path)
+        else:
+            profiler.disable()
+            path = os.path.join(self.profile_dir, f"{name}-{stamp}.prof")
+            profiler.dump_stats(path)
+        self.event("profile", name=name, path=path, mode=self.profile_mode)
+
+    ### End of profiling methods ###
+
+    ### Start of export methods ###
+
+    def snapshot_lines(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timers = sorted((key, [value[0], value[1], value[2], list(value[3])]) for key, value in self.timers.items())
+        lines = []
+        declared = set()
+        for (name, key), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{format_labels(key)} {value:g}")
+        maximums = []
+        for (name, key), (count, total, maximum, buckets) in timers:
+            metric = f"{METRIC_PREFIX}_{name}_seconds"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            cumulative = 0
+            for bound, bucket in zip(TIMER_BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f"{metric}_bucket{format_labels(key, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{metric}_bucket{format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{metric}_sum{format_labels(key)} {total:.6f}")
+            lines.append(f"{metric}_count{format_labels(key)} {count}")
+            maximums.append((f"{metric}_max", key, maximum))
+        # the slowest observation of each timer, a separate gauge family as histograms have no max
+        for metric, key, maximum in maximums:
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} gauge")
+                declared.add(metric)
+            lines.append(f"{metric}{format_labels(key)} {maximum:.6f}")
+        return lines
+
+    def write_snapshot(self):
+        # written next to the target and renamed, so a collector never reads half a file
+        if not self.snapshot_path:
+            return
+        temp_path = self.snapshot_path + ".part"
+        with open(temp_path, "w") as file:
+            file.write("\n".join(self.snapshot_lines()) + "\n")
+        os.replace(temp_path, self.snapshot_path)
+
+    def summary(self):
+        # totals as plain dicts, e.g. for the benchmarks
+        with self.lock:
+            counters = {name + format_labels(key): value for (name, key), value in self.counters.items()}
+            timers = {
+                name + format_labels(key): {"count": value[0], "seconds": round(value[1], 6), "max": round(value[2], 6)}
+                for (name, key), value in self.timers.items()
+            }
+        return {"counters": counters, "timers": timers}
+
+    ### End of export methods ###
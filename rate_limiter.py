@@ -0,0 +1,42 @@
+import threading
+import time
+
+# Thread-safe token bucket used to share one API quota between many worker threads.
+# Tokens refill continuously at `rate_per_minute / 60` per second up to `capacity`,
+# and every request has to take one token before it is sent.
+class TokenBucket:
+    def __init__(self, rate_per_minute=300, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        # by default allow a burst of one second worth of requests
+        self.capacity = capacity if capacity is not None else max(1, int(self.rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+    def acquire(self, tokens=1):
+        # block until `tokens` are available (or a pause is over) and take them
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                else:
+                    wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # stop handing out tokens for a while, e.g. after the API answered 429,
+        # so every worker backs off together instead of each retrying on its own
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
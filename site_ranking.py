@@ -0,0 +1,168 @@
+import argparse
+import datetime
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# Weighted site score and per-region top-K leaderboards.
+# Every location with solar data gets a score between 0 and 100 in SITE_SCORES, and
+# LEADERBOARDS keeps the best LEADERBOARD_SIZE locations of every county, city, property
+# class and of the whole state. solar_database_current.py maintains both tables as solar
+# rows land, the app and the command line below only read the leaderboards:
+#
+#   python site_ranking.py top --by city --region INDIANAPOLIS -n 10
+#   python site_ranking.py rebuild --weight yearly_energy_dc_kwh=0.6 --weight identified_as_disadvantaged=0.4
+
+DB_PATH = "community_solar.db"
+# relative weight of every score input, they do not have to add up to 1
+SITE_SCORE_WEIGHTS = {
+    "yearly_energy_dc_kwh": 0.5,
+    "max_array_panels_count": 0.2,
+    "imagery_age_years": 0.1,
+    "identified_as_disadvantaged": 0.2,
+}
+# energy and panel counts span several orders of magnitude, they are scored on a log scale
+# that reaches 1 at these values, so one huge building does not flatten everyone else
+ENERGY_SCALE_KWH = 2000000
+PANELS_SCALE = 5000
+# imagery this old or older gets no freshness credit
+MAX_IMAGERY_AGE_YEARS = 10
+# locations kept per leaderboard
+LEADERBOARD_SIZE = 100
+# leaderboard region type -> SITE_SCORES column, None ranks the whole state
+LEADERBOARD_REGIONS = {
+    "state": None,
+    "county": "geocounty",
+    "city": "geocity",
+    "property_class": "dlgf_prop_class_code",
+}
+STATE_REGION = "Indiana"
+
+
+def as_floats(values):
+    # a column as a float array, None (NULL) becomes nan
+    return np.array(values, dtype=float)
+
+
+def normalized_inputs(columns, reference_year):
+    # every score input scaled to 0..1, missing values score 0.
+    # columns is a DataFrame or a dict of column -> list, both index the same way
+    energy = np.clip(np.nan_to_num(as_floats(columns["yearly_energy_dc_kwh"])), 0, None)
+    panels = np.clip(np.nan_to_num(as_floats(columns["max_array_panels_count"])), 0, None)
+    age = np.clip(reference_year - as_floats(columns["imagery_year"]), 0, None)
+    return {
+        "yearly_energy_dc_kwh": np.clip(np.log1p(energy) / np.log1p(ENERGY_SCALE_KWH), 0, 1),
+        "max_array_panels_count": np.clip(np.log1p(panels) / np.log1p(PANELS_SCALE), 0, 1),
+        "imagery_age_years": np.nan_to_num(1 - np.clip(age / MAX_IMAGERY_AGE_YEARS, 0, 1), nan=0.0),
+        "identified_as_disadvantaged": (np.nan_to_num(as_floats(columns["identified_as_disadvantaged"])) > 0).astype(float),
+    }
+
+
+def score_sites(columns, weights=None, reference_year=None):
+    # weighted mean of the normalized inputs, scaled to 0..100, for a whole batch of sites at once
+    weights = weights or SITE_SCORE_WEIGHTS
+    unknown = set(weights) - set(SITE_SCORE_WEIGHTS)
+    if unknown:
+        raise ValueError(f"unknown score inputs {sorted(unknown)}, expected some of {sorted(SITE_SCORE_WEIGHTS)}")
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("the score weights have to add up to more than 0")
+    inputs = normalized_inputs(columns, reference_year or datetime.date.today().year)
+    score = sum(inputs[name] * weight for name, weight in weights.items())
+    return np.round(score / total * 100, 4)
+
+
+def parse_weights(pairs):
+    # ["yearly_energy_dc_kwh=0.6", ...] from the command line -> weights dict, unset inputs weigh 0
+    if not pairs:
+        return None
+    weights = {name: 0.0 for name in SITE_SCORE_WEIGHTS}
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        if name not in weights:
+            raise ValueError(f"unknown score input {name!r}, expected one of {sorted(weights)}")
+        weights[name] = float(value)
+    return weights
+
+
+def get_ranking_version(conn):
+    # when the leaderboards were last rebuilt (e.g. with other weights), None before the first build.
+    # incremental updates move the DASHBOARD_VERSION instead, readers key their caches on both
+    try:
+        row = conn.execute("SELECT date_built FROM RANKING_CONFIG;").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def fetch_top_sites(conn, region_type="state", region=None, limit=10):
+    # the best locations of one region, read from its leaderboard (at most LEADERBOARD_SIZE rows)
+    if region_type not in LEADERBOARD_REGIONS:
+        raise ValueError(f"unknown region type {region_type!r}, expected one of {sorted(LEADERBOARD_REGIONS)}")
+    region = STATE_REGION if region_type == "state" else str(region)
+    return pd.read_sql_query(
+        """
+        SELECT
+            ROW_NUMBER() OVER (ORDER BY LEADERBOARDS.score DESC, LEADERBOARDS.location_id) AS rank,
+            LEADERBOARDS.location_id,
+            LEADERBOARDS.score,
+            LOCATIONS.geofulladdress,
+            LOCATIONS.geocity,
+            LOCATIONS.geocounty,
+            LOCATIONS.latitude,
+            LOCATIONS.longitude,
+            SITE_SCORES.dlgf_prop_class_code,
+            SITE_SCORES.yearly_energy_dc_kwh,
+            SITE_SCORES.max_array_panels_count,
+            SITE_SCORES.imagery_year,
+            SITE_SCORES.identified_as_disadvantaged
+        FROM LEADERBOARDS
+        JOIN SITE_SCORES ON SITE_SCORES.location_id = LEADERBOARDS.location_id
+        JOIN LOCATIONS ON LOCATIONS.location_id = LEADERBOARDS.location_id
+        WHERE LEADERBOARDS.region_type = ? AND LEADERBOARDS.region = ?
+        ORDER BY LEADERBOARDS.score DESC, LEADERBOARDS.location_id
+        LIMIT ?;
+        """,
+        conn,
+        params=(region_type, region, limit),
+    )
+
+
+def fetch_leaderboard_regions(conn, region_type):
+    # regions that have a leaderboard, for the dropdowns
+    return [
+        row[0] for row in conn.execute(
+            "SELECT DISTINCT region FROM LEADERBOARDS WHERE region_type = ? ORDER BY region;", (region_type,)
+        )
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read or rebuild the community solar site leaderboards.")
+    parser.add_argument("--db", default=DB_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    top = subparsers.add_parser("top", help="print the best sites of a region")
+    top.add_argument("--by", choices=list(LEADERBOARD_REGIONS), default="state")
+    top.add_argument("--region", default=None, help="county, city or property class code, not needed for --by state")
+    top.add_argument("-n", type=int, default=10)
+    rebuild = subparsers.add_parser("rebuild", help="score every site again, e.g. with other weights")
+    rebuild.add_argument("--weight", action="append", default=[], help="input=weight, inputs left out weigh 0")
+    rebuild.add_argument("--size", type=int, default=LEADERBOARD_SIZE, help="locations kept per leaderboard")
+    args = parser.parse_args()
+
+    if args.command == "top":
+        import db_connection
+        conn = db_connection.connect(args.db, role="reader")
+        if args.by != "state" and args.region is None:
+            parser.error(f"--region is needed with --by {args.by}, one of: {', '.join(map(str, fetch_leaderboard_regions(conn, args.by)))}")
+        with pd.option_context("display.width", 200, "display.max_columns", 20):
+            print(fetch_top_sites(conn, args.by, args.region, args.n).to_string(index=False))
+        conn.close()
+    else:
+        # the builder pulls in the whole pipeline, only load it for a rebuild
+        from solar_database_current import community_solarDatabase
+        db = community_solarDatabase(db_path=args.db, api_key="", solar_cache_path=None)
+        db.build_site_rankings(parse_weights(args.weight), args.size)
+        print(json.dumps(db.get_ranking_config()))
+        db.close()
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+# Persistent cache of raw Google Solar buildingInsights:findClosest responses.
+# Responses are stored zlib-compressed in their own SQLite file, keyed by a hash of the
+# request, so derived metrics can be recomputed without paying for the API calls again.
+# Only definitive answers are cached: 200 (building found) and 404 (no building found).
+CACHEABLE_STATUS_CODES = (200, 404)
+
+
+class SolarResponseCache:
+    def __init__(self, path="solar_cache.db", ttl_days=180, max_bytes=2 * 1024 ** 3):
+        self.ttl_seconds = ttl_days * 24 * 60 * 60 if ttl_days else None
+        self.max_bytes = max_bytes
+        # the cache is shared by the fetch worker threads, so guard the connection with a lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS SOLAR_RESPONSES (
+                cache_key TEXT PRIMARY KEY,
+                latitude REAL,
+                longitude REAL,
+                required_quality TEXT,
+                status_code INTEGER,
+                body BLOB,
+                size INTEGER,
+                fetched_at REAL,
+                last_used REAL
+            );
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_solar_responses_last_used ON SOLAR_RESPONSES (last_used);"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_solar_responses_fetched_at ON SOLAR_RESPONSES (fetched_at);"
+        )
+        self.conn.commit()
+        # keep a running total so puts do not have to sum the whole table
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM SOLAR_RESPONSES;"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(latitude, longitude, required_quality="HIGH"):
+        # the key only depends on what we send to the API, rounded to the precision of the source data
+        request = f"findClosest|{float(latitude):.7f}|{float(longitude):.7f}|{required_quality}"
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, latitude, longitude, required_quality="HIGH"):
+        # return (status_code, response_json) or None if the entry is missing or expired
+        cache_key = self.make_key(latitude, longitude, required_quality)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status_code, body, fetched_at FROM SOLAR_RESPONSES WHERE cache_key = ?;",
+                (cache_key,),
+            ).fetchone()
+            if row is None:
+                return None
+            status_code, body, fetched_at = row
+            if self.ttl_seconds and now - fetched_at > self.ttl_seconds:
+                self.total_bytes -= len(body)
+                self.conn.execute("DELETE FROM SOLAR_RESPONSES WHERE cache_key = ?;", (cache_key,))
+                self.conn.commit()
+                return None
+            self.conn.execute(
+                "UPDATE SOLAR_RESPONSES SET last_used = ? WHERE cache_key = ?;", (now, cache_key)
+            )
+            self.conn.commit()
+        return status_code, json.loads(zlib.decompress(body))
+
+    def put(self, latitude, longitude, status_code, solar_data, required_quality="HIGH"):
+        if status_code not in CACHEABLE_STATUS_CODES:
+            return
+        body = zlib.compress(json.dumps(solar_data, separators=(",", ":")).encode("utf-8"))
+        cache_key = self.make_key(latitude, longitude, required_quality)
+        now = time.time()
+        with self.lock:
+            previous = self.conn.execute(
+                "SELECT size FROM SOLAR_RESPONSES WHERE cache_key = ?;", (cache_key,)
+            ).fetchone()
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO SOLAR_RESPONSES (
+                    cache_key, latitude, longitude, required_quality, status_code, body, size, fetched_at, last_used
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+                """,
+                (
+                    cache_key,
+                    latitude,
+                    longitude,
+                    required_quality,
+                    status_code,
+                    body,
+                    len(body),
+                    now,
+                    now,
+                ),
+            )
+            self.conn.commit()
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # drop expired entries first, then the least recently used ones
+        # down to 90% of the limit so we do not evict on every single put
+        if self.ttl_seconds:
+            self.conn.execute(
+                "DELETE FROM SOLAR_RESPONSES WHERE fetched_at < ?;", (time.time() - self.ttl_seconds,)
+            )
+            self.total_bytes = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM SOLAR_RESPONSES;"
+            ).fetchone()[0]
+        target = self.max_bytes * 0.9
+        cursor = self.conn.execute("SELECT cache_key, size FROM SOLAR_RESPONSES ORDER BY last_used;")
+        evicted = []
+        for cache_key, size in cursor:
+            if self.total_bytes <= target:
+                break
+            evicted.append((cache_key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM SOLAR_RESPONSES WHERE cache_key = ?;", evicted)
+        self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM SOLAR_RESPONSES;").fetchone()[0]
+        return {"entries": entries, "bytes": self.total_bytes}
+
+    def close(self):
+        self.conn.close()
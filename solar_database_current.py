@@ -1,28 +1,479 @@
 import requests
 import sqlite3
 import time
+import numpy as np
 import pandas as pd
 import os
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 import csv
-import time
+import itertools
+import json
+import datetime
+from contextlib import contextmanager
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from rate_limiter import TokenBucket
+from solar_cache import SolarResponseCache
+from solar_workers import (
+    MAX_RATE_LIMITED, RATE_LIMIT_PAUSE_SECONDS, RETRYABLE_STATUS_CODES, SERVER_ERROR_PAUSE_SECONDS,
+    UNANSWERED_STATUS_CODES, request_solar_data, load_api_keys, solar_fetch_worker,
+)
+from pipeline_metrics import PipelineMetrics, stage
+from db_connection import connect
+from dashboard_queries import fetch_solar_summary
+from data_dictionary import DATA_DICTIONARY_XLSX, export_data_dictionary
+# pyarrow and the geocoding, nonprofits and site ranking helpers are imported by the methods that
+# use them, so a command that never writes a snapshot or ranks sites does not load them
+import multiprocessing
+import queue
+import sys
+from collections import defaultdict, deque
+
+# PRAGMAs applied while the tables are (re)built, the previous values are restored afterwards.
+# the journal stays in WAL mode (see db_connection.py) so the app can keep reading during a rebuild,
+# with synchronous OFF a power loss can only cost the last commits of the load
+LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "cache_size": -262144,  # negative values are in KiB, so 256 MiB
+    "temp_store": "MEMORY",
+}
+# number of rows handed to executemany per transaction
+LOAD_CHUNK_SIZE = 50000
+
+# the ArcGIS address point export and the columns we keep from it
+LOCATIONS_CSV = "locations_data.csv"
+LOCATIONS_COLUMNS = [
+    "latitude",
+    "longitude",
+    "dlgf_prop_class_code",
+    "geofulladdress",
+    "geocity",
+    "geostate",
+    "geozip",
+    "geocounty",
+    "geobg10",
+    "geobg20"
+]
+# read the codes as text so zip codes and block groups are not turned into floats
+LOCATIONS_DTYPES = {
+    "latitude": "float64",
+    "longitude": "float64",
+    "geofulladdress": str,
+    "geocity": str,
+    "geostate": str,
+    "geozip": str,
+    "geocounty": str,
+    "geobg10": str,
+    "geobg20": str,
+}
+# columns that identify an address point between two extracts, a point whose address or
+# coordinates change is treated as retired + new so its solar data is fetched again
+LOCATIONS_KEY_COLUMNS = ["geofulladdress", "geocity", "geozip", "latitude", "longitude"]
+# columns added to LOCATIONS to support delta refreshes
+LOCATIONS_REFRESH_COLUMNS = {
+    "source_key": "INTEGER",
+    "row_hash": "INTEGER",
+    "retired": "INTEGER DEFAULT 0",
+}
+# integer 2010 census tract key derived from geobg10 at ingest, the CEJST join probes it
+# instead of cutting SUBSTR(geobg10, 1, 11) out of every row
+LOCATIONS_TRACT_COLUMNS = {"census_tract_2010_ID": "INTEGER"}
+# columns written by the loaders, in the order of the tuples from iter_locations_rows
+LOCATIONS_LOAD_COLUMNS = LOCATIONS_COLUMNS + ["source_key", "row_hash", "census_tract_2010_ID"]
+# the CEJST download and the two columns we keep from it, the other columns are never parsed
+CEJST_CSV = "cejst_data.csv"
+CEJST_COLUMNS = {
+    "Census tract 2010 ID": "census_tract_2010_ID",
+    "Identified as disadvantaged": "identified_as_disadvantaged",
+}
+# 2010 census tract ids start with the state FIPS code, the national file is filtered to Indiana
+INDIANA_FIPS = "18"
+# PRAGMAs for an incremental refresh, this keeps the usual durability because the database holds paid-for API results
+REFRESH_PRAGMAS = {"cache_size": -262144}
+
+# candidate points closer than this share one findClosest call (see group_solar_candidates)
+COALESCE_RADIUS_M = 10
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LATITUDE = 111320
+
+# bytes read from the network per chunk when streaming downloads
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# secondary indexes created by the builder, as (table, statement) pairs
+INDEXES = [
+    # partial index over the 6xx property classes, ordered by location_id, that backs the solar work queue
+    ("LOCATIONS", """
+        CREATE INDEX IF NOT EXISTS idx_locations_solar_queue
+        ON LOCATIONS (has_solar_data, location_id)
+        WHERE dlgf_prop_class_code BETWEEN 600 AND 699;
+    """),
+    ("LOCATIONS", "CREATE INDEX IF NOT EXISTS idx_locations_geocity ON LOCATIONS (geocity);"),
+    ("LOCATIONS", "CREATE INDEX IF NOT EXISTS idx_locations_source_key ON LOCATIONS (source_key);"),
+    ("GOOGLE_SOLAR", "CREATE INDEX IF NOT EXISTS idx_google_solar_location_id ON GOOGLE_SOLAR (location_id);"),
+    ("CEJST", "CREATE INDEX IF NOT EXISTS idx_cejst_census_tract ON CEJST (census_tract_2010_ID);"),
+    ("PROPERTY_CODES", "CREATE INDEX IF NOT EXISTS idx_property_codes_property_code ON PROPERTY_CODES (property_code);"),
+    ("DASHBOARD", "CREATE INDEX IF NOT EXISTS idx_dashboard_filters ON DASHBOARD (geocity, dlgf_prop_class_code, identified_as_disadvantaged);"),
+    # one (region, score) index per leaderboard region type, so a board is refilled from K index entries
+    ("SITE_SCORES", "CREATE INDEX IF NOT EXISTS idx_site_scores_score ON SITE_SCORES (score DESC, location_id);"),
+    ("SITE_SCORES", "CREATE INDEX IF NOT EXISTS idx_site_scores_county ON SITE_SCORES (geocounty, score DESC, location_id);"),
+    ("SITE_SCORES", "CREATE INDEX IF NOT EXISTS idx_site_scores_city ON SITE_SCORES (geocity, score DESC, location_id);"),
+    ("SITE_SCORES", "CREATE INDEX IF NOT EXISTS idx_site_scores_property_class ON SITE_SCORES (dlgf_prop_class_code, score DESC, location_id);"),
+    ("LEADERBOARDS", "CREATE INDEX IF NOT EXISTS idx_leaderboards_score ON LEADERBOARDS (region_type, region, score DESC, location_id);"),
+]
+
+# denormalized rows behind the Streamlit dashboard, one per 6xx location with solar data
+# the imagery year, cleaned imagery quality and disadvantaged flag are computed here
+# once instead of on every load_data call
+DASHBOARD_SELECT = """
+    SELECT 
+        LOCATIONS.location_id,
+        LOCATIONS.latitude,
+        LOCATIONS.longitude,
+        LOCATIONS.dlgf_prop_class_code,
+        LOCATIONS.geofulladdress,
+        LOCATIONS.geocity,
+        LOCATIONS.geozip,
+        LOCATIONS.geocounty,
+        LOCATIONS.census_tract_2010_ID,
+        LOWER(REPLACE(GOOGLE_SOLAR.imagery_quality, ' ', '_')) AS imagery_quality,
+        CAST(SUBSTR(GOOGLE_SOLAR.imagery_date, 7, 4) AS INTEGER) AS imagery_year,
+        GOOGLE_SOLAR.max_array_panels_count,
+        GOOGLE_SOLAR.panel_capacity_watts,
+        GOOGLE_SOLAR.nominal_power_watts,
+        GOOGLE_SOLAR.yearly_energy_dc_kwh,
+        GOOGLE_SOLAR.carbon_offset_factor_kg_per_mwh,
+        GOOGLE_SOLAR.estimated_annual_co2_savings_tons,
+        GOOGLE_SOLAR.estimated_houses_powered,
+        PROPERTY_CODES.description AS property_code_description,
+        CASE WHEN CEJST.identified_as_disadvantaged = 1 THEN 'yes' ELSE 'no' END AS identified_as_disadvantaged
+    FROM 
+        LOCATIONS
+    INNER JOIN 
+        GOOGLE_SOLAR
+    ON
+        GOOGLE_SOLAR.location_id = LOCATIONS.location_id 
+    INNER JOIN 
+        PROPERTY_CODES
+    ON
+        LOCATIONS.dlgf_prop_class_code = PROPERTY_CODES.property_code
+    LEFT JOIN
+        CEJST
+    ON
+        LOCATIONS.census_tract_2010_ID = CEJST.census_tract_2010_ID
+    WHERE 
+        LOCATIONS.dlgf_prop_class_code BETWEEN 600 AND 699
+    AND
+        LOCATIONS.retired = 0
+"""
+
+# score inputs of every location with solar data, see site_ranking.py for the score itself
+SITE_SCORE_SELECT = """
+    SELECT
+        LOCATIONS.location_id,
+        LOCATIONS.geocounty,
+        LOCATIONS.geocity,
+        LOCATIONS.dlgf_prop_class_code,
+        GOOGLE_SOLAR.yearly_energy_dc_kwh,
+        GOOGLE_SOLAR.max_array_panels_count,
+        CAST(SUBSTR(GOOGLE_SOLAR.imagery_date, 7, 4) AS INTEGER) AS imagery_year,
+        COALESCE(CEJST.identified_as_disadvantaged, 0) AS identified_as_disadvantaged
+    FROM
+        LOCATIONS
+    INNER JOIN
+        GOOGLE_SOLAR
+    ON
+        GOOGLE_SOLAR.location_id = LOCATIONS.location_id
+    LEFT JOIN
+        CEJST
+    ON
+        LOCATIONS.census_tract_2010_ID = CEJST.census_tract_2010_ID
+    WHERE
+        LOCATIONS.retired = 0
+"""
+SITE_SCORES_COLUMNS = [
+    "location_id", "geocounty", "geocity", "dlgf_prop_class_code", "score",
+    "yearly_energy_dc_kwh", "max_array_panels_count", "imagery_year", "identified_as_disadvantaged",
+]
+
+# SOLAR_ROLLUP sums the solar rows of every (county, city, property code, disadvantaged flag)
+# group, so statewide summaries read a few thousand groups instead of every location.
+# missing keys are stored as '' and 0, the key columns of a WITHOUT ROWID table can not be NULL
+ROLLUP_KEYS = ["geocounty", "geocity", "dlgf_prop_class_code", "identified_as_disadvantaged"]
+# SOLAR_ROLLUP total -> the per-location value it sums
+ROLLUP_TOTALS = {
+    "total_yearly_energy_dc_kwh": "yearly_energy_dc_kwh",
+    "total_co2_savings_tons": "estimated_annual_co2_savings_tons",
+    "total_houses_powered": "estimated_houses_powered",
+    "total_panels": "max_array_panels_count",
+}
+# what every location contributes to its group, kept in SOLAR_ROLLUP_LOCATIONS so a changed
+# location can be taken out of the group it was counted in before it is added to its new one
+ROLLUP_SELECT = """
+    SELECT
+        LOCATIONS.location_id,
+        COALESCE(LOCATIONS.geocounty, '') AS geocounty,
+        COALESCE(LOCATIONS.geocity, '') AS geocity,
+        COALESCE(LOCATIONS.dlgf_prop_class_code, 0) AS dlgf_prop_class_code,
+        COALESCE(CEJST.identified_as_disadvantaged, 0) AS identified_as_disadvantaged,
+        COALESCE(GOOGLE_SOLAR.yearly_energy_dc_kwh, 0) AS yearly_energy_dc_kwh,
+        COALESCE(GOOGLE_SOLAR.estimated_annual_co2_savings_tons, 0) AS estimated_annual_co2_savings_tons,
+        COALESCE(GOOGLE_SOLAR.estimated_houses_powered, 0) AS estimated_houses_powered,
+        COALESCE(GOOGLE_SOLAR.max_array_panels_count, 0) AS max_array_panels_count
+    FROM
+        LOCATIONS
+    INNER JOIN
+        GOOGLE_SOLAR
+    ON
+        GOOGLE_SOLAR.location_id = LOCATIONS.location_id
+    LEFT JOIN
+        CEJST
+    ON
+        LOCATIONS.census_tract_2010_ID = CEJST.census_tract_2010_ID
+    WHERE
+        LOCATIONS.retired = 0
+"""
+
+# columnar copy of DASHBOARD written next to the database, the app memory-maps it instead of
+# running the SQL query on every cold start. it is an uncompressed Arrow IPC file so it can be
+# read zero-copy, and it carries the DASHBOARD_VERSION it was written from in its metadata
+DASHBOARD_SNAPSHOT = "dashboard_snapshot.arrow"
+DASHBOARD_SNAPSHOT_COLUMNS = [
+    ("location_id", "int64"),
+    ("latitude", "float64"),
+    ("longitude", "float64"),
+    ("dlgf_prop_class_code", "int64"),
+    ("geofulladdress", "string"),
+    ("geocity", "string"),
+    ("geozip", "string"),
+    ("geocounty", "string"),
+    ("census_tract_2010_ID", "int64"),
+    ("imagery_quality", "string"),
+    ("imagery_year", "int64"),
+    ("max_array_panels_count", "int64"),
+    ("panel_capacity_watts", "int64"),
+    ("nominal_power_watts", "int64"),
+    ("yearly_energy_dc_kwh", "float64"),
+    ("carbon_offset_factor_kg_per_mwh", "float64"),
+    ("estimated_annual_co2_savings_tons", "float64"),
+    ("estimated_houses_powered", "float64"),
+    ("property_code_description", "string"),
+    ("identified_as_disadvantaged", "string"),
+]
+
+# single Google Solar API key, read when the first request is about to be sent
+API_KEY_FILE = "google_api_key.txt"
+
+# constants used to derive the GOOGLE_SOLAR metrics from a findClosest response
+DEFAULT_PANEL_CAPACITY_WATTS = 300
+# fallback sunshine hours and system derate used when no panel config reports its yearly energy
+DEFAULT_SUNSHINE_HOURS_PER_YEAR = 1000
+FALLBACK_DERATE = 0.8
+# CO2 savings in tons per kWh based on EPA estimate
+CO2_TONS_PER_KWH = 0.000699
+# yearly usage of an average US house in kWh
+KWH_PER_HOUSE = 10566
+
+# processed solar fields and the GOOGLE_SOLAR columns they are stored in
+GOOGLE_SOLAR_FIELDS = {
+    "imageryQuality": "imagery_quality",
+    "imageryDate": "imagery_date",
+    "maxArrayPanelsCount": "max_array_panels_count",
+    "panelCapacityWatts": "panel_capacity_watts",
+    "nominalPowerWatts": "nominal_power_watts",
+    "yearlyEnergyDcKwh": "yearly_energy_dc_kwh",
+    "carbonOffsetFactorKgPerMwh": "carbon_offset_factor_kg_per_mwh",
+    "estimatedAnnualCO2SavingsTons": "estimated_annual_co2_savings_tons",
+    "estimatedHousesPowered": "estimated_houses_powered",
+}
+
+# locations still waiting for a findClosest call, as an anti-join against GOOGLE_SOLAR
+# the property class filter has to match the WHERE clause of idx_locations_solar_queue exactly
+SOLAR_CANDIDATES_QUERY = """
+    SELECT 
+        location_id, latitude, longitude, has_solar_data
+    FROM 
+        LOCATIONS 
+    WHERE 
+        has_solar_data = :has_solar_data
+    AND 
+        dlgf_prop_class_code BETWEEN 600 AND 699
+    AND 
+        location_id > :after_location_id
+    AND 
+        retired = 0
+    AND 
+        NOT EXISTS (
+            SELECT 1 FROM GOOGLE_SOLAR WHERE GOOGLE_SOLAR.location_id = LOCATIONS.location_id
+        )
+    ORDER BY 
+        location_id 
+    LIMIT 
+        :limit
+"""
+
+# size of the work queue, same filter as SOLAR_CANDIDATES_QUERY without the keyset and the limit
+SOLAR_QUEUE_COUNT_QUERY = """
+    SELECT 
+        COUNT(*)
+    FROM 
+        LOCATIONS 
+    WHERE 
+        has_solar_data = :has_solar_data
+    AND 
+        dlgf_prop_class_code BETWEEN 600 AND 699
+    AND 
+        location_id > :after_location_id
+    AND 
+        retired = 0
+    AND 
+        NOT EXISTS (
+            SELECT 1 FROM GOOGLE_SOLAR WHERE GOOGLE_SOLAR.location_id = LOCATIONS.location_id
+        )
+"""
+# same queue with the county of each location, used to cut the work into per-county shards
+SOLAR_SHARD_CANDIDATES_QUERY = """
+    SELECT 
+        location_id, latitude, longitude, has_solar_data, geocounty
+    FROM 
+        LOCATIONS 
+    WHERE 
+        has_solar_data = :has_solar_data
+    AND 
+        dlgf_prop_class_code BETWEEN 600 AND 699
+    AND 
+        location_id > :after_location_id
+    AND 
+        retired = 0
+    AND 
+        NOT EXISTS (
+            SELECT 1 FROM GOOGLE_SOLAR WHERE GOOGLE_SOLAR.location_id = LOCATIONS.location_id
+        )
+    ORDER BY 
+        location_id 
+    LIMIT 
+        :limit
+"""
+# address points still waiting for a geocode check, in location_id order
+GEOCODE_CANDIDATES_QUERY = """
+    SELECT location_id, geofulladdress, geocity, geostate, geozip, latitude, longitude
+    FROM LOCATIONS
+    WHERE location_id > :after_location_id
+    AND retired = 0
+    AND geofulladdress != ''
+    AND dlgf_prop_class_code BETWEEN :min_property_code AND :max_property_code
+    {filters}
+    ORDER BY location_id
+    LIMIT :limit
+"""
+
+# a backfill stops after this many 403 answers in a row, a single one is often transient
+MAX_CONSECUTIVE_DENIED = 3
+# SOLAR_RUNS statuses a run can be resumed from
+RESUMABLE_RUN_STATUSES = ("running", "stopped", "denied", "failed")
+
+def round_like_python(values, digits=2):
+    # np.round scales by 10**digits first, which can land on the other side of a .5 tie
+    # than Python's round() does, so redo the (rare) near-tie values with round()
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, digits)
+    scaled = values * 10 ** digits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[near_tie] = [round(value, digits) for value in values[near_tie].tolist()]
+    return rounded
+
+def haversine_m(latitude1, longitude1, latitude2, longitude2):
+    # great-circle distance in meters, works on scalars and numpy arrays alike
+    latitude1, longitude1, latitude2, longitude2 = (
+        np.radians(np.asarray(value, dtype=np.float64)) for value in (latitude1, longitude1, latitude2, longitude2)
+    )
+    a = (
+        np.sin((latitude2 - latitude1) / 2) ** 2
+        + np.cos(latitude1) * np.cos(latitude2) * np.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def hash_locations(df):
+    # return (source_key, row_hash) for a frame of LOCATIONS_COLUMNS as signed 64-bit integers
+    # values are normalized first so rows read back from SQLite hash the same as rows from the CSV
+    normalized = pd.DataFrame(index=df.index)
+    for col in LOCATIONS_COLUMNS:
+        if col in ("latitude", "longitude"):
+            normalized[col] = pd.to_numeric(df[col], errors="coerce").astype("float64").round(7)
+        elif col == "dlgf_prop_class_code":
+            # to_numeric gives int64 for a chunk without missing codes and float64 for one with any,
+            # and 640 and 640.0 hash differently, so whole codes are always hashed as nullable integers
+            codes = pd.to_numeric(df[col], errors="coerce")
+            normalized[col] = codes.astype("Int64") if (codes.dropna() % 1 == 0).all() else codes.astype("float64")
+        else:
+            normalized[col] = df[col].fillna("").astype(str).astype(object)
+    source_key = pd.util.hash_pandas_object(normalized[LOCATIONS_KEY_COLUMNS], index=False)
+    row_hash = pd.util.hash_pandas_object(normalized, index=False)
+    return source_key.to_numpy().view(np.int64), row_hash.to_numpy().view(np.int64)
+
+def tract_keys(geobg10):
+    # integer 2010 census tract key (state + county + tract, the first 11 digits of the block group)
+    # for a series of geobg10 values, None where the block group is missing or malformed
+    tract = geobg10.fillna("").astype(str).str[:11]
+    valid = tract.str.fullmatch(r"[0-9]{11}")
+    return [int(value) if ok else None for value, ok in zip(tract.tolist(), valid.tolist())]
 
 # This script is designed to scrape data from the Indiana Map and the Indiana Nonprofit database,
 # and store it in a SQLite database. It also interacts with the Google Solar API to fetch solar data for locations.
 class community_solarDatabase:
-    def __init__(self):
-        self.conn = sqlite3.connect("community_solar.db")
+    def __init__(self, db_path="community_solar.db", api_key=None, solar_cache_path="solar_cache.db", metrics=None):
+        # the connection, the API key and the solar cache are only opened when a method first
+        # needs them, so e.g. exporting the data dictionary does not need a key file
+        self.db_path = db_path
+        self._conn = None
+        self._api_key = api_key
+        self.solar_cache_path = solar_cache_path
+        self._solar_cache = None
+        # stage timings and counters go to pipeline_metrics.jsonl and pipeline_metrics.prom
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        # number of findClosest requests actually sent, cache hits are not counted.
+        # the concurrent fetch sends from several threads, so it is only changed under the lock
+        self.api_calls = 0
+        self.api_calls_lock = threading.Lock()
+
+    @property
+    def conn(self):
+        # the writer connection, in WAL mode with a busy timeout so app readers never block it
+        if self._conn is None:
+            self._conn = connect(self.db_path, role="writer")
+        return self._conn
+
+    @conn.setter
+    def conn(self, conn):
+        self._conn = conn
+
+    @property
+    def api_key(self):
         # you need to create a file called google_api_key.txt and put your google api key in it
-        self.api_key = open("google_api_key.txt", "r").read().strip()
+        # unless a key is passed in (e.g. by the benchmarks)
+        if self._api_key is None:
+            with open(API_KEY_FILE, "r") as file:
+                self._api_key = file.read().strip()
+        return self._api_key
+
+    @api_key.setter
+    def api_key(self, api_key):
+        self._api_key = api_key
+
+    @property
+    def solar_cache(self):
+        # raw findClosest responses are kept in solar_cache.db so metrics can be recomputed offline
+        if self._solar_cache is None and self.solar_cache_path:
+            self._solar_cache = SolarResponseCache(self.solar_cache_path)
+        return self._solar_cache
+
+    @solar_cache.setter
+    def solar_cache(self, solar_cache):
+        self._solar_cache = solar_cache
+        if solar_cache is None:
+            self.solar_cache_path = None
 
     ### Start of locations table methods ###
 
+    @stage("download_locations")
     def get_locations_data(self):
         # Source page: https://www.indianamap.org/datasets/INMap::address-points-of-indiana-current/explore?location=39.705743%2C-86.396120%2C7.96
         url = "https://hub.arcgis.com/api/download/v1/items/9b222d07cc164eb384a24742cbf1d274/csv?redirect=false&layers=0"
@@ -41,37 +492,75 @@ class community_solarDatabase:
             # wait for 5 seconds and retry if the status is not "Completed"
             else:
                 print(f"Status is '{data.get('status')}'. Waiting and retrying...")
+                self.metrics.count("arcgis_export_polls")
                 time.sleep(5)
         # download the CSV file from the result URL
-        csv_response = requests.get(result_url)
-        if csv_response.ok:
-            self.process_locations_data(csv_response)
-            print("CSV file downloaded and saved as 'locations_data.csv'.")
+        if self.download_locations_data(result_url):
+            print(f"CSV file downloaded and saved as '{LOCATIONS_CSV}'.")
+
+    def download_locations_data(self, result_url, path=LOCATIONS_CSV, max_attempts=5):
+        # stream the export to a partial file in chunks so memory stays flat,
+        # and resume from where we stopped if the transfer is interrupted
+        part_path = path + ".part"
+        validator_path = part_path + ".validator"
+        for attempt in range(1, max_attempts + 1):
+            headers = {}
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if offset and os.path.exists(validator_path):
+                # only resume if the file on the server has not changed since the partial download
+                with open(validator_path, "r") as file:
+                    headers["Range"] = f"bytes={offset}-"
+                    headers["If-Range"] = file.read().strip()
+            try:
+                with requests.get(result_url, headers=headers, stream=True, timeout=60) as csv_response:
+                    if csv_response.status_code == 416:
+                        # the partial file already holds the whole export
+                        break
+                    if not csv_response.ok:
+                        print("Failed to download CSV. Status code:", csv_response.status_code)
+                        return False
+                    # 206 means the server honoured the range, anything else restarts the file
+                    mode = "ab" if csv_response.status_code == 206 else "wb"
+                    validator = csv_response.headers.get("ETag") or csv_response.headers.get("Last-Modified")
+                    if validator:
+                        with open(validator_path, "w") as file:
+                            file.write(validator)
+                    with open(part_path, mode) as file:
+                        for chunk in csv_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            file.write(chunk)
+                            self.metrics.count("download_bytes", len(chunk))
+                break
+            except requests.RequestException as err:
+                print(f"Download interrupted ({err}), resuming (attempt {attempt} of {max_attempts})...")
+                self.metrics.count("download_retries")
+                time.sleep(5)
         else:
-            print("Failed to download CSV. Status code:", csv_response.status_code)
-
-    def process_locations_data(self, csv_response):
-        # save the CSV response content to a file
-        with open("locations_data.csv", "wb") as file:
-            file.write(csv_response.content)
-        # read the CSV file into a DataFrame
-        df = pd.read_csv("locations_data.csv")
-        # drop unnecessary columns
-        columns_to_keep = [
-            "latitude",
-            "longitude",
-            "dlgf_prop_class_code",
-            "geofulladdress",
-            "geocity",
-            "geostate",
-            "geozip",
-            "geocounty",
-            "geobg10",
-            "geobg20"
-        ]
-        # modify the dataframe to keep only the necessary columns and save it back to the CSV file
-        df = df[columns_to_keep]
-        df.to_csv("locations_data.csv", index=False)
+            print("Failed to download CSV after", max_attempts, "attempts.")
+            return False
+        os.replace(part_path, path)
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+        return True
+
+    def process_locations_data(self, path=LOCATIONS_CSV, chunk_size=LOAD_CHUNK_SIZE):
+        # read the export in chunks, keeping only the columns we need (LOCATIONS_COLUMNS)
+        # so the full statewide file is never held in memory
+        chunks = pd.read_csv(
+            path,
+            usecols=LOCATIONS_COLUMNS,
+            dtype=LOCATIONS_DTYPES,
+            chunksize=chunk_size,
+        )
+        while True:
+            # parsing happens lazily inside the loader, so time it here to tell it apart from the inserts
+            parse_start = time.perf_counter()
+            df = next(chunks, None)
+            if df is None:
+                break
+            df = df[LOCATIONS_COLUMNS].astype(object).fillna("")
+            self.metrics.observe("parse_chunk", time.perf_counter() - parse_start, file=os.path.basename(path))
+            self.metrics.count("rows_parsed", len(df), file=os.path.basename(path))
+            yield df
 
     def check_locations_table_exists(self):
         cursor = self.conn.cursor()
@@ -89,9 +578,7 @@ class community_solarDatabase:
 
     def create_locations_table(self):
         cursor = self.conn.cursor()
-        # read the CSV file to get the header names (ensure the file name matches)
-        df = pd.read_csv("locations_data.csv", low_memory=False)
-        header = df.columns
+        header = LOCATIONS_COLUMNS
         columns_definitions = []
         columns_definitions.append(f'"location_id" INTEGER PRIMARY KEY AUTOINCREMENT')
         # adding to prevent extra api calls to google solar api
@@ -109,6 +596,12 @@ class community_solarDatabase:
             col_type = column_type_mapping.get(col, "TEXT")
             col_definition = f'"{col}" {col_type}'
             columns_definitions.append(col_definition)
+        # identity and content hashes of the source row plus a retired flag for delta refreshes
+        for col, col_type in LOCATIONS_REFRESH_COLUMNS.items():
+            columns_definitions.append(f'"{col}" {col_type}')
+        # integer tract key for the CEJST join
+        for col, col_type in LOCATIONS_TRACT_COLUMNS.items():
+            columns_definitions.append(f'"{col}" {col_type}')
         # create the SQL query to create the table
         columns_sql = ", ".join(columns_definitions)
         table_name = "LOCATIONS"
@@ -119,31 +612,189 @@ class community_solarDatabase:
         cursor.execute(create_table_query)
         self.conn.commit()
 
+    def iter_locations_rows(self, path=LOCATIONS_CSV):
+        # projected rows of the export with their source_key, row_hash and tract key appended
+        for df in self.process_locations_data(path):
+            df["source_key"], df["row_hash"] = hash_locations(df)
+            df["census_tract_2010_ID"] = tract_keys(df["geobg10"])
+            yield from df.itertuples(index=False, name=None)
+
+    @stage("load_locations")
     def insert_locations_data(self):
+        # stream the projected chunks straight into the bulk loader
+        print("Inserting rows:")
+        self.bulk_insert("LOCATIONS", LOCATIONS_LOAD_COLUMNS, self.iter_locations_rows())
+        print("Data update completed successfully.")
+
+    def ensure_columns(self, table_name, columns):
         cursor = self.conn.cursor()
-        # read the CSV file to get the data to insert into the table
-        df = pd.read_csv("locations_data.csv", low_memory=False)
-        df.fillna("", inplace=True)
-        header = df.columns
-        table_name = "LOCATIONS"
-        # SQLite uses ? as the placeholder
-        insert_query = (
-            f"INSERT INTO {table_name} ({', '.join(['\"' + col + '\"' for col in header])}) "
-            f"VALUES ({', '.join(['?' for _ in header])})"
+        # add any missing columns to a table created by an older version of this script
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table_name});")}
+        added = []
+        for col, col_type in columns.items():
+            if col not in existing:
+                print(f"Adding column '{col}' to table '{table_name}'.")
+                cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN "{col}" {col_type};')
+                added.append(col)
+        self.conn.commit()
+        return added
+
+    def backfill_locations_tracts(self):
+        cursor = self.conn.cursor()
+        # fill the integer tract key of rows loaded before it existed, same rule as tract_keys
+        cursor.execute(
+            """
+            UPDATE LOCATIONS
+            SET census_tract_2010_ID = CAST(SUBSTR(geobg10, 1, 11) AS INTEGER)
+            WHERE census_tract_2010_ID IS NULL
+            AND SUBSTR(geobg10, 1, 11) NOT GLOB '*[^0-9]*'
+            AND LENGTH(SUBSTR(geobg10, 1, 11)) = 11;
+            """
         )
-        print("Inserting rows:")
-        # loop through the rows of the DataFrame and insert them into the table
-        for index, row in df.iterrows():
-            values = row.tolist()
-            try:
-                cursor.execute(insert_query, values)
-                if index % 1000 == 0:
-                    print(f"Inserted row {index}")
-            except sqlite3.Error as err:
-                print(values)
-                print("Error inserting row:", err)
         self.conn.commit()
-        print("Data update completed successfully.")
+        print(f"Filled the census tract key of {cursor.rowcount} existing locations.")
+
+    def backfill_locations_hashes(self, batch_size=LOAD_CHUNK_SIZE):
+        cursor = self.conn.cursor()
+        # compute source_key/row_hash for rows loaded before delta refreshes existed
+        quoted_columns = ", ".join('"' + col + '"' for col in LOCATIONS_COLUMNS)
+        after_location_id = 0
+        while True:
+            df = pd.read_sql_query(
+                f"""
+                SELECT location_id, {quoted_columns}
+                FROM LOCATIONS
+                WHERE source_key IS NULL AND location_id > ?
+                ORDER BY location_id
+                LIMIT ?
+                """,
+                self.conn,
+                params=(after_location_id, batch_size),
+            )
+            if df.empty:
+                break
+            source_key, row_hash = hash_locations(df)
+            cursor.executemany(
+                "UPDATE LOCATIONS SET source_key = ?, row_hash = ? WHERE location_id = ?",
+                zip(source_key.tolist(), row_hash.tolist(), df["location_id"].tolist()),
+            )
+            self.conn.commit()
+            after_location_id = int(df["location_id"].iloc[-1])
+            print(f"Hashed existing locations up to location_id {after_location_id}")
+
+    @stage("refresh_locations")
+    def refresh_locations_data(self, download=True):
+        # delta refresh of LOCATIONS from a new ArcGIS extract instead of clearing the database:
+        # new points are inserted, changed points are updated in place and points missing
+        # from the extract are retired, so location_id, has_solar_data and GOOGLE_SOLAR stay linked
+        if download:
+            self.get_locations_data()
+        self.ensure_columns("LOCATIONS", LOCATIONS_REFRESH_COLUMNS)
+        self.backfill_locations_hashes()
+        self.create_indexes()
+        cursor = self.conn.cursor()
+        with self.load_pragmas(REFRESH_PRAGMAS):
+            # the new extract goes into a temporary staging table, so the main database file
+            # is only written for rows that actually changed
+            columns = LOCATIONS_LOAD_COLUMNS
+            quoted_columns = ", ".join('"' + col + '"' for col in LOCATIONS_COLUMNS + ["census_tract_2010_ID"])
+            # the hashes need the INTEGER affinity of LOCATIONS, without it SQLite can not use source_key
+            # in the automatic index of the match below and compares every staged row to every point
+            column_types = {"source_key": "INTEGER", "row_hash": "INTEGER", **LOCATIONS_TRACT_COLUMNS}
+            cursor.execute("DROP TABLE IF EXISTS temp.LOCATIONS_STAGING;")
+            cursor.execute(
+                f"""
+                CREATE TEMP TABLE LOCATIONS_STAGING (
+                    staging_id INTEGER PRIMARY KEY,
+                    {", ".join(f'"{col}" {column_types.get(col, "")}'.rstrip() for col in columns)}
+                );
+                """
+            )
+            self.bulk_insert("temp.LOCATIONS_STAGING", columns, self.iter_locations_rows())
+            # points sharing a source_key (e.g. several units at one address) are matched by their order
+            cursor.executescript(
+                """
+                DROP TABLE IF EXISTS temp.LOCATIONS_MATCHES;
+                CREATE TEMP TABLE LOCATIONS_MATCHES AS
+                SELECT current.location_id, staged.staging_id, current.row_hash = staged.row_hash AS unchanged, current.retired
+                FROM (
+                    SELECT location_id, source_key, row_hash, retired,
+                        ROW_NUMBER() OVER (PARTITION BY source_key ORDER BY retired, location_id) AS ordinal
+                    FROM LOCATIONS
+                ) AS current
+                JOIN (
+                    SELECT staging_id, source_key, row_hash,
+                        ROW_NUMBER() OVER (PARTITION BY source_key ORDER BY staging_id) AS ordinal
+                    FROM temp.LOCATIONS_STAGING
+                ) AS staged
+                ON current.source_key = staged.source_key AND current.ordinal = staged.ordinal;
+                CREATE INDEX temp.idx_locations_matches_location_id ON LOCATIONS_MATCHES (location_id);
+                CREATE INDEX temp.idx_locations_matches_staging_id ON LOCATIONS_MATCHES (staging_id);
+                """
+            )
+            # remember which existing locations change so the dashboard rows can follow
+            touched_ids = [
+                row[0] for row in cursor.execute(
+                    """
+                    SELECT location_id FROM temp.LOCATIONS_MATCHES WHERE unchanged = 0 OR retired = 1
+                    UNION ALL
+                    SELECT location_id FROM LOCATIONS
+                    WHERE retired = 0
+                    AND NOT EXISTS (
+                        SELECT 1 FROM temp.LOCATIONS_MATCHES AS matches WHERE matches.location_id = LOCATIONS.location_id
+                    );
+                    """
+                )
+            ]
+            cursor.execute("BEGIN")
+            # changed (or reappearing) points are updated in place and keep their location_id
+            assignments = ", ".join(f'"{col}" = staged."{col}"' for col in LOCATIONS_COLUMNS + ["census_tract_2010_ID"])
+            cursor.execute(
+                f"""
+                UPDATE LOCATIONS
+                SET {assignments}, row_hash = staged.row_hash, retired = 0
+                FROM temp.LOCATIONS_MATCHES AS matches
+                JOIN temp.LOCATIONS_STAGING AS staged ON staged.staging_id = matches.staging_id
+                WHERE LOCATIONS.location_id = matches.location_id
+                AND (matches.unchanged = 0 OR matches.retired = 1);
+                """
+            )
+            updated = cursor.rowcount
+            # points that are no longer in the extract are retired, not deleted, so their solar data is kept
+            cursor.execute(
+                """
+                UPDATE LOCATIONS
+                SET retired = 1
+                WHERE retired = 0
+                AND NOT EXISTS (
+                    SELECT 1 FROM temp.LOCATIONS_MATCHES AS matches WHERE matches.location_id = LOCATIONS.location_id
+                );
+                """
+            )
+            retired = cursor.rowcount
+            # the R*Tree rows of the points just retired, and of updated points that are no longer 6xx,
+            # are deleted in the same transaction so they are not grouped with pending ones any more
+            self.prune_locations_rtree()
+            # points that are not in the current table are new
+            cursor.execute(
+                f"""
+                INSERT INTO LOCATIONS ({quoted_columns}, source_key, row_hash)
+                SELECT {quoted_columns}, source_key, row_hash
+                FROM temp.LOCATIONS_STAGING AS staged
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM temp.LOCATIONS_MATCHES AS matches WHERE matches.staging_id = staged.staging_id
+                )
+                ORDER BY staging_id;
+                """
+            )
+            inserted = cursor.rowcount
+            self.refresh_derived_rows(touched_ids)
+            cursor.execute("COMMIT")
+            cursor.execute("DROP TABLE temp.LOCATIONS_MATCHES;")
+            cursor.execute("DROP TABLE temp.LOCATIONS_STAGING;")
+        self.write_dashboard_snapshot()
+        print(f"Refresh completed: {inserted} new, {updated} updated, {retired} retired locations.")
+        return {"inserted": inserted, "updated": updated, "retired": retired}
 
     ### End of locations table methods ###
 
@@ -170,61 +821,77 @@ class community_solarDatabase:
             """
             CREATE TABLE IF NOT EXISTS CEJST (
                 cejst_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                census_tract_2010_ID TEXT,
-                identified_as_disadvantaged TEXT,
+                census_tract_2010_ID INTEGER,
+                identified_as_disadvantaged BOOLEAN,
                 date_added DATETIME DEFAULT CURRENT_TIMESTAMP
             );
             """
         )
         self.conn.commit()
         
-    def insert_cejst_data(self):
-        cursor = self.conn.cursor()
-        # read the CEJST data from the CSV file
-        df = pd.read_csv("cejst_data.csv", low_memory=False)
-        # filter the DataFrame to keep only the relevant columns
-        df_filtered = df[["Census tract 2010 ID", "Identified as disadvantaged"]].copy()
-        df_filtered.rename(
-            columns={
-                "Census tract 2010 ID": "census_tract_2010_ID",
-                "Identified as disadvantaged": "identified_as_disadvantaged",
-            },
-            inplace=True,
-        )
-        header = df_filtered.columns
-        table_name = "CEJST"
-        # SQLite uses ? as the placeholder
-        insert_query = (
-            f"INSERT INTO {table_name} ({', '.join(['\"' + col + '\"' for col in header])}) "
-            f"VALUES ({', '.join(['?' for _ in header])})"
-        )
+    @stage("load_cejst")
+    def insert_cejst_data(self, path=CEJST_CSV, state_fips=INDIANA_FIPS):
+        cursor = self.conn.cursor()
+        # read only the tract id and the flag from the national CEJST file, as text so the
+        # leading zero of tract ids like 01001020100 survives until the state filter
+        df = pd.read_csv(path, usecols=list(CEJST_COLUMNS), dtype=str).rename(columns=CEJST_COLUMNS)
+        tract = df["census_tract_2010_ID"].str.strip().str.zfill(11)
+        # keep the tracts of one state, pass state_fips=None to load the whole country
+        if state_fips:
+            keep = tract.str.startswith(state_fips)
+            df, tract = df[keep], tract[keep]
+        df = pd.DataFrame({
+            "census_tract_2010_ID": pd.to_numeric(tract, errors="coerce"),
+            "identified_as_disadvantaged": df["identified_as_disadvantaged"].str.strip().str.lower().isin(["true", "1", "yes"]).astype(int),
+        }).dropna(subset=["census_tract_2010_ID"])
+        df["census_tract_2010_ID"] = df["census_tract_2010_ID"].astype("int64")
+        # the file is reference data, a reload replaces the table (and migrates one with TEXT columns)
+        cursor.execute("DROP TABLE IF EXISTS CEJST;")
+        self.create_cejst_table()
         print("Inserting rows:")
-        # loop through the rows of the DataFrame and insert them into the table
-        for index, row in df_filtered.iterrows():
-            values = row.tolist()
-            try:
-                cursor.execute(insert_query, values)
-                if index % 1000 == 0:
-                    print(f"Inserted row {index}")
-            except sqlite3.Error as err:
-                print(values)
-                print("Error inserting row:", err)
-        self.conn.commit()
+        self.bulk_insert_dataframe("CEJST", df)
 
     ### End of CEJST table methods ###
 
     ### Start of nonprofits table methods ###
 
-    def get_nonprofit_data(self):
+    @stage("scrape_nonprofits")
+    def get_nonprofit_data(self, use_browser=False, path=None):
+        # scrape the table of the Indiana Nonprofit database page, with a plain HTTP request
+        # and an HTML parser by default, or with headless Chrome if the page ever needs it.
+        # path defaults to NONPROFITS_SCRAPE_CSV
+        from nonprofits import NONPROFITS_SCRAPE_CSV, NONPROFITS_URL, scrape_nonprofit_table
+        path = path or NONPROFITS_SCRAPE_CSV
+        try:
+            if use_browser:
+                data = self.scrape_nonprofit_table_with_browser()
+            else:
+                data = scrape_nonprofit_table(NONPROFITS_URL)
+            # save the data to a CSV file
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerows(data)
+            print(f"Data scraped successfully and saved to {path}")
+        except Exception as e:
+            print("An error occurred:", e)
+
+    def scrape_nonprofit_table_with_browser(self):
+        # selenium is only needed here, so it is imported here
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.chrome.service import Service
+        from webdriver_manager.chrome import ChromeDriverManager
+        from nonprofits import NONPROFITS_URL
         options = Options()
-        options.headless = True 
+        options.add_argument("--headless=new")
         service = Service(executable_path=ChromeDriverManager().install())
         # set up the Chrome WebDriver
         driver = webdriver.Chrome(service=service, options=options)
-        # try to scrape the data from the Indiana Nonprofit database
         try:
-            url = "https://www.stats.indiana.edu/nonprofit/inp.aspx"
-            driver.get(url)
+            driver.get(NONPROFITS_URL)
             # wait for the page to load and the table to be present
             wait = WebDriverWait(driver, 10)
             table = wait.until(EC.presence_of_element_located((By.XPATH, "//table")))
@@ -240,13 +907,7 @@ class community_solarDatabase:
                     cells = row.find_elements(By.TAG_NAME, "th")
                 if cells:
                     data.append([cell.text.strip() for cell in cells])
-            # save the data to a CSV file
-            with open("nonprofit_data.csv", "w", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerows(data)
-            print("Data scraped successfully and saved to nonprofit_data.csv")
-        except Exception as e:
-            print("An error occurred:", e)
+            return data
         finally:
             # close the WebDriver
             driver.quit()
@@ -267,14 +928,12 @@ class community_solarDatabase:
 
     def create_nonprofits_table(self):
         cursor = self.conn.cursor()
-        # read the CSV file to get the header names (ensure the file name matches)
-        df = pd.read_csv("nonprofit_data.csv", low_memory=False)
-        header = df.columns
-        columns_definitions = []
-        # loop through the header names and create the column definitions
-        for col in header:
-            col_definition = f'"{col}" TEXT'
-            columns_definitions.append(col_definition)
+        # one typed schema for every county export, see nonprofits.parse_county_file
+        from nonprofits import NONPROFITS_COLUMNS
+        columns_definitions = ['"nonprofit_id" INTEGER PRIMARY KEY AUTOINCREMENT']
+        for col, col_type in NONPROFITS_COLUMNS.items():
+            columns_definitions.append(f'"{col}" {col_type}')
+        columns_definitions.append('"date_added" DATETIME DEFAULT CURRENT_TIMESTAMP')
         columns_sql = ", ".join(columns_definitions)
         table_name = "NONPROFITS"
         # create the SQL query to create the table
@@ -284,50 +943,33 @@ class community_solarDatabase:
         cursor.execute(create_table_query)
         self.conn.commit()
 
-    def parse_nonprofit_data(self):
-        # this function parses the nonprofit data from the downloaded CSV files
-        # and combines them into a single DataFrame
-        named_download_dir = os.path.abspath("downloads/named/")
-        # get the list of files in the directory
-        files = os.listdir(named_download_dir)
-        dfs = []
-        # loop through the files and read each CSV file into a DataFrame
-        for file in files:
-            county_name = os.path.basename(file).split(".")[0]
-            df = pd.read_csv(named_download_dir + "/" + file, skiprows=3)
-            df["county"] = county_name
-            dfs.append(df)
-        # combine the DataFrames into a single DataFrame
-        # and save it to a CSV file
-        combined_df = pd.concat(dfs, ignore_index=True)
-        combined_df.to_csv("nonprofit_data.csv", index=False)
-
-    def insert_nonprofit_data(self):
-        cursor = self.conn.cursor()
-        # read the CSV file to get the data to insert into the table
-        df = pd.read_csv("nonprofit_data.csv", low_memory=False)
-        df.fillna("", inplace=True)
-        print("Columns:", df.columns.tolist())
-        header = df.columns
-        table_name = "NONPROFITS"
-        # SQLite uses ? as the placeholder
-        insert_query = (
-            f"INSERT INTO {table_name} ({', '.join(['\"' + col + '\"' for col in header])}) "
-            f"VALUES ({', '.join(['?' for _ in header])})"
-        )
-        print("Inserting rows as a test:")
-        # loop through the rows of the DataFrame and insert them into the table
-        for index, row in df.iterrows():
-            values = row.tolist()
-            try:
-                cursor.execute(insert_query, values)
-                if index % 1000 == 0:
-                    print(f"Inserted row {index}")
-            except sqlite3.Error as err:
-                print("Error inserting row:", err)
+    def parse_nonprofit_data(self, directory=None, workers=None):
+        # parse the county exports in a process pool and yield their typed rows, county by county
+        # in file order, so only the files being parsed are held in memory. directory defaults to NONPROFITS_DIR
+        from nonprofits import NONPROFITS_DIR, list_county_files, parse_county_file
+        directory = directory or NONPROFITS_DIR
+        files = list_county_files(directory)
+        if not files:
+            print(f"No county files found in {directory}.")
+            return
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(files))) as executor:
+            for county, rows in executor.map(parse_county_file, files):
+                self.metrics.count("rows_parsed", len(rows), file="nonprofits")
+                print(f"Parsed {len(rows)} nonprofits for {county} county.")
+                yield from rows
 
-        self.conn.commit()
+    @stage("load_nonprofits")
+    def insert_nonprofit_data(self, directory=None, workers=None):
+        cursor = self.conn.cursor()
+        from nonprofits import NONPROFITS_COLUMNS
+        # the county exports are the whole dataset, so a load replaces the table
+        # (this also migrates a table created with the old all-TEXT schema)
+        cursor.execute("DROP TABLE IF EXISTS NONPROFITS;")
+        self.create_nonprofits_table()
+        print("Inserting rows:")
+        inserted = self.bulk_insert("NONPROFITS", list(NONPROFITS_COLUMNS), self.parse_nonprofit_data(directory, workers))
         print("Data update completed successfully.")
+        return inserted
 
     ### End of nonprofits table methods ###
 
@@ -366,37 +1008,67 @@ class community_solarDatabase:
                 carbon_offset_factor_kg_per_mwh REAL,
                 estimated_annual_co2_savings_tons REAL,
                 estimated_houses_powered REAL,
+                source_location_id INTEGER,
                 date_added DATETIME DEFAULT CURRENT_TIMESTAMP
             );
             """
         )
         self.conn.commit()
 
-    def get_solar_data(self, latitude, longitude):
+    def get_solar_data(self, latitude, longitude, session=None, rate_limiter=None):
         # google solar api has a rate limit of 300 requests per minute
         # if we exceed this limit, we will get a 429 error code
-        # and we will need to wait 1 minute before retrying
-        time.sleep(.2)  # Sleep for 1 second to avoid hitting the rate limit too quickly
-        api_url = f"https://solar.googleapis.com/v1/buildingInsights:findClosest?location.latitude={latitude}&location.longitude={longitude}&requiredQuality=HIGH&key="+self.api_key
-        # make the API request
-        response = requests.get(api_url)
-        solar_data = response.json()
-        # check if the request was successful
-        if response.status_code != 200:
+        # and we will need to wait before retrying. 5xx answers, timeouts and bodies that are not JSON
+        # are retried the same way after a shorter pause. after MAX_RATE_LIMITED of them in a row
+        # the status code is returned like a 403, so the caller leaves the location in the queue
+        # answer from the response cache first, it costs nothing against the quota
+        if self.solar_cache is not None:
+            cached = self.solar_cache.get(latitude, longitude)
+            if cached is not None:
+                self.metrics.count("solar_cache_hits")
+                status_code, solar_data = cached
+                return solar_data if status_code == 200 else None
+            self.metrics.count("solar_cache_misses")
+        for attempt in range(1, MAX_RATE_LIMITED + 1):
+            with self.metrics.timer("solar_rate_limit_wait"):
+                if rate_limiter is not None:
+                    # concurrent callers share a token bucket sized to the quota instead of sleeping
+                    rate_limiter.acquire()
+                else:
+                    time.sleep(.2)  # Sleep for 1 second to avoid hitting the rate limit too quickly
+            with self.api_calls_lock:
+                self.api_calls += 1
+            # make the API request, reusing the pooled connection of the session if we have one
+            with self.metrics.timer("solar_api_request"):
+                status_code, solar_data = request_solar_data(self.api_key, latitude, longitude, session)
+            self.metrics.count("solar_api_responses", status=status_code)
+            if status_code not in RETRYABLE_STATUS_CODES:
+                break
             print("Response:", solar_data)
-            if response.status_code == 429:
-                print("Rate limit exceeded. Waiting for 1 minute before retrying...")
-                time.sleep(90)
-                return self.get_solar_data(latitude, longitude)
-        elif response.status_code == 403:
+            if attempt == MAX_RATE_LIMITED:
+                print(f"Still failing with {status_code} after {attempt} attempts, leaving the location in the queue.")
+                return status_code
+            pause_seconds = RATE_LIMIT_PAUSE_SECONDS if status_code == 429 else SERVER_ERROR_PAUSE_SECONDS
+            if status_code == 429:
+                print(f"Rate limit exceeded. Waiting {pause_seconds} seconds before retrying...")
+            else:
+                print(f"Request failed with {status_code}. Waiting {pause_seconds} seconds before retrying...")
+            self.metrics.count("solar_api_retries")
+            if rate_limiter is not None:
+                rate_limiter.pause(pause_seconds)
+            else:
+                time.sleep(pause_seconds)
+        if self.solar_cache is not None:
+            self.solar_cache.put(latitude, longitude, status_code, solar_data)
+        # check if the request was successful
+        if status_code == 403:
             print("Access denied. Check your API key and permissions.")
             print("Response:", solar_data)
-            return response.status_code
+            return status_code
+        elif status_code != 200:
+            print("Response:", solar_data)
         else:
             print("Data fetched successfully")
-            # for debugging purposes
-            #with open(f"solar_data_{latitude}_{longitude}.json", "w") as f:
-                #json.dump(solar_data, f, indent=4)
             return solar_data
 
     def process_solar_data(self, solar_data):
@@ -409,7 +1081,7 @@ class community_solarDatabase:
             
             # Core fields
             panel_count = solar_potential.get("maxArrayPanelsCount", 0)
-            panel_watts = solar_potential.get("panelCapacityWatts", 300)
+            panel_watts = solar_potential.get("panelCapacityWatts", DEFAULT_PANEL_CAPACITY_WATTS)
             carbon_offset_factor = solar_potential.get("carbonOffsetFactorKgPerMwh", 0)
             imagery_quality = solar_data.get("imageryQuality", "UNKNOWN")
             
@@ -432,15 +1104,15 @@ class community_solarDatabase:
             
             # Fallback: estimate energy using whole sun quant (if available)
             if not yearly_energy_kwh:
-                whole_sun_quant = solar_potential.get("maxSunshineHoursPerYear", 1000)
-                estimated_kwh = (nominal_power_watts / 1000) * whole_sun_quant * 0.8
+                whole_sun_quant = solar_potential.get("maxSunshineHoursPerYear", DEFAULT_SUNSHINE_HOURS_PER_YEAR)
+                estimated_kwh = (nominal_power_watts / 1000) * whole_sun_quant * FALLBACK_DERATE
                 yearly_energy_kwh = round(estimated_kwh, 2)
             
             # CO2 savings in tons based on EPA estimate
-            co2_savings_tons = yearly_energy_kwh * 0.000699
+            co2_savings_tons = yearly_energy_kwh * CO2_TONS_PER_KWH
             
             # Houses powered (based on US average usage)
-            houses_powered = round(yearly_energy_kwh / 10566, 2)
+            houses_powered = round(yearly_energy_kwh / KWH_PER_HOUSE, 2)
             
             return {
                 "imageryQuality": imagery_quality,
@@ -454,106 +1126,1515 @@ class community_solarDatabase:
                 "estimatedHousesPowered": houses_powered # Manual
             }
         
-        except KeyError:
+        except KeyError as e:
             print(f"Missing field in response: {e}")
             return None
 
-    def get_and_insert_solar_data(self, limit=5):
+    def process_solar_data_batch(self, responses):
+        # batch version of process_solar_data: takes many findClosest responses and returns
+        # one row per response with the GOOGLE_SOLAR column names, computed column-wise with numpy
+        potentials = [response.get("solarPotential", {}) for response in responses]
+        config_counts = np.array([len(p.get("solarPanelConfigs", [])) for p in potentials], dtype=np.int64)
+        config_energy = np.array(
+            [c.get("yearlyEnergyDcKwh", 0) for p in potentials for c in p.get("solarPanelConfigs", [])],
+            dtype=np.float64,
+        )
+        # best config energy per response, responses without configs get 0 and use the fallback below
+        best_energy = np.zeros(len(responses), dtype=np.float64)
+        has_configs = config_counts > 0
+        if has_configs.any():
+            starts = np.concatenate(([0], np.cumsum(config_counts)[:-1]))[has_configs]
+            best_energy[has_configs] = np.maximum.reduceat(config_energy, starts)
+        df = pd.DataFrame({
+            "imagery_quality": [response.get("imageryQuality", "UNKNOWN") for response in responses],
+            "max_array_panels_count": [p.get("maxArrayPanelsCount", 0) for p in potentials],
+            "panel_capacity_watts": [p.get("panelCapacityWatts", DEFAULT_PANEL_CAPACITY_WATTS) for p in potentials],
+            "carbon_offset_factor_kg_per_mwh": [p.get("carbonOffsetFactorKgPerMwh", 0) for p in potentials],
+        })
+        df["nominal_power_watts"] = df["max_array_panels_count"] * df["panel_capacity_watts"]
+        # fallback: estimate energy using whole sun quant when no config reports its energy
+        sunshine_hours = np.array(
+            [p.get("maxSunshineHoursPerYear", DEFAULT_SUNSHINE_HOURS_PER_YEAR) for p in potentials],
+            dtype=np.float64,
+        )
+        estimated_energy = round_like_python(df["nominal_power_watts"].to_numpy() / 1000 * sunshine_hours * FALLBACK_DERATE)
+        df["yearly_energy_dc_kwh"] = np.where(best_energy != 0, best_energy, estimated_energy)
+        df["estimated_annual_co2_savings_tons"] = round_like_python(df["yearly_energy_dc_kwh"] * CO2_TONS_PER_KWH)
+        df["estimated_houses_powered"] = round_like_python(df["yearly_energy_dc_kwh"] / KWH_PER_HOUSE)
+        # imagery date as MM-DD-YYYY, None when any part is missing
+        dates = pd.DataFrame(
+            [response.get("imageryDate") or {} for response in responses],
+            columns=["year", "month", "day"],
+            index=df.index,
+        )
+        dates = dates.apply(pd.to_numeric, errors="coerce")
+        valid = dates.notna().all(axis=1)
+        formatted = (
+            dates["month"].where(valid, 0).astype(np.int64).astype(str).str.zfill(2) + "-"
+            + dates["day"].where(valid, 0).astype(np.int64).astype(str).str.zfill(2) + "-"
+            + dates["year"].where(valid, 0).astype(np.int64).astype(str).str.zfill(4)
+        )
+        df["imagery_date"] = formatted.astype(object).where(valid, None)
+        return df[list(GOOGLE_SOLAR_FIELDS.values())]
+
+    def get_solar_candidates(self, limit, after_location_id=0, has_solar_data=1):
         cursor = self.conn.cursor()
-        # get the locations that need solar data
+        # get the locations that need solar data, walking the partial work-queue index
+        # in location_id order from after_location_id so each call only touches the batch
+        cursor.execute(
+            SOLAR_CANDIDATES_QUERY,
+            {"has_solar_data": has_solar_data, "after_location_id": after_location_id, "limit": limit},
+        )
+        return cursor.fetchall()
+
+    def insert_solar_data(self, location_id, latitude, longitude, processed_data, source_location_id=None):
+        cursor = self.conn.cursor()
+        # update the has_solar_data field in the LOCATIONS table
+        cursor.execute(
+            """
+            UPDATE LOCATIONS 
+            SET has_solar_data = 2
+            WHERE location_id = ?
+            """,
+            (location_id,)
+        )
+        # insert the solar data into the GOOGLE_SOLAR table 
+        cursor.execute(
+            """
+            INSERT INTO GOOGLE_SOLAR (
+                location_id, 
+                latitude, 
+                longitude, 
+                imagery_quality, 
+                imagery_date, 
+                max_array_panels_count,
+                panel_capacity_watts, 
+                nominal_power_watts, 
+                yearly_energy_dc_kwh, 
+                carbon_offset_factor_kg_per_mwh, 
+                estimated_annual_co2_savings_tons, 
+                estimated_houses_powered,
+                source_location_id
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                location_id,
+                latitude,
+                longitude,
+                processed_data["imageryQuality"],
+                processed_data["imageryDate"],
+                processed_data["maxArrayPanelsCount"],
+                processed_data["panelCapacityWatts"],
+                processed_data["nominalPowerWatts"],
+                processed_data["yearlyEnergyDcKwh"],
+                processed_data["carbonOffsetFactorKgPerMwh"],
+                processed_data["estimatedAnnualCO2SavingsTons"],
+                processed_data["estimatedHousesPowered"],
+                source_location_id
+            )
+        )
+
+    def insert_solar_data_frame(self, df):
+        cursor = self.conn.cursor()
+        # bulk version of insert_solar_data for the output of process_solar_data_batch,
+        # df needs location_id, latitude and longitude next to the GOOGLE_SOLAR metric columns
+        columns = ["location_id", "latitude", "longitude"] + list(GOOGLE_SOLAR_FIELDS.values())
+        if "source_location_id" in df.columns:
+            columns.append("source_location_id")
+        df = df[columns].astype(object).where(df[columns].notna(), None)
+        cursor.executemany(
+            "UPDATE LOCATIONS SET has_solar_data = 2 WHERE location_id = ?",
+            ((location_id,) for location_id in df["location_id"]),
+        )
+        cursor.executemany(
+            f"INSERT INTO GOOGLE_SOLAR ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+            df.itertuples(index=False, name=None),
+        )
+        self.refresh_derived_rows(df["location_id"])
+
+    def mark_no_solar_data(self, location_id):
+        cursor = self.conn.cursor()
+        # update the has_solar_data field in the LOCATIONS table
+        cursor.execute(
+            """
+            UPDATE LOCATIONS 
+            SET has_solar_data = 1 
+            WHERE location_id = ?
+            """,
+            (location_id,)
+        )
+
+    @stage("update_rtree")
+    def update_locations_rtree(self):
+        cursor = self.conn.cursor()
+        # R*Tree over the 6xx locations, used to find candidate points close to each other
+        cursor.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS LOCATIONS_RTREE USING rtree(
+                id, min_latitude, max_latitude, min_longitude, max_longitude
+            );
+            """
+        )
+        # only add the points that are not indexed yet, coordinates of a location never change
+        # (a moved point is a new location, see refresh_locations_data). retired points stay out,
+        # prune_locations_rtree removes them and they must not come back on the next fetch.
+        # an R*Tree can not be read while the same statement writes to it, so the missing points
+        # are collected in a temp table first
+        cursor.execute("DROP TABLE IF EXISTS temp.RTREE_PENDING;")
+        cursor.execute(
+            """
+            CREATE TEMP TABLE RTREE_PENDING AS
+            SELECT location_id, latitude, longitude
+            FROM LOCATIONS
+            WHERE dlgf_prop_class_code BETWEEN 600 AND 699
+            AND retired = 0
+            AND latitude IS NOT NULL AND longitude IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM LOCATIONS_RTREE WHERE LOCATIONS_RTREE.id = LOCATIONS.location_id);
+            """
+        )
+        cursor.execute(
+            """
+            INSERT INTO LOCATIONS_RTREE (id, min_latitude, max_latitude, min_longitude, max_longitude)
+            SELECT location_id, latitude, latitude, longitude, longitude FROM RTREE_PENDING;
+            """
+        )
+        cursor.execute("DROP TABLE temp.RTREE_PENDING;")
+        self.conn.commit()
+
+    def prune_locations_rtree(self):
+        cursor = self.conn.cursor()
+        # remove the points that are retired or no longer 6xx, update_locations_rtree only adds points.
+        # no commit here, it runs inside the refresh transaction
+        if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'LOCATIONS_RTREE';").fetchone():
+            return 0
+        cursor.execute(
+            """
+            DELETE FROM LOCATIONS_RTREE
+            WHERE id IN (
+                SELECT location_id FROM LOCATIONS
+                WHERE retired = 1 OR dlgf_prop_class_code IS NULL OR dlgf_prop_class_code NOT BETWEEN 600 AND 699
+            );
+            """
+        )
+        return cursor.rowcount
+
+    def group_solar_candidates(self, locations, radius_m=COALESCE_RADIUS_M):
+        cursor = self.conn.cursor()
+        # findClosest returns the building nearest to a point, so pending points within radius_m
+        # of each other (same parcel or campus) would return the same building: send one
+        # representative per group and fan its result out to the other members
+        if not radius_m:
+            return [(location, []) for location in locations]
+        groups = []
+        claimed = set()
+        for location in locations:
+            location_id, latitude, longitude, has_solar_data = location
+            if location_id in claimed:
+                continue
+            claimed.add(location_id)
+            delta_latitude = radius_m / METERS_PER_DEGREE_LATITUDE
+            delta_longitude = radius_m / (METERS_PER_DEGREE_LATITUDE * max(np.cos(np.radians(latitude)), 0.01))
+            cursor.execute(
+                """
+                SELECT LOCATIONS.location_id, LOCATIONS.latitude, LOCATIONS.longitude, LOCATIONS.has_solar_data
+                FROM LOCATIONS_RTREE
+                JOIN LOCATIONS ON LOCATIONS.location_id = LOCATIONS_RTREE.id
+                WHERE LOCATIONS_RTREE.min_latitude >= ? AND LOCATIONS_RTREE.max_latitude <= ?
+                AND LOCATIONS_RTREE.min_longitude >= ? AND LOCATIONS_RTREE.max_longitude <= ?
+                AND LOCATIONS.location_id != ?
+                AND LOCATIONS.has_solar_data = ?
+                AND LOCATIONS.retired = 0
+                AND LOCATIONS.dlgf_prop_class_code BETWEEN 600 AND 699
+                AND NOT EXISTS (
+                    SELECT 1 FROM GOOGLE_SOLAR WHERE GOOGLE_SOLAR.location_id = LOCATIONS.location_id
+                )
+                """,
+                (
+                    latitude - delta_latitude,
+                    latitude + delta_latitude,
+                    longitude - delta_longitude,
+                    longitude + delta_longitude,
+                    location_id,
+                    has_solar_data,
+                ),
+            )
+            neighbours = [row for row in cursor.fetchall() if row[0] not in claimed]
+            members = []
+            if neighbours:
+                distances = haversine_m(
+                    latitude, longitude, [row[1] for row in neighbours], [row[2] for row in neighbours]
+                )
+                members = [row for row, distance in zip(neighbours, distances) if distance <= radius_m]
+                claimed.update(row[0] for row in members)
+            groups.append((location, members))
+        return groups
+
+    def write_solar_result(self, location, members, solar_data):
+        # store the result of one findClosest call for the representative and the members of its group
+        location_id, latitude, longitude, has_solar_data = location
+        processed_data = self.process_solar_data(solar_data) if solar_data else None
+        self.metrics.count("solar_locations_written", 1 + len(members), result="solar_data" if processed_data else "no_solar_data")
+        self.metrics.count("solar_calls_avoided", len(members))
+        if processed_data:
+            print("Processed data for location: ", location_id)
+            self.insert_solar_data(location_id, latitude, longitude, processed_data)
+            for member_id, member_latitude, member_longitude, _ in members:
+                self.insert_solar_data(member_id, member_latitude, member_longitude, processed_data, location_id)
+        elif not solar_data:
+            # if the solar data is not valid, update the has_solar_data field in the LOCATIONS table
+            print(f"No solar data found for location {location_id}.")
+            self.mark_no_solar_data(location_id)
+            for member in members:
+                self.mark_no_solar_data(member[0])
+        # keep the dashboard table and the site leaderboards in step with the new solar rows
+        if processed_data:
+            self.refresh_derived_rows([location_id] + [member[0] for member in members])
+
+    @stage("solar_fetch")
+    def get_and_insert_solar_data(self, limit=5, coalesce_radius_m=COALESCE_RADIUS_M):
         # normally run this with a limit of 5 to test the code
         # but for the final run, you can up the limit to 1000 or more but be careful of the rate limit and computer limits
-        cursor.execute(f"""
-            SELECT 
-                location_id, latitude, longitude, has_solar_data
-            FROM 
-                LOCATIONS 
-            WHERE 
-                location_id NOT IN (SELECT location_id FROM GOOGLE_SOLAR) 
-            AND 
-                has_solar_data = 1
-            AND 
-                dlgf_prop_class_code LIKE '6%%'
-            ORDER BY 
-                location_id 
-            LIMIT 
-                ?
-            """, (limit,))
-        # get the locations that need solar data
-        locations = cursor.fetchall()
-        for location in locations:
+        self.create_indexes()
+        self.update_locations_rtree()
+        groups = self.group_solar_candidates(self.get_solar_candidates(limit), coalesce_radius_m)
+        avoided = 0
+        for location, members in groups:
             location_id, latitude, longitude, has_solar_data = location
             print(f"Processing location {location_id} with latitude {latitude} and longitude {longitude}")
             solar_data = self.get_solar_data(latitude, longitude)
-            # check if the solar data is valid
-            if solar_data:
-                # process the solar data and insert it into the database
-                processed_data = self.process_solar_data(solar_data)
-                if processed_data:
-                    print("Processed data for location: ", location_id)
-                    # update the has_solar_data field in the LOCATIONS table
-                    cursor.execute(
-                        """
-                        UPDATE LOCATIONS 
-                        SET has_solar_data = 2
-                        WHERE location_id = ?
-                        """,
-                        (location_id,)
-                    )
-                    # insert the solar data into the GOOGLE_SOLAR table 
-                    cursor.execute(
-                        """
-                        INSERT INTO GOOGLE_SOLAR (
-                            location_id, 
-                            latitude, 
-                            longitude, 
-                            imagery_quality, 
-                            imagery_date, 
-                            max_array_panels_count,
-                            panel_capacity_watts, 
-                            nominal_power_watts, 
-                            yearly_energy_dc_kwh, 
-                            carbon_offset_factor_kg_per_mwh, 
-                            estimated_annual_co2_savings_tons, 
-                            estimated_houses_powered
-                        )
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            location_id,
-                            latitude,
-                            longitude,
-                            processed_data["imageryQuality"],
-                            processed_data["imageryDate"],
-                            processed_data["maxArrayPanelsCount"],
-                            processed_data["panelCapacityWatts"],
-                            processed_data["nominalPowerWatts"],
-                            processed_data["yearlyEnergyDcKwh"],
-                            processed_data["carbonOffsetFactorKgPerMwh"],
-                            processed_data["estimatedAnnualCO2SavingsTons"],
-                            processed_data["estimatedHousesPowered"]
-                        )
-                    )
-                    self.conn.commit()
-            elif solar_data == 403:
-                return
-            else:
-                # if the solar data is not valid, update the has_solar_data field in the LOCATIONS table
-                print(f"No solar data found for location {location_id}.")
-                cursor.execute(
-                    """
-                    UPDATE LOCATIONS 
-                    SET has_solar_data = 1 
-                    WHERE location_id = ?
-                    """,
-                    (location_id,)
-                )
-                self.conn.commit()
+            # check if the solar data is valid, stop on a denied key, a quota that stays exhausted
+            # or a server that keeps failing
+            if solar_data in UNANSWERED_STATUS_CODES:
+                break
+            self.write_solar_result(location, members, solar_data)
+            avoided += len(members)
+            self.conn.commit()
         self.conn.commit()
-        self.conn.close()
+        self.write_dashboard_snapshot()
+        print(f"Coalescing nearby points avoided {avoided} API calls.")
+        return avoided
+
+    @stage("solar_fetch_concurrent")
+    def get_and_insert_solar_data_concurrent(self, limit=5, workers=8, requests_per_minute=300, commit_every=50, coalesce_radius_m=COALESCE_RADIUS_M):
+        # concurrent version of get_and_insert_solar_data for large backfills
+        # worker threads only talk to the API (each with its own pooled requests session)
+        # and share a token bucket sized to the quota, while this thread is the single
+        # writer to GOOGLE_SOLAR/LOCATIONS so the sqlite connection is never shared
+        rate_limiter = TokenBucket(requests_per_minute)
+        sessions = threading.local()
+
+        def fetch(location):
+            location_id, latitude, longitude, has_solar_data = location
+            if not hasattr(sessions, "session"):
+                sessions.session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+                sessions.session.mount("https://", adapter)
+            return self.get_solar_data(latitude, longitude, sessions.session, rate_limiter)
+
+        self.create_indexes()
+        self.update_locations_rtree()
+        groups = iter(self.group_solar_candidates(self.get_solar_candidates(limit), coalesce_radius_m))
+        in_flight = {}
+        written = 0
+        avoided = 0
+        access_denied = False
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # keep a bounded number of requests queued so memory does not grow with the limit
+            for location, members in itertools.islice(groups, workers * 2):
+                in_flight[executor.submit(fetch, location)] = (location, members)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    location, members = in_flight.pop(future)
+                    solar_data = future.result()
+                    if solar_data in UNANSWERED_STATUS_CODES:
+                        access_denied = True
+                        continue
+                    self.write_solar_result(location, members, solar_data)
+                    written += 1
+                    avoided += len(members)
+                    if written % commit_every == 0:
+                        self.conn.commit()
+                        rate = written / (time.monotonic() - start)
+                        print(f"Processed {written} locations ({rate * 60:.0f} requests/minute)")
+                        self.metrics.write_snapshot()
+                    if not access_denied:
+                        for location, members in itertools.islice(groups, 1):
+                            in_flight[executor.submit(fetch, location)] = (location, members)
+        self.conn.commit()
+        self.write_dashboard_snapshot()
+        print(f"Processed {written} locations in {time.monotonic() - start:.1f} seconds.")
+        print(f"Coalescing nearby points avoided {avoided} API calls.")
+        return avoided
+
+    @stage("solar_recompute")
+    def recompute_solar_from_cache(self, batch_size=1000):
+        cursor = self.conn.cursor()
+        # rebuild GOOGLE_SOLAR from the cached raw responses without any network access,
+        # e.g. after changing the CO2 factor, the kWh per house constant or the best config choice
+        recomputed = 0
+        missing = 0
+        after_location_id = 0
+        while True:
+            # locations that got their data from a coalesced neighbour are looked up by its coordinates
+            cursor.execute(
+                """
+                SELECT
+                    LOCATIONS.location_id, LOCATIONS.latitude, LOCATIONS.longitude,
+                    GOOGLE_SOLAR.source_location_id,
+                    COALESCE(SOURCE.latitude, LOCATIONS.latitude),
+                    COALESCE(SOURCE.longitude, LOCATIONS.longitude)
+                FROM LOCATIONS
+                LEFT JOIN GOOGLE_SOLAR ON GOOGLE_SOLAR.location_id = LOCATIONS.location_id
+                LEFT JOIN LOCATIONS AS SOURCE ON SOURCE.location_id = GOOGLE_SOLAR.source_location_id
+                WHERE LOCATIONS.has_solar_data > 0 AND LOCATIONS.location_id > ?
+                ORDER BY LOCATIONS.location_id
+                LIMIT ?
+                """,
+                (after_location_id, batch_size),
+            )
+            locations = cursor.fetchall()
+            if not locations:
+                break
+            found = []
+            responses = []
+            for location_id, latitude, longitude, source_location_id, request_latitude, request_longitude in locations:
+                cached = self.solar_cache.get(request_latitude, request_longitude)
+                if cached is None:
+                    # keep whatever is in GOOGLE_SOLAR for locations fetched before the cache existed
+                    missing += 1
+                    continue
+                status_code, solar_data = cached
+                cursor.execute("DELETE FROM GOOGLE_SOLAR WHERE location_id = ?", (location_id,))
+                if status_code == 200:
+                    found.append((location_id, latitude, longitude, source_location_id))
+                    responses.append(solar_data)
+                else:
+                    self.mark_no_solar_data(location_id)
+                    self.refresh_derived_rows([location_id])
+                recomputed += 1
+            # derive the metrics for the whole batch at once and write them in one go
+            if responses:
+                df = self.process_solar_data_batch(responses)
+                df.insert(0, "location_id", [location[0] for location in found])
+                df.insert(1, "latitude", [location[1] for location in found])
+                df.insert(2, "longitude", [location[2] for location in found])
+                df["source_location_id"] = [location[3] for location in found]
+                self.insert_solar_data_frame(df)
+            self.conn.commit()
+            after_location_id = locations[-1][0]
+            print(f"Recomputed {recomputed} locations from the cache ({missing} not cached)")
+        self.write_dashboard_snapshot()
+        return recomputed
 
     ### End of Google Solar API methods ###
 
+    ### Start of solar backfill job methods ###
+
+    def check_solar_runs_table_exists(self):
+        cursor = self.conn.cursor()
+        # one row per backfill run, the checkpoint and counters are committed together with the solar rows
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS SOLAR_RUNS (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT,
+                after_location_id INTEGER DEFAULT 0,
+                processed_locations INTEGER DEFAULT 0,
+                api_calls INTEGER DEFAULT 0,
+                avoided_calls INTEGER DEFAULT 0,
+                denied_calls INTEGER DEFAULT 0,
+                elapsed_seconds REAL DEFAULT 0,
+                error TEXT,
+                date_started DATETIME DEFAULT CURRENT_TIMESTAMP,
+                date_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+                date_finished DATETIME
+            );
+            """
+        )
+        self.conn.commit()
+
+    def start_solar_run(self, resume=True):
+        cursor = self.conn.cursor()
+        # pick up the latest unfinished run, a run that was killed is still marked as running
+        self.check_solar_runs_table_exists()
+        if resume:
+            placeholders = ", ".join("?" for _ in RESUMABLE_RUN_STATUSES)
+            cursor.execute(
+                f"SELECT run_id FROM SOLAR_RUNS WHERE status IN ({placeholders}) ORDER BY run_id DESC LIMIT 1;",
+                RESUMABLE_RUN_STATUSES,
+            )
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("UPDATE SOLAR_RUNS SET status = 'running', error = NULL WHERE run_id = ?;", row)
+                self.conn.commit()
+                print(f"Resuming solar backfill run {row[0]}.")
+                return row[0]
+        cursor.execute("INSERT INTO SOLAR_RUNS (status) VALUES ('running');")
+        self.conn.commit()
+        print(f"Starting solar backfill run {cursor.lastrowid}.")
+        return cursor.lastrowid
+
+    def update_solar_run(self, run_id, status, after_location_id, counts, elapsed_seconds, error=None):
+        cursor = self.conn.cursor()
+        # counts holds the deltas since the last update, so a resumed run keeps adding up
+        cursor.execute(
+            """
+            UPDATE SOLAR_RUNS
+            SET status = ?,
+                after_location_id = ?,
+                processed_locations = processed_locations + ?,
+                api_calls = api_calls + ?,
+                avoided_calls = avoided_calls + ?,
+                denied_calls = denied_calls + ?,
+                elapsed_seconds = elapsed_seconds + ?,
+                error = ?,
+                date_updated = CURRENT_TIMESTAMP,
+                date_finished = CASE WHEN ? = 'running' THEN NULL ELSE CURRENT_TIMESTAMP END
+            WHERE run_id = ?;
+            """,
+            (
+                status,
+                after_location_id,
+                counts["processed"],
+                counts["api_calls"],
+                counts["avoided"],
+                counts["denied"],
+                elapsed_seconds,
+                error,
+                status,
+                run_id,
+            ),
+        )
+        for key in counts:
+            counts[key] = 0
+
+    def get_solar_run_progress(self, run_id=None):
+        cursor = self.conn.cursor()
+        # progress of a run (the latest one by default) with its throughput and an ETA for the rest of the queue
+        self.check_solar_runs_table_exists()
+        cursor.execute(
+            """
+            SELECT run_id, status, after_location_id, processed_locations, api_calls,
+                avoided_calls, denied_calls, elapsed_seconds, error, date_started, date_updated
+            FROM SOLAR_RUNS
+            WHERE run_id = COALESCE(?, (SELECT MAX(run_id) FROM SOLAR_RUNS));
+            """,
+            (run_id,),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        keys = [
+            "run_id", "status", "after_location_id", "processed_locations", "api_calls",
+            "avoided_calls", "denied_calls", "elapsed_seconds", "error", "date_started", "date_updated",
+        ]
+        progress = dict(zip(keys, row))
+        progress["remaining_locations"] = cursor.execute(
+            SOLAR_QUEUE_COUNT_QUERY, {"has_solar_data": 1, "after_location_id": progress["after_location_id"]}
+        ).fetchone()[0]
+        elapsed = progress["elapsed_seconds"]
+        progress["locations_per_minute"] = progress["processed_locations"] / elapsed * 60 if elapsed else 0.0
+        progress["api_calls_per_minute"] = progress["api_calls"] / elapsed * 60 if elapsed else 0.0
+        progress["eta_seconds"] = (
+            progress["remaining_locations"] / progress["locations_per_minute"] * 60
+            if progress["locations_per_minute"] else None
+        )
+        return progress
+
+    def print_solar_run_progress(self, progress):
+        eta = progress["eta_seconds"]
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "unknown"
+        print(
+            f"Run {progress['run_id']} ({progress['status']}): {progress['processed_locations']} locations, "
+            f"{progress['api_calls']} API calls, {progress['avoided_calls']} avoided, {progress['denied_calls']} denied, "
+            f"{progress['locations_per_minute']:.0f} locations/minute, "
+            f"{progress['remaining_locations']} remaining, ETA {eta_text}"
+        )
+
+    @stage("solar_backfill")
+    def run_solar_backfill(self, max_api_calls=None, max_seconds=None, batch_size=500, commit_every=50,
+                           resume=True, max_consecutive_denied=MAX_CONSECUTIVE_DENIED, coalesce_radius_m=COALESCE_RADIUS_M):
+        # checkpointed replacement of get_and_insert_solar_data for the statewide backfill.
+        # work is claimed from the queue in keyset batches and written in groups of commit_every
+        # results. every commit also moves the run checkpoint in SOLAR_RUNS, so after a crash or
+        # kill the next call resumes from the last commit without repeating paid-for calls.
+        # the run stops when the queue is empty, max_api_calls or max_seconds is reached, or
+        # after max_consecutive_denied 403 answers in a row. the connection is left open.
+        self.create_indexes()
+        self.update_locations_rtree()
+        run_id = self.start_solar_run(resume)
+        cursor = self.conn.cursor()
+        after_location_id = cursor.execute(
+            "SELECT after_location_id FROM SOLAR_RUNS WHERE run_id = ?;", (run_id,)
+        ).fetchone()[0]
+        counts = {"processed": 0, "api_calls": 0, "avoided": 0, "denied": 0}
+        start = time.monotonic()
+        checkpoint_at = start
+        status = "running"
+        consecutive_denied = 0
+        api_calls_at_start = self.api_calls
+        pending = 0
+        # the scan moves past denied locations, but the saved checkpoint stays before the first
+        # of them, so resuming this run asks for them again
+        denied_after_id = None
+
+        def checkpoint(status, error=None):
+            nonlocal checkpoint_at
+            now = time.monotonic()
+            resume_after_id = after_location_id if denied_after_id is None else min(after_location_id, denied_after_id)
+            self.update_solar_run(run_id, status, resume_after_id, counts, now - checkpoint_at, error)
+            self.conn.commit()
+            self.metrics.write_snapshot()
+            checkpoint_at = now
+
+        try:
+            while status == "running":
+                locations = self.get_solar_candidates(batch_size, after_location_id)
+                if not locations:
+                    status = "completed"
+                    break
+                for location, members in self.group_solar_candidates(locations, coalesce_radius_m):
+                    if max_seconds is not None and time.monotonic() - start >= max_seconds:
+                        status = "stopped"
+                        break
+                    if max_api_calls is not None and self.api_calls - api_calls_at_start >= max_api_calls:
+                        status = "stopped"
+                        break
+                    calls_before = self.api_calls
+                    solar_data = self.get_solar_data(location[1], location[2])
+                    counts["api_calls"] += self.api_calls - calls_before
+                    if solar_data in UNANSWERED_STATUS_CODES:
+                        # denied, or still rate limited or failing after the retries: leave the location
+                        # and its group in the queue, a resume picks them up again
+                        first_id = min([location[0]] + [member[0] for member in members]) - 1
+                        denied_after_id = first_id if denied_after_id is None else min(denied_after_id, first_id)
+                        counts["denied"] += 1
+                        consecutive_denied += 1
+                        if consecutive_denied >= max_consecutive_denied:
+                            status = "denied"
+                            break
+                        continue
+                    consecutive_denied = 0
+                    self.write_solar_result(location, members, solar_data)
+                    counts["processed"] += 1 + len(members)
+                    counts["avoided"] += len(members)
+                    pending += 1
+                    if pending >= commit_every:
+                        # the checkpoint stays at the start of the batch until the whole batch is written,
+                        # the written rows already left the queue so a resume does not fetch them again
+                        checkpoint("running")
+                        pending = 0
+                        self.print_solar_run_progress(self.get_solar_run_progress(run_id))
+                else:
+                    after_location_id = locations[-1][0]
+        except KeyboardInterrupt:
+            # drop the half-written group, its response is in the cache so the resume does not pay for it again
+            self.conn.rollback()
+            counts["processed"] = counts["avoided"] = 0
+            checkpoint("stopped")
+            print("Solar backfill interrupted, run it again to resume.")
+            raise
+        except Exception as e:
+            self.conn.rollback()
+            counts["processed"] = counts["avoided"] = 0
+            checkpoint("failed", repr(e))
+            raise
+        checkpoint(status)
+        progress = self.get_solar_run_progress(run_id)
+        self.print_solar_run_progress(progress)
+        self.write_dashboard_snapshot()
+        return progress
+
+    ### End of solar backfill job methods ###
+
+    ### Start of sharded fetch methods ###
+
+    def iter_solar_shards(self, shard_size=500, batch_size=LOAD_CHUNK_SIZE, has_solar_data=1, limit=None):
+        # walk the work queue once in location_id order and cut it into shards of at most
+        # shard_size locations of one county, only one open shard per county is kept in memory
+        # limit caps the number of locations taken from the queue, None takes all of them
+        cursor = self.conn.cursor()
+        open_shards = defaultdict(list)
+        after_location_id = 0
+        taken = 0
+        while limit is None or taken < limit:
+            if limit is not None:
+                batch_size = min(batch_size, limit - taken)
+            cursor.execute(
+                SOLAR_SHARD_CANDIDATES_QUERY,
+                {"has_solar_data": has_solar_data, "after_location_id": after_location_id, "limit": batch_size},
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for location_id, latitude, longitude, has_solar_data, geocounty in rows:
+                shard = open_shards[geocounty]
+                shard.append((location_id, latitude, longitude, has_solar_data))
+                if len(shard) >= shard_size:
+                    yield geocounty, open_shards.pop(geocounty)
+            after_location_id = rows[-1][0]
+            taken += len(rows)
+        for geocounty, shard in open_shards.items():
+            yield geocounty, shard
+
+    @stage("solar_fetch_sharded")
+    def get_and_insert_solar_data_sharded(self, api_keys=None, requests_per_minute=300, shard_size=500,
+                                          commit_every=50, coalesce_radius_m=COALESCE_RADIUS_M, limit=None):
+        # multi-process version of get_and_insert_solar_data for several API keys.
+        # the queue is split into per-county shards that worker processes (one per key, each
+        # with its own rate budget) pull from a shared task queue, so faster keys take more shards.
+        # answers come back on a result queue and this process is the single writer, so
+        # the workers never touch SQLite. when a key is exhausted (403, or 429 after retries)
+        # its worker exits and the unanswered part of its shard is queued again for the others.
+        api_keys = api_keys or load_api_keys() or [self.api_key]
+        self.create_indexes()
+        self.update_locations_rtree()
+        task_queue = multiprocessing.Queue(maxsize=len(api_keys) * 2)
+        result_queue = multiprocessing.Queue()
+        workers = {}
+        for worker_id, api_key in enumerate(api_keys):
+            workers[worker_id] = multiprocessing.Process(
+                target=solar_fetch_worker,
+                args=(worker_id, api_key, requests_per_minute, task_queue, result_queue),
+                daemon=True,
+            )
+            workers[worker_id].start()
+        shards = self.iter_solar_shards(shard_size, limit=limit)
+        # shards waiting to be put on the task queue, re-queued work goes first
+        backlog = deque()
+        # shard_id -> {location_id: (location, members)} still waiting for an answer
+        unanswered = {}
+        # shard a worker is busy with, so its work can be re-queued if the worker goes away
+        worker_shards = {}
+        claimed = set()
+        next_shard_id = 0
+        shards_exhausted = False
+        stats = {"written": 0, "api_calls": 0, "cached": 0, "avoided": 0, "requeued": 0}
+        calls_per_key = defaultdict(int)
+        exhausted_keys = []
+        start = time.monotonic()
+
+        def write(location, members, solar_data):
+            self.write_solar_result(location, members, solar_data)
+            stats["written"] += 1
+            stats["avoided"] += len(members)
+            if stats["written"] % commit_every == 0:
+                self.conn.commit()
+                rate = stats["api_calls"] / (time.monotonic() - start) * 60
+                print(f"Processed {stats['written']} locations ({stats['api_calls']} API calls, {rate:.0f} requests/minute, {len(workers)} keys active)")
+                self.metrics.write_snapshot()
+
+        def next_task():
+            # the next shard for the workers, coalesced and with cached answers written right away
+            nonlocal shards_exhausted
+            while True:
+                if backlog:
+                    return backlog.popleft()
+                if shards_exhausted:
+                    return None
+                try:
+                    geocounty, locations = next(shards)
+                except StopIteration:
+                    shards_exhausted = True
+                    return None
+                locations = [location for location in locations if location[0] not in claimed]
+                pending = {}
+                for location, members in self.group_solar_candidates(locations, coalesce_radius_m):
+                    # a neighbour may already belong to a shard that is in flight
+                    members = [member for member in members if member[0] not in claimed]
+                    claimed.add(location[0])
+                    claimed.update(member[0] for member in members)
+                    cached = self.solar_cache.get(location[1], location[2]) if self.solar_cache is not None else None
+                    if cached is not None:
+                        stats["cached"] += 1
+                        self.metrics.count("solar_cache_hits")
+                        write(location, members, cached[1] if cached[0] == 200 else None)
+                    else:
+                        pending[location[0]] = (location, members)
+                if pending:
+                    return new_shard(pending)
+
+        def new_shard(pending):
+            # the workers only get the coordinates of the representatives
+            nonlocal next_shard_id
+            shard_id = next_shard_id
+            next_shard_id += 1
+            unanswered[shard_id] = pending
+            return shard_id, [location[:3] for location, members in pending.values()]
+
+        def requeue(shard_id):
+            # hand the unanswered locations of a shard to the remaining workers under a new shard_id,
+            # late answers for the old shard_id are ignored so nothing is written twice
+            pending = unanswered.pop(shard_id, None)
+            if pending:
+                backlog.append(new_shard(pending))
+                stats["requeued"] += len(pending)
+
+        def retire_worker(worker_id):
+            workers.pop(worker_id).join(timeout=5)
+            shard_id = worker_shards.pop(worker_id, None)
+            if shard_id is not None:
+                requeue(shard_id)
+
+        while workers:
+            # keep the task queue topped up
+            while not task_queue.full():
+                task = next_task()
+                if task is None:
+                    break
+                task_queue.put(task)
+            if shards_exhausted and not backlog and not unanswered:
+                break
+            try:
+                message = result_queue.get(timeout=1)
+            except queue.Empty:
+                # a worker that died without a message (e.g. killed) gives its shard back
+                for worker_id in [worker_id for worker_id, process in workers.items() if not process.is_alive()]:
+                    print(f"Worker {worker_id} stopped unexpectedly.")
+                    retire_worker(worker_id)
+                # a shard taken by a worker that died before reporting it is not owned by anyone
+                if shards_exhausted and not backlog and not worker_shards and task_queue.empty():
+                    for shard_id in list(unanswered):
+                        requeue(shard_id)
+                continue
+            kind, worker_id, shard_id = message[:3]
+            if kind == "started":
+                worker_shards[worker_id] = shard_id
+            elif kind == "result":
+                location_id, status_code, solar_data, calls, seconds = message[3:]
+                stats["api_calls"] += calls
+                calls_per_key[worker_id] += calls
+                # the workers time their own requests, the coordinator keeps the metrics
+                self.metrics.observe("solar_api_request", seconds, worker=worker_id)
+                self.metrics.count("solar_api_responses", status=status_code)
+                self.metrics.count("solar_api_retries", calls - 1)
+                if location_id not in unanswered.get(shard_id, {}):
+                    continue
+                location, members = unanswered[shard_id].pop(location_id)
+                if self.solar_cache is not None:
+                    self.solar_cache.put(location[1], location[2], status_code, solar_data)
+                write(location, members, solar_data if status_code == 200 else None)
+            elif kind == "shard_done":
+                worker_shards.pop(worker_id, None)
+                unanswered.pop(shard_id, None)
+            elif kind in ("exhausted", "failed"):
+                print(f"Worker {worker_id} stopped ({kind}: {message[3]}), re-queueing its remaining locations.")
+                if kind == "exhausted":
+                    stats["api_calls"] += message[4]
+                    calls_per_key[worker_id] += message[4]
+                    self.metrics.count("solar_api_responses", status=message[3])
+                self.metrics.count("solar_workers_stopped", reason=kind)
+                exhausted_keys.append(worker_id)
+                retire_worker(worker_id)
+        if not workers:
+            print("All API keys are exhausted, the remaining locations stay in the queue for the next run.")
+        # stop the workers that are still waiting for work, shards nobody will take are dropped
+        task_queue.cancel_join_thread()
+        for process in workers.values():
+            task_queue.put(None)
+        for process in workers.values():
+            process.join(timeout=5)
+        self.conn.commit()
+        self.write_dashboard_snapshot()
+        stats["calls_per_key"] = dict(calls_per_key)
+        stats["exhausted_keys"] = exhausted_keys
+        print(f"Processed {stats['written']} locations in {time.monotonic() - start:.1f} seconds "
+              f"({stats['api_calls']} API calls, {stats['cached']} cached, {stats['avoided']} avoided, {stats['requeued']} re-queued).")
+        return stats
+
+    ### End of sharded fetch methods ###
+
+    ### Start of geocoding methods ###
+
+    def check_geocode_tables_exist(self):
+        cursor = self.conn.cursor()
+        # GEOCODE_CACHE keeps every Census answer by normalized address, matched or not,
+        # LOCATION_GEOCODES has one row per checked location with its distance and mismatch flag
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS GEOCODE_CACHE (
+                address_key TEXT PRIMARY KEY,
+                match_status TEXT,
+                match_type TEXT,
+                matched_address TEXT,
+                geocoded_latitude REAL,
+                geocoded_longitude REAL,
+                date_geocoded DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS LOCATION_GEOCODES (
+                location_id INTEGER PRIMARY KEY,
+                address_key TEXT,
+                match_status TEXT,
+                geocoded_latitude REAL,
+                geocoded_longitude REAL,
+                distance_m REAL,
+                coordinates_mismatch INTEGER,
+                date_checked DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        self.conn.commit()
+
+    def lookup_geocode_cache(self, keys):
+        cursor = self.conn.cursor()
+        # {address_key: (match_status, latitude, longitude)} for the keys already geocoded
+        keys = list(keys)
+        cached = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            cursor.execute(
+                f"""
+                SELECT address_key, match_status, geocoded_latitude, geocoded_longitude
+                FROM GEOCODE_CACHE WHERE address_key IN ({placeholders});
+                """,
+                batch,
+            )
+            for key, match_status, latitude, longitude in cursor.fetchall():
+                cached[key] = (match_status, latitude, longitude)
+        return cached
+
+    def geocode_addresses(self, addresses, batch_size=None, workers=2):
+        cursor = self.conn.cursor()
+        # geocode {address_key: (street, city, state, zip)} through the Census batch endpoint,
+        # a few batches at a time (GEOCODE_BATCH_SIZE addresses by default), and store every answer in GEOCODE_CACHE
+        from geocoding import GEOCODE_BATCH_SIZE, geocode_batch
+        batch_size = batch_size or GEOCODE_BATCH_SIZE
+        keys = list(addresses)
+        batches = [
+            [(str(index), *addresses[key]) for index, key in enumerate(keys[start:start + batch_size], start)]
+            for start in range(0, len(keys), batch_size)
+        ]
+
+        def send(batch):
+            with self.metrics.timer("geocode_batch_request"):
+                return geocode_batch(batch)
+
+        rows = []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for results in executor.map(send, batches):
+                for record_id, (match_status, match_type, matched_address, latitude, longitude) in results.items():
+                    rows.append((keys[int(record_id)], match_status, match_type, matched_address, latitude, longitude))
+                    self.metrics.count("geocode_responses", match_status=match_status)
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO GEOCODE_CACHE
+            (address_key, match_status, match_type, matched_address, geocoded_latitude, geocoded_longitude)
+            VALUES (?, ?, ?, ?, ?, ?);
+            """,
+            rows,
+        )
+        self.conn.commit()
+        return {key: (match_status, latitude, longitude) for key, match_status, _, _, latitude, longitude in rows}
+
+    @stage("geocode_locations")
+    def geocode_locations(self, cities=None, property_code_range=(600, 699), limit=None, batch_size=None,
+                          workers=2, mismatch_m=None, recheck=False):
+        cursor = self.conn.cursor()
+        # compare the coordinates of the address points with where the Census geocoder puts their address.
+        # locations are read in chunks of batch_size * workers, cached addresses are not sent again and
+        # locations already in LOCATION_GEOCODES are skipped unless recheck is set, so a stopped run resumes.
+        # batch_size and mismatch_m default to GEOCODE_BATCH_SIZE and GEOCODE_MISMATCH_M
+        from geocoding import GEOCODE_BATCH_SIZE, GEOCODE_MISMATCH_M, address_keys
+        batch_size = batch_size or GEOCODE_BATCH_SIZE
+        mismatch_m = GEOCODE_MISMATCH_M if mismatch_m is None else mismatch_m
+        self.check_geocode_tables_exist()
+        filters = ""
+        params = {"min_property_code": property_code_range[0], "max_property_code": property_code_range[1]}
+        if cities:
+            filters += f" AND geocity IN ({', '.join(f':city_{i}' for i in range(len(cities)))})"
+            params.update({f"city_{i}": city for i, city in enumerate(cities)})
+        if not recheck:
+            filters += " AND NOT EXISTS (SELECT 1 FROM LOCATION_GEOCODES WHERE LOCATION_GEOCODES.location_id = LOCATIONS.location_id)"
+        query = GEOCODE_CANDIDATES_QUERY.format(filters=filters)
+        stats = {"checked": 0, "geocoded": 0, "cache_hits": 0, "matched": 0, "mismatched": 0}
+        after_location_id = 0
+        while limit is None or stats["checked"] < limit:
+            chunk_size = batch_size * max(1, workers)
+            if limit is not None:
+                chunk_size = min(chunk_size, limit - stats["checked"])
+            df = pd.read_sql_query(query, self.conn, params={**params, "after_location_id": after_location_id, "limit": chunk_size})
+            if df.empty:
+                break
+            after_location_id = int(df["location_id"].iloc[-1])
+            df["address_key"] = address_keys(df["geofulladdress"], df["geocity"], df["geostate"], df["geozip"])
+            unique = df.drop_duplicates("address_key")
+            answers = self.lookup_geocode_cache(unique["address_key"])
+            misses = unique[~unique["address_key"].isin(answers)]
+            self.metrics.count("geocode_cache_hits", len(unique) - len(misses))
+            self.metrics.count("geocode_cache_misses", len(misses))
+            if not misses.empty:
+                answers.update(self.geocode_addresses(
+                    {
+                        key: (street, city, state, zip_code)
+                        for key, street, city, state, zip_code in misses[
+                            ["address_key", "geofulladdress", "geocity", "geostate", "geozip"]
+                        ].itertuples(index=False, name=None)
+                    },
+                    batch_size,
+                    workers,
+                ))
+            # vectorized distance between the address point and its geocoded position, NaN if unmatched
+            answered = pd.DataFrame.from_dict(
+                answers, orient="index", columns=["match_status", "geocoded_latitude", "geocoded_longitude"]
+            )
+            df = df.join(answered, on="address_key")
+            df["distance_m"] = haversine_m(
+                df["latitude"], df["longitude"],
+                df["geocoded_latitude"].astype("float64"), df["geocoded_longitude"].astype("float64"),
+            )
+            matched = df["distance_m"].notna()
+            df["coordinates_mismatch"] = (df["distance_m"] > mismatch_m).astype(int).where(matched)
+            # addresses the endpoint did not answer are left unchecked, the next run picks them up
+            df = df[df["match_status"].notna()]
+            results = df[[
+                "location_id", "address_key", "match_status", "geocoded_latitude", "geocoded_longitude",
+                "distance_m", "coordinates_mismatch",
+            ]].astype(object)
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO LOCATION_GEOCODES
+                (location_id, address_key, match_status, geocoded_latitude, geocoded_longitude, distance_m, coordinates_mismatch)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+                """,
+                results.where(results.notna(), None).itertuples(index=False, name=None),
+            )
+            self.conn.commit()
+            stats["checked"] += len(df)
+            stats["geocoded"] += len(misses)
+            stats["cache_hits"] += len(unique) - len(misses)
+            stats["matched"] += int(df["distance_m"].notna().sum())
+            stats["mismatched"] += int((df["coordinates_mismatch"] == 1).sum())
+            print(
+                f"Geocoded up to location_id {after_location_id}: {stats['checked']} checked, "
+                f"{stats['matched']} matched, {stats['mismatched']} further than {mismatch_m} m from their address."
+            )
+        return stats
+
+    def get_geocode_mismatches(self, min_distance_m=None):
+        # flagged address points with both positions, furthest first, GEOCODE_MISMATCH_M by default
+        from geocoding import GEOCODE_MISMATCH_M
+        min_distance_m = GEOCODE_MISMATCH_M if min_distance_m is None else min_distance_m
+        return pd.read_sql_query(
+            """
+            SELECT
+                LOCATIONS.location_id,
+                LOCATIONS.geofulladdress,
+                LOCATIONS.geocity,
+                LOCATIONS.geozip,
+                LOCATIONS.dlgf_prop_class_code,
+                LOCATIONS.latitude,
+                LOCATIONS.longitude,
+                LOCATION_GEOCODES.geocoded_latitude,
+                LOCATION_GEOCODES.geocoded_longitude,
+                LOCATION_GEOCODES.distance_m
+            FROM LOCATION_GEOCODES
+            JOIN LOCATIONS ON LOCATIONS.location_id = LOCATION_GEOCODES.location_id
+            WHERE LOCATION_GEOCODES.distance_m > ?
+            ORDER BY LOCATION_GEOCODES.distance_m DESC;
+            """,
+            self.conn,
+            params=(min_distance_m,),
+        )
+
+    ### End of geocoding methods ###
+
+    ### Start of dashboard table methods ###
+
+    def create_dashboard_table(self):
+        cursor = self.conn.cursor()
+        # create the DASHBOARD table read by streamlit_prototype.load_data
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS DASHBOARD (
+                location_id INTEGER PRIMARY KEY,
+                latitude REAL,
+                longitude REAL,
+                dlgf_prop_class_code INTEGER,
+                geofulladdress TEXT,
+                geocity TEXT,
+                geozip TEXT,
+                geocounty TEXT,
+                census_tract_2010_ID INTEGER,
+                imagery_quality TEXT,
+                imagery_year INTEGER,
+                max_array_panels_count INTEGER,
+                panel_capacity_watts INTEGER,
+                nominal_power_watts INTEGER,
+                yearly_energy_dc_kwh REAL,
+                carbon_offset_factor_kg_per_mwh REAL,
+                estimated_annual_co2_savings_tons REAL,
+                estimated_houses_powered REAL,
+                property_code_description TEXT,
+                identified_as_disadvantaged TEXT
+            );
+            """
+        )
+        # small distinct-value tables that populate the dashboard filter dropdowns
+        cursor.execute("CREATE TABLE IF NOT EXISTS DASHBOARD_CITIES (geocity TEXT PRIMARY KEY);")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS DASHBOARD_PROPERTY_CODES (
+                property_code INTEGER PRIMARY KEY,
+                description TEXT
+            );
+            """
+        )
+        cursor.execute("CREATE TABLE IF NOT EXISTS DASHBOARD_FLAGS (identified_as_disadvantaged TEXT PRIMARY KEY);")
+        self.create_dashboard_version_table()
+        self.conn.commit()
+
+    def create_dashboard_version_table(self):
+        cursor = self.conn.cursor()
+        # single row counter bumped on every DASHBOARD change, used to tell if the snapshot is stale
+        # no commit here, it is also created on demand inside the refresh transactions
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS DASHBOARD_VERSION (
+                version INTEGER,
+                date_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        cursor.execute(
+            "INSERT INTO DASHBOARD_VERSION (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM DASHBOARD_VERSION);"
+        )
+
+    def update_dashboard_filter_tables(self, where="", params=()):
+        cursor = self.conn.cursor()
+        # add the cities, property codes and flags of the given DASHBOARD rows to the filter tables
+        cursor.execute(
+            f"INSERT OR IGNORE INTO DASHBOARD_CITIES SELECT DISTINCT geocity FROM DASHBOARD {where}", params
+        )
+        cursor.execute(
+            f"""
+            INSERT OR IGNORE INTO DASHBOARD_PROPERTY_CODES
+            SELECT dlgf_prop_class_code, MAX(property_code_description) FROM DASHBOARD {where}
+            GROUP BY dlgf_prop_class_code
+            """,
+            params,
+        )
+        cursor.execute(
+            f"INSERT OR IGNORE INTO DASHBOARD_FLAGS SELECT DISTINCT identified_as_disadvantaged FROM DASHBOARD {where}",
+            params,
+        )
+
+    @stage("build_dashboard")
+    def build_dashboard_table(self):
+        cursor = self.conn.cursor()
+        # (re)build the whole DASHBOARD table, e.g. after CEJST or PROPERTY_CODES were reloaded.
+        # it is dropped rather than emptied so a table from an older version gets the current column types
+        cursor.execute("DROP TABLE IF EXISTS DASHBOARD;")
+        self.create_dashboard_table()
+        cursor.execute("INSERT OR REPLACE INTO DASHBOARD " + DASHBOARD_SELECT)
+        cursor.execute("DELETE FROM DASHBOARD_CITIES;")
+        cursor.execute("DELETE FROM DASHBOARD_PROPERTY_CODES;")
+        cursor.execute("DELETE FROM DASHBOARD_FLAGS;")
+        self.update_dashboard_filter_tables()
+        self.bump_dashboard_version()
+        self.conn.commit()
+        self.create_indexes()
+        print(f"Dashboard table built with {cursor.execute('SELECT COUNT(*) FROM DASHBOARD;').fetchone()[0]} rows.")
+
+    def refresh_derived_rows(self, location_ids):
+        # bring everything derived from LOCATIONS and GOOGLE_SOLAR up to date for the given locations
+        location_ids = list(location_ids)
+        self.refresh_dashboard_rows(location_ids)
+        self.refresh_site_scores(location_ids)
+        self.refresh_solar_rollup(location_ids)
+
+    def refresh_dashboard_rows(self, location_ids):
+        cursor = self.conn.cursor()
+        # incrementally bring the DASHBOARD rows of the given locations up to date,
+        # rows of locations that no longer qualify (retired, no solar data) are removed
+        location_ids = list(location_ids)
+        if not self.dashboard_exists:
+            return
+        for start in range(0, len(location_ids), 500):
+            batch = location_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            cursor.execute(f"DELETE FROM DASHBOARD WHERE location_id IN ({placeholders})", batch)
+            cursor.execute(
+                "INSERT OR REPLACE INTO DASHBOARD " + DASHBOARD_SELECT
+                + f" AND LOCATIONS.location_id IN ({placeholders})",
+                batch,
+            )
+            self.update_dashboard_filter_tables(f"WHERE location_id IN ({placeholders})", batch)
+        if location_ids:
+            self.bump_dashboard_version()
+
+    @property
+    def dashboard_exists(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='DASHBOARD';")
+        return cursor.fetchone() is not None
+
+    def bump_dashboard_version(self):
+        cursor = self.conn.cursor()
+        # runs inside the caller's transaction, so the version only moves if the DASHBOARD change commits
+        self.create_dashboard_version_table()
+        cursor.execute(
+            "UPDATE DASHBOARD_VERSION SET version = version + 1, date_updated = CURRENT_TIMESTAMP;"
+        )
+
+    def get_dashboard_version(self):
+        cursor = self.conn.cursor()
+        in_transaction = self.conn.in_transaction
+        self.create_dashboard_version_table()
+        # the on-demand INSERT opens a transaction, end it here unless the caller has its own,
+        # an open write transaction would block every other writer on the database
+        if not in_transaction:
+            self.conn.commit()
+        cursor.execute("SELECT version FROM DASHBOARD_VERSION;")
+        return cursor.fetchone()[0]
+
+    @stage("write_snapshot")
+    def write_dashboard_snapshot(self, path=DASHBOARD_SNAPSHOT, chunk_size=LOAD_CHUNK_SIZE):
+        # write DASHBOARD to an Arrow IPC file in location_id order, chunk by chunk so the
+        # whole table is never held in memory. the file is written next to the target and
+        # renamed over it, so running apps keep reading their old mapping until they reload
+        if not self.dashboard_exists:
+            return
+        import pyarrow as pa
+        version = self.get_dashboard_version()
+        schema = pa.schema(
+            [(column, getattr(pa, arrow_type)()) for column, arrow_type in DASHBOARD_SNAPSHOT_COLUMNS],
+            metadata={"dashboard_version": str(version)},
+        )
+        query = f"SELECT {', '.join(schema.names)} FROM DASHBOARD ORDER BY location_id;"
+        temp_path = path + ".part"
+        rows = 0
+        with pa.OSFile(temp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for chunk in pd.read_sql_query(query, self.conn, chunksize=chunk_size):
+                writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows += len(chunk)
+        os.replace(temp_path, path)
+        print(f"Dashboard snapshot written to {path} with {rows} rows (version {version}).")
+
+    ### End of dashboard table methods ###
+
+    ### Start of site ranking methods ###
+
+    def create_site_ranking_tables(self):
+        cursor = self.conn.cursor()
+        # SITE_SCORES holds the score of every location with solar data, LEADERBOARDS the best
+        # leaderboard_size locations per region and RANKING_CONFIG the weights they were scored with
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS SITE_SCORES (
+                location_id INTEGER PRIMARY KEY,
+                geocounty TEXT,
+                geocity TEXT,
+                dlgf_prop_class_code INTEGER,
+                score REAL,
+                yearly_energy_dc_kwh REAL,
+                max_array_panels_count INTEGER,
+                imagery_year INTEGER,
+                identified_as_disadvantaged INTEGER,
+                date_scored DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS LEADERBOARDS (
+                region_type TEXT,
+                region TEXT,
+                location_id INTEGER,
+                score REAL,
+                PRIMARY KEY (region_type, region, location_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS RANKING_CONFIG (
+                weights TEXT,
+                leaderboard_size INTEGER,
+                reference_year INTEGER,
+                date_built DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+
+    @property
+    def site_rankings_exist(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='RANKING_CONFIG';")
+        return cursor.fetchone() is not None
+
+    def get_ranking_config(self):
+        cursor = self.conn.cursor()
+        row = cursor.execute("SELECT weights, leaderboard_size, reference_year FROM RANKING_CONFIG;").fetchone()
+        return {"weights": json.loads(row[0]), "leaderboard_size": row[1], "reference_year": row[2]}
+
+    def select_site_score_inputs(self, where, params):
+        cursor = self.conn.cursor()
+        # SITE_SCORE_SELECT rows as a dict of column -> list, the incremental refresh scores a few
+        # rows at a time and a DataFrame per call would cost more than the queries themselves
+        rows = cursor.execute(SITE_SCORE_SELECT + where, params).fetchall()
+        names = [description[0] for description in cursor.description]
+        return dict(zip(names, (list(values) for values in zip(*rows)))) if rows else None
+
+    def insert_site_scores(self, columns, config):
+        cursor = self.conn.cursor()
+        # score a batch of SITE_SCORE_SELECT columns and store it, the scores are added to columns
+        from site_ranking import score_sites
+        columns["score"] = score_sites(columns, config["weights"], config["reference_year"]).tolist()
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO SITE_SCORES ({', '.join(SITE_SCORES_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in SITE_SCORES_COLUMNS)})",
+            zip(*(columns[name] for name in SITE_SCORES_COLUMNS)),
+        )
+        return columns
+
+    def refill_leaderboard(self, region_type, region=None):
+        cursor = self.conn.cursor()
+        # replace the top-K of one region (or of every region of the type when region is None)
+        # with the best SITE_SCORES rows, read through the (region, score) index
+        from site_ranking import LEADERBOARD_REGIONS, STATE_REGION
+        column = LEADERBOARD_REGIONS[region_type]
+        size = self.get_ranking_config()["leaderboard_size"]
+        if column is None:
+            cursor.execute("DELETE FROM LEADERBOARDS WHERE region_type = ?;", (region_type,))
+            cursor.execute(
+                """
+                INSERT INTO LEADERBOARDS (region_type, region, location_id, score)
+                SELECT ?, ?, location_id, score FROM SITE_SCORES
+                ORDER BY score DESC, location_id LIMIT ?;
+                """,
+                (region_type, STATE_REGION, size),
+            )
+        elif region is None:
+            cursor.execute("DELETE FROM LEADERBOARDS WHERE region_type = ?;", (region_type,))
+            cursor.execute(
+                f"""
+                INSERT INTO LEADERBOARDS (region_type, region, location_id, score)
+                SELECT ?, region, location_id, score FROM (
+                    SELECT CAST({column} AS TEXT) AS region, location_id, score,
+                        ROW_NUMBER() OVER (PARTITION BY {column} ORDER BY score DESC, location_id) AS rank
+                    FROM SITE_SCORES
+                    WHERE {column} IS NOT NULL
+                )
+                WHERE rank <= ?;
+                """,
+                (region_type, size),
+            )
+        else:
+            cursor.execute("DELETE FROM LEADERBOARDS WHERE region_type = ? AND region = ?;", (region_type, str(region)))
+            cursor.execute(
+                f"""
+                INSERT INTO LEADERBOARDS (region_type, region, location_id, score)
+                SELECT ?, ?, location_id, score FROM SITE_SCORES
+                WHERE {column} = ?
+                ORDER BY score DESC, location_id LIMIT ?;
+                """,
+                (region_type, str(region), region, size),
+            )
+
+    @stage("build_rankings")
+    def build_site_rankings(self, weights=None, leaderboard_size=None, chunk_size=LOAD_CHUNK_SIZE):
+        cursor = self.conn.cursor()
+        # score every location with solar data and fill the leaderboards from scratch, e.g. with new weights.
+        # leaderboard_size defaults to LEADERBOARD_SIZE
+        from site_ranking import LEADERBOARD_REGIONS, LEADERBOARD_SIZE, SITE_SCORE_WEIGHTS, score_sites
+        leaderboard_size = leaderboard_size or LEADERBOARD_SIZE
+        cursor.execute("DROP TABLE IF EXISTS SITE_SCORES;")
+        cursor.execute("DROP TABLE IF EXISTS LEADERBOARDS;")
+        cursor.execute("DROP TABLE IF EXISTS RANKING_CONFIG;")
+        self.create_site_ranking_tables()
+        config = {
+            "weights": weights or SITE_SCORE_WEIGHTS,
+            "leaderboard_size": leaderboard_size,
+            "reference_year": datetime.date.today().year,
+        }
+        # validate the weights before anything is written
+        score_sites({name: [] for name in SITE_SCORES_COLUMNS}, config["weights"], config["reference_year"])
+        cursor.execute(
+            "INSERT INTO RANKING_CONFIG (weights, leaderboard_size, reference_year) VALUES (?, ?, ?);",
+            (json.dumps(config["weights"]), leaderboard_size, config["reference_year"]),
+        )
+        after_location_id = 0
+        scored = 0
+        while True:
+            columns = self.select_site_score_inputs(
+                " AND LOCATIONS.location_id > ? ORDER BY LOCATIONS.location_id LIMIT ?", (after_location_id, chunk_size)
+            )
+            if columns is None:
+                break
+            self.insert_site_scores(columns, config)
+            scored += len(columns["location_id"])
+            after_location_id = columns["location_id"][-1]
+        self.conn.commit()
+        self.create_indexes()
+        for region_type in LEADERBOARD_REGIONS:
+            self.refill_leaderboard(region_type)
+        self.conn.commit()
+        boards = cursor.execute("SELECT COUNT(DISTINCT region_type || '|' || region) FROM LEADERBOARDS;").fetchone()[0]
+        print(f"Scored {scored} sites into {boards} leaderboards of up to {leaderboard_size} locations.")
+
+    def refresh_site_scores(self, location_ids):
+        cursor = self.conn.cursor()
+        # incrementally rescore the given locations, runs inside the caller's transaction.
+        # a leaderboard is only refilled if one of the locations was on it or now beats its last entry
+        location_ids = [int(location_id) for location_id in location_ids]
+        if not location_ids or not self.site_rankings_exist:
+            return
+        from site_ranking import LEADERBOARD_REGIONS, STATE_REGION
+        config = self.get_ranking_config()
+        size = config["leaderboard_size"]
+        # boards the locations are on now, and (region_type, region) -> best new score in the region
+        on_board = set()
+        best_scores = {}
+        for start in range(0, len(location_ids), 500):
+            batch = location_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            on_board.update(cursor.execute(
+                f"SELECT DISTINCT region_type, region FROM LEADERBOARDS WHERE location_id IN ({placeholders});", batch
+            ).fetchall())
+            cursor.execute(f"DELETE FROM SITE_SCORES WHERE location_id IN ({placeholders});", batch)
+            columns = self.select_site_score_inputs(f" AND LOCATIONS.location_id IN ({placeholders})", batch)
+            if columns is None:
+                continue
+            columns = self.insert_site_scores(columns, config)
+            for region_type, column in LEADERBOARD_REGIONS.items():
+                regions = columns[column] if column else [STATE_REGION] * len(columns["score"])
+                for region, score in zip(regions, columns["score"]):
+                    # locations without a city or county are only ranked statewide
+                    if region is None:
+                        continue
+                    key = (region_type, str(region))
+                    best_scores[key] = max(score, best_scores.get(key, score))
+        for region_type, region in on_board | set(best_scores):
+            if (region_type, region) not in on_board:
+                count, lowest = cursor.execute(
+                    "SELECT COUNT(*), MIN(score) FROM LEADERBOARDS WHERE region_type = ? AND region = ?;",
+                    (region_type, region),
+                ).fetchone()
+                if count >= size and best_scores[(region_type, region)] <= lowest:
+                    continue
+            column = LEADERBOARD_REGIONS[region_type]
+            if column == "dlgf_prop_class_code":
+                region = int(region)
+            self.refill_leaderboard(region_type, region)
+
+    ### End of site ranking methods ###
+
+    ### Start of solar rollup methods ###
+
+    def create_solar_rollup_tables(self):
+        cursor = self.conn.cursor()
+        keys = ", ".join(ROLLUP_KEYS)
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS SOLAR_ROLLUP (
+                geocounty TEXT NOT NULL,
+                geocity TEXT NOT NULL,
+                dlgf_prop_class_code INTEGER NOT NULL,
+                identified_as_disadvantaged INTEGER NOT NULL,
+                site_count INTEGER,
+                total_yearly_energy_dc_kwh REAL,
+                total_co2_savings_tons REAL,
+                total_houses_powered REAL,
+                total_panels INTEGER,
+                PRIMARY KEY ({keys})
+            ) WITHOUT ROWID;
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS SOLAR_ROLLUP_LOCATIONS (
+                location_id INTEGER PRIMARY KEY,
+                geocounty TEXT,
+                geocity TEXT,
+                dlgf_prop_class_code INTEGER,
+                identified_as_disadvantaged INTEGER,
+                yearly_energy_dc_kwh REAL,
+                estimated_annual_co2_savings_tons REAL,
+                estimated_houses_powered REAL,
+                max_array_panels_count INTEGER
+            );
+            """
+        )
+
+    @property
+    def solar_rollup_exists(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='SOLAR_ROLLUP';")
+        return cursor.fetchone() is not None
+
+    def upsert_rollup_groups(self, where, params, sign):
+        cursor = self.conn.cursor()
+        # add (sign 1) or take out (sign -1) the SOLAR_ROLLUP_LOCATIONS rows matching where
+        keys = ", ".join(ROLLUP_KEYS)
+        totals = ", ".join(ROLLUP_TOTALS)
+        sums = ", ".join(f"{sign} * SUM({column})" for column in ROLLUP_TOTALS.values())
+        updates = ", ".join(
+            f"{column} = {column} + excluded.{column}" for column in ["site_count"] + list(ROLLUP_TOTALS)
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO SOLAR_ROLLUP ({keys}, site_count, {totals})
+            SELECT {keys}, {sign} * COUNT(*), {sums}
+            FROM SOLAR_ROLLUP_LOCATIONS
+            WHERE {where}
+            GROUP BY {keys}
+            ON CONFLICT ({keys}) DO UPDATE SET {updates};
+            """,
+            params,
+        )
+
+    @stage("build_rollup")
+    def build_solar_rollup(self):
+        cursor = self.conn.cursor()
+        # rebuild the rollup from scratch, afterwards refresh_solar_rollup keeps it current
+        cursor.execute("DROP TABLE IF EXISTS SOLAR_ROLLUP;")
+        cursor.execute("DROP TABLE IF EXISTS SOLAR_ROLLUP_LOCATIONS;")
+        self.create_solar_rollup_tables()
+        cursor.execute(f"INSERT INTO SOLAR_ROLLUP_LOCATIONS {ROLLUP_SELECT};")
+        self.upsert_rollup_groups("1", (), 1)
+        self.conn.commit()
+        sites, groups = cursor.execute(
+            "SELECT SUM(site_count), COUNT(*) FROM SOLAR_ROLLUP;"
+        ).fetchone()
+        print(f"Solar rollup built with {sites or 0} locations in {groups} groups.")
+
+    def refresh_solar_rollup(self, location_ids):
+        cursor = self.conn.cursor()
+        # move the given locations out of the groups they were counted in and into their current ones,
+        # runs inside the caller's transaction and only touches the rows of these locations
+        location_ids = [int(location_id) for location_id in location_ids]
+        if not location_ids or not self.solar_rollup_exists:
+            return
+        for start in range(0, len(location_ids), 500):
+            batch = location_ids[start:start + 500]
+            where = f"location_id IN ({', '.join('?' for _ in batch)})"
+            self.upsert_rollup_groups(where, batch, -1)
+            cursor.execute(f"DELETE FROM SOLAR_ROLLUP_LOCATIONS WHERE {where};", batch)
+            cursor.execute(
+                f"INSERT INTO SOLAR_ROLLUP_LOCATIONS {ROLLUP_SELECT} AND LOCATIONS.{where};", batch
+            )
+            self.upsert_rollup_groups(where, batch, 1)
+        # groups whose last location moved away or lost its solar data
+        cursor.execute("DELETE FROM SOLAR_ROLLUP WHERE site_count <= 0;")
+
+    def export_solar_summary(self, path="solar_summary.csv", group_by=("county",), **filters):
+        # write the rollup grouped by the given dimensions to a CSV file, see fetch_solar_summary
+        # for the filters, e.g. export_solar_summary(group_by=("county",), flags=("yes",), code_range=(600, 699))
+        df = fetch_solar_summary(self.conn, group_by, **filters)
+        df.to_csv(path, index=False)
+        print(f"Solar summary of {len(df)} groups written to {path}.")
+        return df
+
+    ### End of solar rollup methods ###
+
     ### Start of property codes table methods ###
     
     def check_property_codes_table_exists(self):
@@ -585,121 +2666,226 @@ class community_solarDatabase:
         )
         self.conn.commit()
 
+    @stage("load_property_codes")
     def insert_property_codes_data(self):
-        cursor = self.conn.cursor()
         # read the CSV file to get the data to insert into the table
         df = pd.read_csv("property_codes.csv", low_memory=False)
         df.fillna("", inplace=True)
         print("Columns:", df.columns.tolist())
-        header = df.columns
-        table_name = "PROPERTY_CODES"
-        # SQLite uses ? as the placeholder
-        insert_query = (
-            f"INSERT INTO {table_name} ({', '.join(['\"' + col + '\"' for col in header])}) "
-            f"VALUES ({', '.join(['?' for _ in header])})"
-        )
         print("Inserting rows:")
-        # loop through the rows of the DataFrame and insert them into the table
-        for index, row in df.iterrows():
-            values = row.tolist()
-            try:
-                cursor.execute(insert_query, values)
-                if index % 1000 == 0:
-                    print(f"Inserted row {index}")
-            except sqlite3.Error as err:
-                print(values)
-                print("Error inserting row:", err)
-        self.conn.commit()
+        self.bulk_insert_dataframe("PROPERTY_CODES", df)
 
     ### End of property codes table methods ###
 
+    ### Start of index methods ###
+
+    @stage("create_indexes")
+    def create_indexes(self):
+        cursor = self.conn.cursor()
+        # create the secondary indexes used by the solar work queue and the dashboard joins
+        tables = {
+            row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        }
+        if "LOCATIONS" in tables:
+            # the indexes and the work queue rely on the delta refresh columns
+            self.ensure_columns("LOCATIONS", LOCATIONS_REFRESH_COLUMNS)
+            # and the CEJST join on the integer tract key
+            if self.ensure_columns("LOCATIONS", LOCATIONS_TRACT_COLUMNS):
+                self.backfill_locations_tracts()
+        if "GOOGLE_SOLAR" in tables:
+            self.ensure_columns("GOOGLE_SOLAR", {"source_location_id": "INTEGER"})
+        for table_name, index_sql in INDEXES:
+            if table_name in tables:
+                cursor.execute(index_sql)
+        # refresh the planner statistics for the new indexes
+        cursor.execute("PRAGMA optimize;")
+        self.conn.commit()
+
+    def check_solar_candidates_plan(self):
+        cursor = self.conn.cursor()
+        # regression check: the work-queue query must be an index range scan on LOCATIONS
+        # plus an index probe into GOOGLE_SOLAR, never a full scan or a sort of every row
+        cursor.execute(
+            "EXPLAIN QUERY PLAN " + SOLAR_CANDIDATES_QUERY,
+            {"has_solar_data": 1, "after_location_id": 0, "limit": 1},
+        )
+        plan = [row[3] for row in cursor.fetchall()]
+        problems = []
+        if not any("LOCATIONS USING" in step and "idx_locations_solar_queue" in step for step in plan):
+            problems.append("LOCATIONS is not read through idx_locations_solar_queue")
+        if not any("GOOGLE_SOLAR USING" in step and "idx_google_solar_location_id" in step for step in plan):
+            problems.append("GOOGLE_SOLAR is not probed through idx_google_solar_location_id")
+        if any("TEMP B-TREE" in step for step in plan):
+            problems.append("the query sorts its result instead of reading it in index order")
+        if problems:
+            print("Unexpected query plan for the solar work queue:")
+            for step in plan:
+                print("   ", step)
+            for problem in problems:
+                print("Problem:", problem)
+        return not problems
+
+    ### End of index methods ###
+
+    ### Start of bulk load methods ###
+
+    def set_pragmas(self, pragmas):
+        cursor = self.conn.cursor()
+        # apply the given PRAGMAs and return the previous values so they can be restored
+        previous = {}
+        for name, value in pragmas.items():
+            if value is None:
+                continue
+            previous[name] = cursor.execute(f"PRAGMA {name};").fetchone()[0]
+            cursor.execute(f"PRAGMA {name} = {value};")
+        return previous
+
+    @contextmanager
+    def load_pragmas(self, pragmas=None):
+        # relax durability while bulk loading, a failed rebuild is simply re-run
+        self.conn.commit()
+        previous = self.set_pragmas(pragmas or LOAD_PRAGMAS)
+        try:
+            yield
+        finally:
+            self.conn.commit()
+            self.set_pragmas(previous)
+
+    def check_load_rejects_table_exists(self):
+        cursor = self.conn.cursor()
+        # rows that fail to insert during a bulk load are kept here instead of being printed
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS LOAD_REJECTS (
+                reject_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT,
+                row_data TEXT,
+                error TEXT,
+                date_added DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+
+    def bulk_insert(self, table_name, columns, rows, chunk_size=LOAD_CHUNK_SIZE):
+        cursor = self.conn.cursor()
+        # SQLite uses ? as the placeholder
+        quoted_columns = ", ".join('"' + col + '"' for col in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        insert_query = f"INSERT INTO {table_name} ({quoted_columns}) VALUES ({placeholders})"
+        self.check_load_rejects_table_exists()
+        self.conn.commit()
+        inserted = 0
+        rejected = 0
+        rows = iter(rows)
+        # insert the rows in chunks, each chunk in its own explicit transaction
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            chunk_start = time.perf_counter()
+            cursor.execute("BEGIN")
+            try:
+                cursor.executemany(insert_query, chunk)
+                inserted += len(chunk)
+                self.metrics.count("rows_inserted", len(chunk), table=table_name)
+            except sqlite3.Error:
+                # retry the failing chunk row by row so only the bad rows are rejected
+                cursor.execute("ROLLBACK")
+                cursor.execute("BEGIN")
+                for values in chunk:
+                    try:
+                        cursor.execute(insert_query, values)
+                        inserted += 1
+                        self.metrics.count("rows_inserted", table=table_name)
+                    except sqlite3.Error as err:
+                        rejected += 1
+                        self.metrics.count("rows_rejected", table=table_name)
+                        cursor.execute(
+                            "INSERT INTO LOAD_REJECTS (table_name, row_data, error) VALUES (?, ?, ?)",
+                            (table_name, json.dumps(dict(zip(columns, values)), default=str), str(err)),
+                        )
+            cursor.execute("COMMIT")
+            self.metrics.observe("bulk_insert_chunk", time.perf_counter() - chunk_start, table=table_name)
+            print(f"Inserted {inserted} rows into {table_name}")
+        if rejected:
+            print(f"Rejected {rejected} rows, see the LOAD_REJECTS table.")
+        return inserted
+
+    def bulk_insert_dataframe(self, table_name, df, chunk_size=LOAD_CHUNK_SIZE):
+        # convert missing values to NULL and feed plain tuples to executemany,
+        # without building a pandas row object for every row
+        df = df.astype(object).where(df.notna(), None)
+        rows = df.itertuples(index=False, name=None)
+        return self.bulk_insert(table_name, list(df.columns), rows, chunk_size)
+
+    ### End of bulk load methods ###
+
+    def close(self):
+        # close the database and the solar response cache if they were opened
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._solar_cache is not None:
+            self._solar_cache.close()
+            self._solar_cache = None
+
     def clear_database(self):
         # This function clears the database by dropping all tables
         # and resetting the database to its initial state.
         cursor = self.conn.cursor()
         cursor.execute("DROP TABLE IF EXISTS GOOGLE_SOLAR;")
+        cursor.execute("DROP TABLE IF EXISTS DASHBOARD;")
+        cursor.execute("DROP TABLE IF EXISTS DASHBOARD_CITIES;")
+        cursor.execute("DROP TABLE IF EXISTS DASHBOARD_PROPERTY_CODES;")
+        cursor.execute("DROP TABLE IF EXISTS DASHBOARD_FLAGS;")
+        cursor.execute("DROP TABLE IF EXISTS DASHBOARD_VERSION;")
+        cursor.execute("DROP TABLE IF EXISTS LOCATIONS_RTREE;")
         cursor.execute("DROP TABLE IF EXISTS LOCATIONS;")
         cursor.execute("DROP TABLE IF EXISTS NONPROFITS;")
         cursor.execute("DROP TABLE IF EXISTS CEJST;")
         cursor.execute("DROP TABLE IF EXISTS PROPERTY_CODES;")
+        cursor.execute("DROP TABLE IF EXISTS LOAD_REJECTS;")
+        cursor.execute("DROP TABLE IF EXISTS SOLAR_RUNS;")
+        cursor.execute("DROP TABLE IF EXISTS LOCATION_GEOCODES;")
+        cursor.execute("DROP TABLE IF EXISTS SITE_SCORES;")
+        cursor.execute("DROP TABLE IF EXISTS LEADERBOARDS;")
+        cursor.execute("DROP TABLE IF EXISTS RANKING_CONFIG;")
+        cursor.execute("DROP TABLE IF EXISTS SOLAR_ROLLUP;")
+        cursor.execute("DROP TABLE IF EXISTS SOLAR_ROLLUP_LOCATIONS;")
+        # GEOCODE_CACHE is kept, like solar_cache.db, so a rebuild does not send every address again
         self.conn.commit()
         print("Database cleared.")
 
-    def export_data_dictionary_to_excel(self):
-        cursor = self.conn.cursor()
-        # column definitions for the tables
-        column_definitions = {
-        "location_id": "The unique identifier for the location.",
-        "has_solar_data": "Indicates if solar data has been fetched for the location. 0: No data, 1: No solar data, 2: Solar data available.",
-        "latitude": "The latitude of the location.",
-        "longitude": "The longitude of the location.",
-        "dlgf_prop_class_code": "The property class code from the Indiana Department of Local Government Finance.",
-        "geofulladdress": "The full address of the location.",
-        "geocity": "The city of the location.",
-        "geostate": "The state of the location.",
-        "geozip": "The ZIP code of the location.",
-        "geocounty": "The county of the location.",
-        "geobg10": "The 2010 census block group of the location.",
-        "geobg20": "The 2020 census block group of the location.",
-        "solar_id": "The unique identifier for the solar data.",
-        "location_id": "The unique identifier for the location associated with the solar data.",
-        "latitude": "The latitude of the location.",
-        "longitude": "The longitude of the location.",
-        "imagery_quality": "The quality of the imagery used for the solar data.",
-        "imagery_date": "The date of the imagery used for the solar data.",
-        "max_array_panels_count": "The maximum number of solar panels in the array.",
-        "panel_capacity_watts": "The capacity of each solar panel in watts.",
-        "nominal_power_watts": "The nominal power of the solar array in watts.",
-        "yearly_energy_dc_kwh": "The estimated yearly energy output of the solar array in kilowatt-hours.",
-        "carbon_offset_factor_kg_per_mwh": "The carbon offset factor in kilograms per megawatt-hour.",
-        "estimated_annual_co2_savings_tons": "The estimated annual CO2 savings in tons.",
-        "estimated_houses_powered": "The estimated number of houses powered by the solar array.",
-        "date_added": "The date the solar data was added to the database.",
-        "cejst_id": "The unique identifier for the CEJST data.",
-        "census_tract_2010_ID": "The 2010 census tract ID.",
-        "identified_as_disadvantaged": "Indicates if the census tract is identified as disadvantaged.",
-        "date_added": "The date the CEJST data was added to the database.",
-        "property_code_id": "The unique identifier for the property code.",
-        "property_code": "The property code.",
-        "description": "The description of the property code.",
-        "name": "The name of the property code.",
-        "date_added": "The date the property code was added to the database."
-        }
-        # retrieve all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [table[0] for table in cursor.fetchall()]
-        # create an Excel writer object using pandas
-        writer = pd.ExcelWriter("community_solar_database_data_dictionary.xlsx", engine='xlsxwriter')
-        for table_name in tables:
-            # get the structure of the table using PRAGMA table_info
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns = cursor.fetchall()
-            # add the column descriptions to the columns list
-            columns = [(col[0], col[1], col[2], col[3], col[4], col[5], column_definitions.get(col[1], "")) for col in columns]
-            # each entry in columns is a tuple:
-            # (cid, column_name, data_type, notnull, default_value, pk)
-            df = pd.DataFrame(columns, columns=['cid', 'column_name', 'data_type', 'notnull', 'default_value', 'pk', 'column_definition'])
-            # write the DataFrame to a separate sheet named after the table
-            df.to_excel(writer, sheet_name=table_name, index=False)
-        # save the Excel file and close the writer
-        writer.close()
-
-    def create_database_and_build(self):
+    @stage("export_data_dictionary")
+    def export_data_dictionary_to_excel(self, path=DATA_DICTIONARY_XLSX):
+        # the column definitions and the export live in data_dictionary.py
+        tables = export_data_dictionary(self.conn, path)
+        print(f"Data dictionary of {len(tables)} tables written to {path}.")
+
+    @stage("build")
+    def create_database_and_build(self, include_nonprofits=False):
+        # Relax the journal and sync settings while the tables are loaded
+        with self.load_pragmas():
+            self.build_tables(include_nonprofits)
+
+        # Export the database structure to an Excel file
+        self.export_data_dictionary_to_excel()
+
+        self.close()
+
+    def build_tables(self, include_nonprofits=False):
         # Gets the newest address data from the Indiana map and saves it to a CSV file
         # Creates the LOCATIONS table and inserts the address data into the table for every location
         self.get_locations_data()
         self.check_locations_table_exists()
         self.insert_locations_data()
 
-        '''
-        We have currently dropped this table to save time and space.
-        The data is not needed for the current project, but it can be added back in if needed.
-        '''
-        # Creates the NONPROFITS table and inserts the nonprofit data into the table for every location
-        #self.get_nonprofit_data() # Only run this if need be, will take awhile to scrape the data
-        #self.check_nonprofits_table_exists()
-        #self.parse_nonprofit_data()
-        #self.insert_nonprofit_data()
+        # Creates the NONPROFITS table from the county exports in downloads/named/ when asked for,
+        # the files are parsed in parallel so this takes seconds
+        #self.get_nonprofit_data() # Only run this if need be, scrapes the nonprofit page table
+        if include_nonprofits:
+            self.check_nonprofits_table_exists()
+            self.insert_nonprofit_data()
 
         # Creates the GOOGLE_SOLAR table
         self.check_google_solar_table_exists()
@@ -714,22 +2900,22 @@ class community_solarDatabase:
         self.check_property_codes_table_exists()
         self.insert_property_codes_data()
 
-        # Export the database structure to an Excel file
-        self.export_data_dictionary_to_excel()
+        # Creates the indexes after the bulk loads, which is faster than maintaining them row by row
+        self.create_indexes()
+        self.update_locations_rtree()
 
-        self.conn.close()
+        # Creates the denormalized DASHBOARD table read by the Streamlit app
+        self.build_dashboard_table()
+        self.write_dashboard_snapshot()
 
-if __name__ == "__main__":
-
-    db = community_solarDatabase()
-
-    # create the database and build the tables
-    #db.create_database_and_build()
-
-    # export the database structure to an Excel file
-    #db.export_data_dictionary_to_excel()
-
-    # Get and update solar data for the locations in the database
-    #db.get_and_insert_solar_data(limit=20)
+        # Scores the sites with solar data and fills the per-region leaderboards
+        self.build_site_rankings()
 
+        # Sums the solar rows per county, city, property code and disadvantaged flag
+        self.build_solar_rollup()
+        self.check_solar_candidates_plan()
 
+if __name__ == "__main__":
+    # the command line lives in cli.py, `python solar_database_current.py stats` is the same as `python cli.py stats`
+    from cli import main
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import os
+import time
+import requests
+from rate_limiter import TokenBucket
+
+# findClosest request helpers and the worker process used by the sharded solar fetch.
+# Workers only talk to the API: they pull shards of locations from a task queue and
+# send the raw answers back on a result queue, so the coordinator stays the only
+# process that writes to the SQLite files.
+
+# set SOLAR_API_URL to point the pipeline at another server, e.g. benchmarks/fake_solar_api.py
+SOLAR_API_URL = os.environ.get("SOLAR_API_URL", "https://solar.googleapis.com/v1/buildingInsights:findClosest")
+# one key per line, blank lines and lines starting with # are skipped
+API_KEYS_FILE = "google_api_keys.txt"
+# a key is treated as exhausted after this many retryable answers in a row for the same location
+MAX_RATE_LIMITED = 3
+# seconds a worker backs off after a 429
+RATE_LIMIT_PAUSE_SECONDS = 90
+# seconds a worker backs off after a server error, a timeout or an answer that is not JSON
+SERVER_ERROR_PAUSE_SECONDS = 5
+# seconds to wait for findClosest to answer, a stalled connection must not hold a worker forever
+SOLAR_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("SOLAR_REQUEST_TIMEOUT_SECONDS", 30))
+# status of a request that timed out or lost its connection before any answer
+NO_RESPONSE_STATUS = 0
+# answers that are retried, and that leave the location in the queue when they persist
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504, NO_RESPONSE_STATUS)
+# answers after which the location is not written, the caller stops or hands it to another key
+UNANSWERED_STATUS_CODES = (403,) + RETRYABLE_STATUS_CODES
+
+
+def request_solar_data(api_key, latitude, longitude, session=None, timeout=SOLAR_REQUEST_TIMEOUT_SECONDS):
+    # send one findClosest request and return (status_code, response_json).
+    # a timeout, a lost connection or a body that is not JSON (e.g. the HTML page of a 502 from a proxy)
+    # is returned as a retryable status with an error body instead of raising
+    api_url = f"{SOLAR_API_URL}?location.latitude={latitude}&location.longitude={longitude}&requiredQuality=HIGH&key=" + api_key
+    try:
+        response = (session or requests).get(api_url, timeout=timeout)
+    except (requests.Timeout, requests.ConnectionError) as e:
+        return NO_RESPONSE_STATUS, {"error": {"message": repr(e)}}
+    try:
+        return response.status_code, response.json()
+    except ValueError:
+        status_code = response.status_code if response.status_code in RETRYABLE_STATUS_CODES else 502
+        return status_code, {"error": {"message": f"HTTP {response.status_code}, not JSON: {response.text[:200]}"}}
+
+
+def load_api_keys(path=API_KEYS_FILE):
+    try:
+        with open(path, "r") as file:
+            return [line.strip() for line in file if line.strip() and not line.strip().startswith("#")]
+    except FileNotFoundError:
+        return []
+
+
+def solar_fetch_worker(worker_id, api_key, requests_per_minute, task_queue, result_queue):
+    # runs in its own process with its own key, session and rate budget
+    # messages sent back, all starting with (kind, worker_id, shard_id):
+    #   ("started", ...)                                         a shard was taken from the queue
+    #   ("result", ..., location_id, status_code, json, calls, seconds)
+    #                                                            one answer, calls includes the retries
+    #   ("shard_done", ...)                                      every location of the shard was answered
+    #   ("exhausted", ..., status_code, calls)                   the key got a 403 or too many retryable answers
+    #                                                            (429, 5xx, timeouts), the worker exits
+    #   ("failed", ..., error)                                   unexpected error, the worker exits
+    rate_limiter = TokenBucket(requests_per_minute)
+    session = requests.Session()
+    shard_id = None
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                return
+            shard_id, locations = task
+            result_queue.put(("started", worker_id, shard_id))
+            for location_id, latitude, longitude in locations:
+                calls = 0
+                rate_limited = 0
+                seconds = 0.0
+                while True:
+                    rate_limiter.acquire()
+                    request_start = time.perf_counter()
+                    status_code, solar_data = request_solar_data(api_key, latitude, longitude, session)
+                    seconds += time.perf_counter() - request_start
+                    calls += 1
+                    if status_code not in RETRYABLE_STATUS_CODES:
+                        break
+                    rate_limited += 1
+                    if rate_limited >= MAX_RATE_LIMITED:
+                        break
+                    rate_limiter.pause(RATE_LIMIT_PAUSE_SECONDS if status_code == 429 else SERVER_ERROR_PAUSE_SECONDS)
+                if status_code in UNANSWERED_STATUS_CODES:
+                    # the location is not reported, the coordinator hands it to another key
+                    result_queue.put(("exhausted", worker_id, shard_id, status_code, calls))
+                    return
+                result_queue.put(("result", worker_id, shard_id, location_id, status_code, solar_data, calls, seconds))
+            result_queue.put(("shard_done", worker_id, shard_id))
+            shard_id = None
+    except Exception as e:
+        result_queue.put(("failed", worker_id, shard_id, repr(e)))
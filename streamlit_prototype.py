@@ -1,9 +1,16 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
+import html
+import json
+import time
 import folium
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import st_folium
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
+import dashboard_queries
+import db_connection
+import exports
+import site_ranking
 
 # set the page config for a wide layout and title
 st.set_page_config(layout="wide")
@@ -19,153 +26,249 @@ st.markdown("""
         </style>
         """, unsafe_allow_html=True)
 
-# Data loading function with caching for performance.
+# maximum number of points drawn on the map, the rest are still in the grid and the export.
+MAX_MAP_POINTS = 20000
+
+# fields shown in the map popups, they are sent as a compact array next to the coordinates.
+MAP_POPUP_COLUMNS = [
+    'Full Address', 'City', 'Property Code', 'Disadvantaged Flag',
+    'Yearly Energy DC (kWh)', 'Max Array Panels Count', 'Estimated Houses Powered'
+]
+
+# leaflet callback that turns one [lat, lon, *MAP_POPUP_COLUMNS] row into a marker,
+# the popup HTML is only built when the marker is clicked.
+MAP_MARKER_CALLBACK = """
+function (row) {
+    var labels = %s;
+    var escape = function (value) {
+        return String(value).replace(/[&<>"]/g, function (c) {
+            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c];
+        });
+    };
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(function () {
+        var popup = '';
+        for (var i = 0; i < labels.length; i++) {
+            popup += '<b>' + labels[i] + ':</b> ' + escape(row[i + 2]) + '<br>';
+        }
+        popup += '<a href="https://www.google.com/maps/search/?api=1&query=' + row[0] + ',' + row[1]
+            + '" target="_blank">View on Google Maps</a><br>';
+        return popup;
+    }, {minWidth: 300, maxWidth: 500});
+    return marker;
+}
+""" % json.dumps(MAP_POPUP_COLUMNS)
+
+# number of rows per grid page, pages are fetched from SQL one at a time.
+PAGE_SIZE = 500
+
+# database file and columnar snapshot written by solar_database_current.py.
+DB_PATH = 'community_solar.db'
+SNAPSHOT_PATH = 'dashboard_snapshot.arrow'
+
+
+# read-only connections shared by every session and rerun instead of opening one per query.
+# the database is in WAL mode, so these reads do not wait for a running solar fetch to commit.
+@st.cache_resource
+def get_reader_pool():
+    return db_connection.ConnectionPool(DB_PATH, role="reader")
+
+
+def get_dashboard_version():
+    # cheap single row read on every rerun, a new version invalidates the cached data below
+    with get_reader_pool().connection() as conn:
+        return dashboard_queries.get_dashboard_version(conn)
+
+
+# the snapshot is memory-mapped once per process and version and shared by all sessions,
+# cache_resource keeps it as is instead of pickling a copy per call like cache_data.
+# a missing snapshot raises so it is not cached: the app can read a new version before the
+# writer has renamed its snapshot into place, and has to look for the file again on the next rerun.
+@st.cache_resource(max_entries=1)
+def load_cached_snapshot(version):
+    snapshot = dashboard_queries.open_dashboard_snapshot(SNAPSHOT_PATH, version)
+    if snapshot is None:
+        raise FileNotFoundError(f"no snapshot of dashboard version {version} in {SNAPSHOT_PATH}")
+    return snapshot
+
+
+def load_snapshot(version):
+    # the snapshot of this version, or None while it is not written yet, the callers then use SQL
+    try:
+        return load_cached_snapshot(version)
+    except FileNotFoundError:
+        return None
+
+
+# Data loading functions with caching for performance.
+# Every query is filtered by the snapshot or in SQL, so the app only holds the rows of the current selection.
+# the SQL queries are the fallback when the snapshot is missing or older than the database.
+@st.cache_data
+def load_filter_options(version):
+    with get_reader_pool().connection() as conn:
+        return dashboard_queries.get_filter_options(conn)
+
+
+@st.cache_data
+def count_rows(version, cities, codes, flags):
+    snapshot = load_snapshot(version)
+    if snapshot is not None:
+        return dashboard_queries.count_snapshot_rows(snapshot, cities, codes, flags)
+    with get_reader_pool().connection() as conn:
+        return dashboard_queries.count_dashboard_rows(conn, cities, codes, flags)
+
+
+@st.cache_data
+def load_page(version, cities, codes, flags, after_location_id):
+    snapshot = load_snapshot(version)
+    if snapshot is not None:
+        df = dashboard_queries.fetch_snapshot_page(snapshot, cities, codes, flags, after_location_id, PAGE_SIZE)
+    else:
+        with get_reader_pool().connection() as conn:
+            df = dashboard_queries.fetch_dashboard_page(conn, cities, codes, flags, after_location_id, PAGE_SIZE)
+    return dashboard_queries.prepare_dashboard_frame(df)
+
+
+# the map points are the largest frame. cache_resource hands every session the same read-only
+# frame instead of unpickling a copy on each rerun like cache_data, the app never changes it in
+# place. max_entries bounds how many selections a replica keeps in memory.
+@st.cache_resource(max_entries=32)
+def load_map_points(version, cities, codes, flags):
+    snapshot = load_snapshot(version)
+    if snapshot is not None:
+        df = dashboard_queries.fetch_snapshot_map_points(snapshot, cities, codes, flags, MAX_MAP_POINTS)
+    else:
+        with get_reader_pool().connection() as conn:
+            df = dashboard_queries.fetch_map_points(conn, cities, codes, flags, MAX_MAP_POINTS)
+    return dashboard_queries.prepare_dashboard_frame(df)
+
+
+# exports are written from SQL in chunks on a background thread when someone asks for one, and kept
+# on disk per selection and data version, shared by every session.
+@st.cache_resource
+def get_export_cache():
+    return exports.ExportCache()
+
+
+@st.fragment
+def export_section(filters):
+    # only this part of the page reruns while an export is being prepared
+    format_col, action_col = st.columns([1, 3])
+    with format_col:
+        export_format = st.selectbox("Export format", list(exports.EXPORT_FORMATS), format_func=str.upper)
+    export_cache = get_export_cache()
+    path = export_cache.get(export_format, *filters)
+    with action_col:
+        if path is not None:
+            mime, extension = exports.EXPORT_FORMATS[export_format]
+            with open(path, 'rb') as file:
+                st.download_button(
+                    label=f"Download filtered data as {export_format.upper()}",
+                    data=file,
+                    file_name=f'filtered_solar_locations.{extension}',
+                    mime=mime
+                )
+            return
+        pending = export_cache.pending_export(export_format, *filters)
+        if pending is not None and not pending.done():
+            st.caption("Preparing the export, the rest of the page can still be used.")
+            time.sleep(1)
+            st.rerun(scope="fragment")
+        if pending is not None and pending.exception() is not None:
+            st.error(f"The export failed: {pending.exception()}")
+        if st.button(f"Prepare {export_format.upper()} export"):
+            export_cache.request(get_reader_pool().connection, export_format, *filters)
+            st.rerun(scope="fragment")
+
+
+def get_ranking_version():
+    with get_reader_pool().connection() as conn:
+        return site_ranking.get_ranking_version(conn)
+
+
+# the leaderboards are precomputed, so these only read up to LEADERBOARD_SIZE rows of one region.
+# solar updates move the dashboard version and a rebuild with other weights the ranking version.
 @st.cache_data
-def load_data():
-    # Connect to the SQLite database and load the data into a DataFrame.
-    conn = sqlite3.connect('community_solar.db')
-    query = """
-    SELECT 
-        LOCATIONS.location_id,
-        LOCATIONS.latitude,
-        LOCATIONS.longitude,
-        LOCATIONS.dlgf_prop_class_code,
-        LOCATIONS.geofulladdress,
-        LOCATIONS.geocity,
-        LOCATIONS.geozip,
-        GOOGLE_SOLAR.imagery_quality,
-        GOOGLE_SOLAR.imagery_date,
-        GOOGLE_SOLAR.max_array_panels_count,
-        GOOGLE_SOLAR.panel_capacity_watts,
-        GOOGLE_SOLAR.nominal_power_watts,
-        GOOGLE_SOLAR.yearly_energy_dc_kwh,
-        GOOGLE_SOLAR.carbon_offset_factor_kg_per_mwh,
-        GOOGLE_SOLAR.estimated_annual_co2_savings_tons,
-        GOOGLE_SOLAR.estimated_houses_powered,
-        PROPERTY_CODES.description AS property_code_description,
-        CASE CEJST.identified_as_disadvantaged
-            WHEN 1 THEN 'yes'
-            ELSE 'no'
-        END AS identified_as_disadvantaged
-    FROM 
-        LOCATIONS
-    INNER JOIN 
-        GOOGLE_SOLAR
-    ON
-        GOOGLE_SOLAR.location_id = LOCATIONS.location_id 
-    INNER JOIN 
-        PROPERTY_CODES
-    ON
-        LOCATIONS.dlgf_prop_class_code = PROPERTY_CODES.property_code
-    LEFT JOIN
-        CEJST
-    ON
-        SUBSTR(LOCATIONS.geobg10, 1, 11) = CEJST.census_tract_2010_ID
-    WHERE 
-        LOCATIONS.dlgf_prop_class_code LIKE '6%%'
-    """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-
-    # add a new column for the age of solar imagery in years
-    df['age_of_solar_imagery(years)'] = pd.to_datetime('now').year - pd.to_datetime(df['imagery_date']).dt.year
-
-    # convert the imagery quality to a string and replace spaces with underscores
-    df['imagery_quality'] = df['imagery_quality'].astype(str).str.replace(' ', '_').str.lower()
-    
-    # convert the property code to numeric, coercing errors to NaN
-    df['dlgf_prop_class_code'] = pd.to_numeric(df['dlgf_prop_class_code'], errors='coerce')
-
-    # create a google maps link for each location
-    df['Google Maps Link'] = df.apply(lambda row: f'https://www.google.com/maps/search/?api=1&query={row["latitude"]},{row["longitude"]}', axis=1)
-    # ensure it's a string for HTML rendering.
-    df['Google Maps Link'] = df['Google Maps Link'].astype(str)  
-
-    # columns to drop
-    columns_to_drop = ['imagery_quality', 'imagery_date', 'location_id']
-    # drop the columns
-    df.drop(columns=columns_to_drop, inplace=True, errors='ignore')
-
-    # rename columns for better readability
-    df.rename(columns={
-        'geofulladdress': 'Full Address',
-        'geocity': 'City',
-        'geozip': 'Zip Code',
-        'dlgf_prop_class_code': 'Property Code',
-        'age_of_solar_imagery(years)': 'Age of Solar Imagery (years)',
-        'Google Maps Link': 'Google Maps Link',
-        'max_array_panels_count': 'Max Array Panels Count',
-        'panel_capacity_watts': 'Panel Capacity (Watts)',
-        'nominal_power_watts': 'Nominal Power (Watts)',
-        'yearly_energy_dc_kwh': 'Yearly Energy DC (kWh)',
-        'carbon_offset_factor_kg_per_mwh': 'Carbon Offset Factor (kg/MWh)',
-        'estimated_annual_co2_savings_tons': 'Estimated Annual CO2 Savings (tons)',
-        'estimated_houses_powered': 'Estimated Houses Powered',
-        'property_code_description': 'Property Code Description',
-        'identified_as_disadvantaged': 'Disadvantaged Flag',
-        'latitude': 'Latitude',
-        'longitude': 'Longitude'
-    }, inplace=True)
-
-    # reorder columns for better readability
-    column_order = [
-        'Full Address', 'City', 'Zip Code', 'Property Code', 'Disadvantaged Flag',
-        'Max Array Panels Count', 'Panel Capacity (Watts)', 'Nominal Power (Watts)',
-        'Yearly Energy DC (kWh)', 'Carbon Offset Factor (kg/MWh)',
-        'Estimated Annual CO2 Savings (tons)', 'Estimated Houses Powered',
-        'Age of Solar Imagery (years)', 'Property Code Description', 'Latitude', 'Longitude', 'Google Maps Link'
-    ]
-    # reorder the df
-    df = df[column_order]
-
-    return df
-
-# Load the data.
-df = load_data()
+def load_leaderboard_regions(version, ranking_version, region_type):
+    with get_reader_pool().connection() as conn:
+        return site_ranking.fetch_leaderboard_regions(conn, region_type)
 
 
+@st.cache_data
+def load_solar_summary(version, group_by, flags, code_range):
+    # grouped from the SOLAR_ROLLUP table, so a statewide summary reads groups instead of locations
+    with get_reader_pool().connection() as conn:
+        df = dashboard_queries.fetch_solar_summary(conn, group_by, flags=flags, code_range=code_range)
+    return df.rename(columns=dashboard_queries.SUMMARY_DISPLAY_NAMES)
+
+
+@st.cache_data
+def load_top_sites(version, ranking_version, region_type, region, n):
+    with get_reader_pool().connection() as conn:
+        return site_ranking.fetch_top_sites(conn, region_type, region, n)
 
 
+# Load the filter values.
+data_version = get_dashboard_version()
+cities, codes, disadvantaged = load_filter_options(data_version)
+
 # create three columns for the filters.
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    cities = sorted(df['City'].unique())
     # no default selection
     selected_cities = st.multiselect("Select City(s)", cities)
 
 with col2:
-    # get unique property codes and descriptions combine into a single string
-    property_code_descriptions = (df['Property Code'].astype(str) + " - " + df['Property Code Description'].astype(str))
-    codes = sorted(property_code_descriptions.unique())
+    # combine the property codes and descriptions into a single string
+    code_labels = {f"{code} - {description}": code for code, description in codes}
     # no default selection
-    selected_codes = st.multiselect("Select Property Code(s)", codes)
+    selected_codes = st.multiselect("Select Property Code(s)", list(code_labels))
 
 with col3:
-    disadvantaged = sorted(df['Disadvantaged Flag'].unique())
     # no default selection
     selected_disadvantaged = st.multiselect("Select Disadvantaged Flag", disadvantaged)
 
 # only filter and render data if all filters have a selection.
 if selected_cities and selected_codes and selected_disadvantaged:
-    # remove the description part from the selected codes for filtering.
-    selected_codes = [int(code.split("-")[0]) for code in selected_codes]
-    print(selected_codes)
-    # filter the dataframe based on the selected filters.
-    filtered_df = df[df['City'].isin(selected_cities) & df['Property Code'].isin(selected_codes) & df['Disadvantaged Flag'].isin(selected_disadvantaged)]
-    # error handling for empty dataframe.
-    if filtered_df.empty:
+    # the data version and the filters are passed as tuples so they can be cache keys.
+    filters = (
+        data_version,
+        tuple(selected_cities),
+        tuple(code_labels[code] for code in selected_codes),
+        tuple(selected_disadvantaged),
+    )
+    total_rows = count_rows(*filters)
+    # error handling for empty selection.
+    if total_rows == 0:
         st.warning("⚠️ No data found for the selected filter combination. Please try different selections.")
     else:
-        # convert filtered dataframe to CSV.
-        csv = filtered_df.to_csv(index=False).encode('utf-8')
-        # create a download button for the CSV file.
-        st.download_button(
-            label="Export filtered data as CSV",
-            data=csv,
-            file_name='filtered_solar_locations.csv',
-            mime='text/csv'
-        )
+        # nothing is serialized on a rerun, the export is only written when it is asked for.
+        export_section(filters)
+
+        # keyset pagination: remember the last location_id of every page we moved past,
+        # and start over when the user's selections change. the data version is left out,
+        # a backfill bumps it on every commit and must not send the user back to page 1.
+        selections = filters[1:]
+        if st.session_state.get('page_filters') != selections:
+            st.session_state['page_filters'] = selections
+            st.session_state['page_cursors'] = [0]
+        page_cursors = st.session_state['page_cursors']
+        filtered_df = load_page(*filters, page_cursors[-1])
+
+        page_number = len(page_cursors)
+        page_count = -(-total_rows // PAGE_SIZE)
+        prev_col, info_col, next_col = st.columns([1, 4, 1])
+        with prev_col:
+            if st.button("Previous page", disabled=page_number == 1):
+                page_cursors.pop()
+                st.rerun()
+        with info_col:
+            st.caption(f"Page {page_number} of {page_count} ({total_rows:,} locations)")
+        with next_col:
+            if st.button("Next page", disabled=page_number >= page_count):
+                page_cursors.append(int(filtered_df.index[-1]))
+                st.rerun()
 
         # interactive Data Preview using AgGrid 
         st.subheader("Data: (Click a row to show it on the map)")
@@ -173,7 +276,12 @@ if selected_cities and selected_codes and selected_disadvantaged:
 
         # configure AgGrid to allow single row selection.
         gb.configure_selection(selection_mode="single", use_checkbox=False)
-        gb.configure_pagination(paginationAutoPageSize=True)  # Enable pagination
+        gb.configure_pagination(paginationAutoPageSize=True)  # Enable client-side pagination within the page
+        # the maps link is computed by the grid from the row's coordinates instead of being sent per row.
+        gb.configure_column(
+            dashboard_queries.MAPS_LINK_COLUMN,
+            valueGetter=f"'{dashboard_queries.MAPS_SEARCH_URL}' + data.Latitude + ',' + data.Longitude",
+        )
         
         # configure columns to be sortable and filterable.
         gridOptions = gb.build()
@@ -207,14 +315,13 @@ if selected_cities and selected_codes and selected_disadvantaged:
         lat_col = 'Latitude'
         lon_col = 'Longitude'
 
-        if lat_col in filtered_df.columns and lon_col in filtered_df.columns:
-            # remove rows with missing coordinates and convert to float.
-            filtered_df = filtered_df.dropna(subset=[lat_col, lon_col])
-            filtered_df[lat_col] = filtered_df[lat_col].astype(float)
-            filtered_df[lon_col] = filtered_df[lon_col].astype(float)
+        # the map points are queried separately from the grid page, rows without coordinates
+        # are already dropped in SQL.
+        map_df = load_map_points(*filters)
 
+        if not map_df.empty:
             # set default map center to the average of available points.
-            default_center = [filtered_df[lat_col].mean(), filtered_df[lon_col].mean()]
+            default_center = [map_df[lat_col].mean(), map_df[lon_col].mean()]
 
             # if a row was selected, update the map center.
             if selected_location is not None:
@@ -223,36 +330,84 @@ if selected_cities and selected_codes and selected_disadvantaged:
             # create a folium map centered at the default location.
             m = folium.Map(location=default_center, zoom_start=12)
             
-            # add markers to the map.
-            for idx, row in filtered_df.iterrows():
-                # use a different marker color for the selected row.
-                if selected_location is not None and row[lat_col] == selected_location[lat_col] and row[lon_col] == selected_location[lon_col]:
-                    popup_html = "<b>Selected Location</b><br>"
-                    for col in filtered_df.columns:
-                        if col == "Google Maps Link":
-                            popup_html += f'<a href="{row[col]}" target="_blank">View on Google Maps</a><br>'
-                        else:
-                            popup_html += f"<b>{col}:</b> {row[col]}<br>"
-                    folium.Marker(
-                        location=[row[lat_col], row[lon_col]],
-                        popup = folium.Popup(popup_html, min_width=300, max_width=500),
-                        icon=folium.Icon(color='red')
-                    ).add_to(m)
-                else:
-                    popup_html = ""
-                    for col in filtered_df.columns:
-                        if col == "Google Maps Link":
-                            popup_html += f'<a href="{row[col]}" target="_blank">View on Google Maps</a><br>'
-                        else:
-                            popup_html += f"<b>{col}:</b> {row[col]}<br>"
-                    folium.Marker(
-                        location=[row[lat_col], row[lon_col]],
-                        popup=folium.Popup(popup_html, min_width=300, max_width=500),
-                        icon=folium.Icon(color='blue')
-                    ).add_to(m)
-
-                    
-            # render the map.
-            st_folium(m, width=1920, height=1000)
+            # add all points as one clustered layer. only a compact array of a few fields per point
+            # is sent to the browser and each popup is built client-side when its marker is clicked,
+            # so the page size and render time do not grow with one HTML popup per row.
+            if total_rows > len(map_df):
+                st.caption(f"Showing the {len(map_df):,} locations with the highest yearly energy out of {total_rows:,}.")
+            map_data = map_df[[lat_col, lon_col] + MAP_POPUP_COLUMNS]
+            # missing values become null instead of NaN, which is not valid JSON.
+            map_data = map_data.astype(object).where(map_data.notna(), None)
+            FastMarkerCluster(
+                map_data.values.tolist(),
+                callback=MAP_MARKER_CALLBACK,
+            ).add_to(m)
+
+            # highlight the selected row with its own marker and a full popup.
+            if selected_location is not None:
+                popup_html = "<b>Selected Location</b><br>"
+                for col in filtered_df.columns:
+                    popup_html += f"<b>{col}:</b> {html.escape(str(selected_location[col]))}<br>"
+                maps_link = dashboard_queries.google_maps_link(selected_location[lat_col], selected_location[lon_col])
+                popup_html += f'<a href="{maps_link}" target="_blank">View on Google Maps</a><br>'
+                folium.Marker(
+                    location=[selected_location[lat_col], selected_location[lon_col]],
+                    popup=folium.Popup(popup_html, min_width=300, max_width=500),
+                    icon=folium.Icon(color='red')
+                ).add_to(m)
+
+            # render the map, map interactions do not need to rerun the script.
+            st_folium(m, width=1920, height=1000, returned_objects=[])
 else:
     st.info("Please select all filters to display data.")
+
+# totals and means per county, city, property code or disadvantaged flag, independent of the filters above.
+with st.expander("Summary"):
+    sum_col1, sum_col2, sum_col3 = st.columns([3, 2, 2])
+    with sum_col1:
+        summary_group_by = st.multiselect(
+            "Group by", list(dashboard_queries.ROLLUP_DIMENSIONS), default=["county"],
+            format_func=lambda name: dashboard_queries.SUMMARY_DISPLAY_NAMES[name],
+        )
+    with sum_col2:
+        summary_flags = st.multiselect("Disadvantaged Flag", ["yes", "no"])
+    with sum_col3:
+        summary_codes = st.slider("Property Codes", 100, 899, (600, 699))
+    try:
+        summary = load_solar_summary(data_version, tuple(summary_group_by), tuple(summary_flags), summary_codes)
+    except pd.errors.DatabaseError:
+        # databases built before the rollup existed
+        summary = None
+        st.info("The solar summary is not built yet, run build_solar_rollup() in solar_database_current.py.")
+    if summary is not None:
+        st.dataframe(summary, hide_index=True, use_container_width=True)
+        st.download_button(
+            label="Export summary as CSV",
+            data=summary.to_csv(index=False).encode('utf-8'),
+            file_name='solar_summary.csv',
+            mime='text/csv'
+        )
+
+# best sites of the state or of one county, city or property class, independent of the filters above.
+ranking_version = get_ranking_version()
+if ranking_version is not None:
+    with st.expander("Top sites"):
+        rank_col1, rank_col2, rank_col3 = st.columns([2, 3, 1])
+        with rank_col1:
+            region_type = st.selectbox(
+                "Rank by", list(site_ranking.LEADERBOARD_REGIONS), format_func=lambda name: name.replace('_', ' ').title()
+            )
+        with rank_col2:
+            if region_type == "state":
+                region = site_ranking.STATE_REGION
+                st.selectbox("Region", [region], disabled=True)
+            else:
+                region = st.selectbox("Region", load_leaderboard_regions(data_version, ranking_version, region_type))
+        with rank_col3:
+            top_n = st.number_input("Sites", min_value=1, max_value=site_ranking.LEADERBOARD_SIZE, value=10)
+        if region is not None:
+            st.dataframe(
+                load_top_sites(data_version, ranking_version, region_type, region, int(top_n)),
+                hide_index=True,
+                use_container_width=True,
+            )